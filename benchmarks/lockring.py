@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Microbenchmark for :class:`jukoro.structures.LockRing` comparing it to
+previous set-based implementation
+
+Emulates pool usage for two workloads:
+
+- "half" - takes half of items from ring and returns them back
+- "busy" - keeps all items but one locked and takes/returns the last one
+  (nearly exhausted pool)
+
+Run it::
+
+    $ python benchmarks/lockring.py
+
+"""
+
+from __future__ import print_function
+
+import random
+import timeit
+
+from jukoro.structures import LockRing
+
+
+SIZES = (5, 10, 50, 100, 500)
+ROUNDS = 200
+
+
+class SetLockRing(object):
+    """ Previous ``LockRing`` implementation (rescans set on ``next``) """
+
+    __slots__ = ('_store', '_locks', '_ring')
+
+    def __init__(self):
+        self._store = set()
+        self._locks = set()
+        self._ring = None
+
+    def push(self, item):
+        self._store.add(item)
+        if item in self._locks:
+            if len(self._locks) == len(self._store):
+                self._ring = None
+            self.unlock(item)
+            return True
+
+    def unlock(self, item):
+        self._locks.remove(item)
+
+    def _iter(self):
+        while self._store:
+            for item in self._store:
+                if len(self._store) == len(self._locks):
+                    raise IndexError('all locked')
+                if item not in self._locks:
+                    yield item
+
+    def next(self):
+        if not self._ring:
+            self._ring = self._iter()
+        item = next(self._ring)
+        self._locks.add(item)
+        return item
+
+
+def half(ring, size):
+    items = []
+    for __ in xrange(size // 2):
+        items.append(ring.next())
+    random.shuffle(items)
+    for item in items:
+        ring.push(item)
+    return size // 2
+
+
+def busy(ring, size):
+    for __ in xrange(size):
+        ring.push(ring.next())
+    return size
+
+
+def bench(klass, size, workload):
+    ring = klass()
+    for __ in xrange(size):
+        ring.push(object())
+    if workload is busy:
+        for __ in xrange(size - 1):
+            ring.next()
+    ops = workload(ring, size)
+    timer = timeit.Timer(lambda: workload(ring, size))
+    best = min(timer.repeat(repeat=3, number=ROUNDS))
+    # per single checkout/release pair in microseconds
+    return best / (ROUNDS * ops) * 1e6
+
+
+def main():
+    print('{:>8} {:>6} {:>14} {:>14}'.format(
+        'workload', 'size', 'set (us/op)', 'deque (us/op)'))
+    for workload in (half, busy):
+        for size in SIZES:
+            print('{:>8} {:>6} {:>14.3f} {:>14.3f}'.format(
+                workload.__name__, size,
+                bench(SetLockRing, size, workload),
+                bench(LockRing, size, workload)))
+
+
+if __name__ == '__main__':
+    main()
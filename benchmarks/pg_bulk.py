@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark for creating large number of entities using
+:meth:`jukoro.pg.AbstractEntity.bulk_create` (multirow ``INSERT`` into
+view calling trigger per entity) and
+:meth:`jukoro.pg.AbstractEntity.bulk_load` (``COPY`` into staging table and
+single ``INSERT ... SELECT``) and for updating them using
+:meth:`jukoro.pg.QueryViewBuilder.update` (``UPDATE`` of view calling
+trigger per entity) and :meth:`jukoro.pg.AbstractEntity.bulk_update`
+(set-based ``UPDATE`` and ``INSERT``)
+
+Expects PostgreSQL to be available (see README for ``PG_URI``), creates
+temporary schema and drops it afterwards
+
+Run it::
+
+    $ python benchmarks/pg_bulk.py
+    $ PG_URI="postgresql://localhost/jukoro_test" python benchmarks/pg_bulk.py
+
+"""
+
+from __future__ import print_function
+
+import os
+import time
+
+from jukoro import pg
+from jukoro.pg import storage
+from jukoro.utils import chunks
+
+
+URI = os.environ.get('PG_URI', 'postgresql://localhost/jukoro_test')
+SCHEMA = 'ju_bench_bulk'
+ROWS = 20000
+
+
+class BenchEntity(pg.AbstractEntity):
+    db_table = 'bench_bulk'
+
+    title = pg.Attr(title='Title', db_index=True, db_not_null=True)
+    amount = pg.Attr(title='Amount', value_type=int, db_not_null=True)
+
+
+def entities():
+    for idx in xrange(ROWS):
+        yield BenchEntity(doc={'title': 'entity %s' % idx, 'amount': idx})
+
+
+def live(cursor):
+    q, params = BenchEntity.qbuilder.select()
+    for row in cursor.execute(q, params).all():
+        entity = BenchEntity(**row)
+        entity.amount += 1
+        yield entity
+
+
+def update(cursor):
+    for chunk in chunks(live(cursor), pg.query.CHUNK_SIZE):
+        q, params = BenchEntity.qbuilder.update(*chunk)
+        cursor.execute(q, params)
+
+
+def bulk_update(cursor):
+    list(BenchEntity.bulk_update(cursor, live(cursor)))
+
+
+def bench(pool, method, truncate=True):
+    if truncate:
+        with pool.transaction() as cursor:
+            cursor.execute('TRUNCATE "bench_bulk";')
+    started = time.time()
+    with pool.transaction(autocommit=False) as cursor:
+        method(cursor)
+    return ROWS / (time.time() - started)
+
+
+def main():
+    uri = '%s.%s' % (URI, SCHEMA)
+    sql_create, __ = storage.syncdb(uri)
+    pool = pg.PgDbPool(uri, pool_size=1)
+    with pool.transaction() as cursor:
+        cursor.execute(sql_create)
+    try:
+        print('{:>12} {:>12}'.format('method', 'rows/s'))
+        print('{:>12} {:>12.0f}'.format('bulk_create', bench(
+            pool, lambda c: list(BenchEntity.bulk_create(c, entities())))))
+        print('{:>12} {:>12.0f}'.format('bulk_load', bench(
+            pool, lambda c: BenchEntity.bulk_load(c, entities()))))
+        print('{:>12} {:>12.0f}'.format('update', bench(
+            pool, update, truncate=False)))
+        print('{:>12} {:>12.0f}'.format('bulk_update', bench(
+            pool, bulk_update, truncate=False)))
+    finally:
+        with pool.transaction() as cursor:
+            cursor.execute('DROP SCHEMA "%s" CASCADE;' % SCHEMA)
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark for reading live entities from single table keeping all versions
+and from table keeping live versions only (``db_history = True``, closed
+versions are moved to history table) at different history depths (number
+of versions per entity), tables are compacted (``VACUUM FULL``) after
+history is grown to exclude bloat left by updates made in one transaction
+
+Expects PostgreSQL to be available (see README for ``PG_URI``), creates
+temporary schema and drops it afterwards
+
+Run it::
+
+    $ python benchmarks/pg_history.py
+    $ PG_URI="postgresql://localhost/jukoro_test" python benchmarks/pg_history.py
+
+"""
+
+from __future__ import print_function
+
+import os
+import random
+import time
+
+from jukoro import pg
+from jukoro.pg import storage
+from jukoro.pg.expr import Key
+
+
+URI = os.environ.get('PG_URI', 'postgresql://localhost/jukoro_test')
+SCHEMA = 'ju_bench_history'
+ROWS = 1000
+DEPTHS = (1, 10, 100)
+ROUNDS = 20
+
+
+class SingleEntity(pg.AbstractEntity):
+    db_table = 'bench_single'
+
+    title = pg.Attr(title='Title', db_index=True, db_not_null=True)
+    amount = pg.Attr(title='Amount', value_type=int, db_not_null=True)
+
+
+class SplitEntity(SingleEntity):
+    db_table = 'bench_split'
+    db_history = True
+
+
+def grow(cursor, klass, versions):
+    q, params = klass.qbuilder.select()
+    entities = [klass(**x) for x in cursor.execute(q, params).all()]
+    for __ in xrange(versions):
+        for entity in entities:
+            entity.amount += 1
+        entities = list(klass.bulk_update(cursor, entities))
+
+
+def timeit(pool, fn):
+    started = time.time()
+    for __ in xrange(ROUNDS):
+        with pool.transaction() as cursor:
+            fn(cursor)
+    return (time.time() - started) / ROUNDS * 1e3
+
+
+def bench(pool, klass):
+    def scan(cursor):
+        klass.count(cursor)
+
+    def lookup(cursor):
+        title = 'entity %s' % random.randint(0, ROWS - 1)
+        q, params = klass.qbuilder.select(Key('title') == title)
+        cursor.execute(q, params).all()
+
+    def by_id(cursor):
+        q, params = klass.qbuilder.by_id(*random.sample(ids, 100))
+        cursor.execute(q, params).all()
+
+    with pool.transaction() as cursor:
+        ids = [x['entity_id'] for x in cursor.execute(
+            'SELECT "entity_id" FROM "%s";' % klass.db_view.name).all()]
+    return timeit(pool, scan), timeit(pool, lookup), timeit(pool, by_id)
+
+
+def main():
+    uri = '%s.%s' % (URI, SCHEMA)
+    sql_create, __ = storage.syncdb(uri)
+    pool = pg.PgDbPool(uri, pool_size=1)
+    with pool.transaction() as cursor:
+        cursor.execute(sql_create)
+        for klass in (SingleEntity, SplitEntity):
+            klass.bulk_load(cursor, (
+                klass(doc={'title': 'entity %s' % idx, 'amount': idx})
+                for idx in xrange(ROWS)))
+    try:
+        print('{:>6} {:>8} {:>10} {:>10} {:>10}'.format(
+            'depth', 'layout', 'count, ms', 'attr, ms', 'ids, ms'))
+        depth = 1
+        for target in DEPTHS:
+            for klass in (SingleEntity, SplitEntity):
+                with pool.transaction() as cursor:
+                    grow(cursor, klass, target - depth)
+                with pool.transaction() as cursor:
+                    cursor.execute(
+                        'VACUUM FULL ANALYZE "%s";' % klass.db_table.name)
+                layout = 'split' if klass.db_history else 'single'
+                print('{:>6} {:>8} {:>10.2f} {:>10.2f} {:>10.2f}'.format(
+                    target, layout, *bench(pool, klass)))
+            depth = target
+    finally:
+        with pool.transaction() as cursor:
+            cursor.execute('DROP SCHEMA "%s" CASCADE;' % SCHEMA)
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
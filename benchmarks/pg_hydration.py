@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark for hydrating entities having wide docs eagerly (``jsonb``
+decoded while rows are fetched) and lazily (``doc`` decoded on first
+attribute access, see :meth:`jukoro.pg.PgResult.entities`) when only ids
+or some of entities are used
+
+Expects PostgreSQL to be available (see README for ``PG_URI``), creates
+temporary schema and drops it afterwards
+
+Run it::
+
+    $ python benchmarks/pg_hydration.py
+    $ PG_URI="postgresql://localhost/jukoro_test" python benchmarks/pg_hydration.py
+
+"""
+
+from __future__ import print_function
+
+import os
+import time
+
+from jukoro import pg
+from jukoro.pg import storage
+
+
+URI = os.environ.get('PG_URI', 'postgresql://localhost/jukoro_test')
+SCHEMA = 'ju_bench_hydration'
+ROWS = 5000
+ROUNDS = 10
+WIDTH = 50
+
+
+class WideEntity(pg.AbstractEntity):
+    db_table = 'bench_hydration'
+
+    title = pg.Attr(title='Title', db_not_null=True)
+    amount = pg.Attr(title='Amount', value_type=int, db_not_null=True)
+
+
+def entities():
+    for idx in xrange(ROWS):
+        doc = {'title': 'entity %s' % idx, 'amount': idx}
+        doc.update(('extra%s' % x, 'value %s %s' % (x, idx) * 3)
+                   for x in xrange(WIDTH))
+        yield WideEntity(doc=doc)
+
+
+def bench(pool, lazy, every):
+    q, params = WideEntity.qbuilder.select()
+    started = time.time()
+    for __ in xrange(ROUNDS):
+        with pool.transaction() as cursor:
+            res = cursor.execute(q, params)
+            for idx, entity in enumerate(res.entities(WideEntity, lazy)):
+                entity.entity_id
+                if every and not idx % every:
+                    entity.amount
+    return (time.time() - started) / ROUNDS * 1e3
+
+
+def main():
+    uri = '%s.%s' % (URI, SCHEMA)
+    sql_create, __ = storage.syncdb(uri)
+    pool = pg.PgDbPool(uri, pool_size=1)
+    with pool.transaction() as cursor:
+        cursor.execute(sql_create)
+        WideEntity.bulk_load(cursor, entities())
+    try:
+        print('{:>12} {:>10} {:>10}'.format('used', 'eager, ms', 'lazy, ms'))
+        for title, every in (('ids only', 0), ('10% docs', 10),
+                             ('all docs', 1)):
+            print('{:>12} {:>10.1f} {:>10.1f}'.format(
+                title, bench(pool, False, every), bench(pool, True, every)))
+    finally:
+        with pool.transaction() as cursor:
+            cursor.execute('DROP SCHEMA "%s" CASCADE;' % SCHEMA)
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Microbenchmark for json codecs (:mod:`jukoro.pg.codec`) decoding and
+encoding entity-like docs of 1KB to 100KB comparing them to previous
+implementation (:func:`jukoro.json.loads` and :func:`jukoro.json.dumps`
+with :class:`~jukoro.pg.utils.PgJsonEncoder` creating decoder/encoder per
+call)
+
+Codecs having library not installed are skipped
+
+Run it::
+
+    $ python benchmarks/pg_json.py
+
+"""
+
+from __future__ import print_function
+
+import decimal
+import timeit
+
+from jukoro import json
+from jukoro.pg import codec
+from jukoro.pg.utils import PgJsonEncoder
+
+
+SIZES = (1, 10, 100)
+ROUNDS = 5
+
+
+class PreviousCodec(object):
+    """ Previous ``jsonb`` decoding/``dict`` encoding """
+
+    name = 'previous'
+
+    def loads(self, s):
+        return json.loads(s)
+
+    def dumps(self, obj):
+        return json.dumps(obj, cls=PgJsonEncoder)
+
+
+def doc(size):
+    # entity-like doc of about size KB (strings, ints, decimals, nesting)
+    res, idx = {'title': u'entity ünicode', 'amount': 42}, 0
+    while len(json.dumps(res)) < size * 1024:
+        res['attr%s' % idx] = {
+            'name': 'value %s' % idx,
+            'count': idx,
+            'price': decimal.Decimal('%s.25' % idx),
+            'tags': ['tag%s' % x for x in xrange(5)],
+            'active': bool(idx % 2),
+        }
+        idx += 1
+    return res
+
+
+def codecs():
+    res = [PreviousCodec()]
+    for name in sorted(codec.CODECS):
+        try:
+            res.append(codec.get_codec(name))
+        except ImportError:
+            continue
+    return res
+
+
+def bench(fn, arg, number):
+    timer = timeit.Timer(lambda: fn(arg))
+    best = min(timer.repeat(repeat=3, number=number))
+    # per single call in microseconds
+    return best / number * 1e6
+
+
+def main():
+    print('{:>8} {:>12} {:>14} {:>14}'.format(
+        'size, KB', 'codec', 'loads (us/op)', 'dumps (us/op)'))
+    for size in SIZES:
+        value = doc(size)
+        text = json.dumps(value, cls=PgJsonEncoder)
+        number = ROUNDS * 1000 // size
+        for c in codecs():
+            print('{:>8} {:>12} {:>14.1f} {:>14.1f}'.format(
+                size, c.name, bench(c.loads, text, number),
+                bench(c.dumps, value, number)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark for mixed read (autocommit) and write (transactional) workload
+on :class:`jukoro.pg.PgDbPool` comparing pool with free connections
+partitioned by autocommit mode to pool choosing connections in plain
+round-robin fashion
+
+Expects PostgreSQL to be available (see README for ``PG_URI``)
+
+Run it::
+
+    $ python benchmarks/pg_modes.py
+    $ PG_URI="postgresql://localhost/jukoro_test" python benchmarks/pg_modes.py
+
+"""
+
+from __future__ import print_function
+
+import os
+import time
+
+from jukoro import pg
+from jukoro.structures import LockRing
+
+
+URI = os.environ.get('PG_URI', 'postgresql://localhost/jukoro_test')
+ROUNDS = 5000
+POOL_SIZE = 4
+
+
+def workload(pool):
+    for idx in xrange(ROUNDS):
+        # two reads per write
+        autocommit = idx % 3 != 0
+        with pool.transaction(autocommit=autocommit) as cursor:
+            cursor.execute('SELECT 1;')
+
+
+def bench(partitioned):
+    pool = pg.PgDbPool(URI, pool_size=POOL_SIZE, warm_up=True)
+    if not partitioned:
+        # plain ring, connections are not partitioned by mode
+        pool._pool = LockRing()
+        pool._warmed_up = False
+        pool.warm_up()
+    workload(pool)  # warm up caches
+    before = pool.stats.mode_switches
+    started = time.time()
+    workload(pool)
+    elapsed = time.time() - started
+    switches = pool.stats.mode_switches - before
+    pool.close()
+    return elapsed / ROUNDS * 1e6, switches
+
+
+def main():
+    print('{:>12} {:>12} {:>14}'.format('pool', 'us/tx', 'mode switches'))
+    for partitioned in (False, True):
+        per_tx, switches = bench(partitioned)
+        print('{:>12} {:>12.1f} {:>14}'.format(
+            'partitioned' if partitioned else 'round-robin',
+            per_tx, switches))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark for :class:`jukoro.pg.PgDbPool` executing the same query shapes
+with and without server-side prepared statements cache
+(``statement_cache_size`` parameter)
+
+Expects PostgreSQL to be available (see README for ``PG_URI``)
+
+Run it::
+
+    $ python benchmarks/pg_prepared.py
+    $ PG_URI="postgresql://localhost/jukoro_test" python benchmarks/pg_prepared.py
+
+"""
+
+from __future__ import print_function
+
+import os
+import random
+import time
+
+from jukoro import pg
+
+
+URI = os.environ.get('PG_URI', 'postgresql://localhost/jukoro_test')
+ROUNDS = 5000
+ROWS = 10000
+
+SQL_SETUP = """
+CREATE TEMPORARY TABLE "bench" (
+    "entity_id" bigint PRIMARY KEY,
+    "doc" jsonb NOT NULL
+);
+INSERT INTO "bench"
+    SELECT x, json_build_object('a', x % 100, 'b', md5(x::text))::jsonb
+    FROM generate_series(1, {rows}) AS x;
+CREATE INDEX ON "bench" ((("doc"->>'a')::INT));
+CREATE INDEX ON "bench" USING GIN ("doc" jsonb_path_ops);
+ANALYZE "bench";
+"""
+
+# query shapes similar to ones created by QueryViewBuilder
+QUERIES = (
+    ('SELECT "entity_id","doc" FROM "bench" WHERE "entity_id" = %s '
+     'ORDER BY "entity_id" ASC;',
+     lambda: (random.randint(1, ROWS), )),
+    ('SELECT "entity_id","doc" FROM "bench" '
+     'WHERE (("doc"->>\'a\')::INT = %s AND ("doc"->>\'b\')::TEXT != %s) '
+     'ORDER BY ("doc"->>\'a\')::INT DESC LIMIT %s;',
+     lambda: [random.randint(0, 99), 'x', 5]),
+    ('SELECT "entity_id","doc" FROM "bench" WHERE ("doc" @> %s) LIMIT %s;',
+     lambda: [{'a': random.randint(0, 99)}, 1]),
+)
+
+
+def bench(statement_cache_size):
+    pool = pg.PgDbPool(URI, pool_size=1,
+                       statement_cache_size=statement_cache_size)
+    with pool.transaction() as cursor:
+        cursor.execute(SQL_SETUP.format(rows=ROWS))
+    random.seed(1)
+    res = []
+    for q, params in QUERIES:
+        started = time.time()
+        for __ in xrange(ROUNDS):
+            with pool.transaction() as cursor:
+                cursor.execute(q, params()).all()
+        res.append((time.time() - started) / ROUNDS * 1e6)
+    pool.close()
+    return res
+
+
+def main():
+    print('{:>12} {:>12} {:>12} {:>12}'.format(
+        'cache size', 'by id', 'triplets', 'contains'))
+    for size in (0, 8):
+        print('{:>12} {:>12.1f} {:>12.1f} {:>12.1f}'.format(
+            size, *bench(size)))
+    print('(microseconds per query)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark for selecting entities having wide docs with and without
+projection of selected attributes (``only`` parameter of
+:meth:`jukoro.pg.QueryViewBuilder.select`)
+
+Expects PostgreSQL to be available (see README for ``PG_URI``), creates
+temporary schema and drops it afterwards
+
+Run it::
+
+    $ python benchmarks/pg_projection.py
+    $ PG_URI="postgresql://localhost/jukoro_test" python benchmarks/pg_projection.py
+
+"""
+
+from __future__ import print_function
+
+import os
+import time
+
+from jukoro import pg
+from jukoro.pg import storage
+
+
+URI = os.environ.get('PG_URI', 'postgresql://localhost/jukoro_test')
+SCHEMA = 'ju_bench_projection'
+ROWS = 5000
+ROUNDS = 10
+WIDTH = 50
+
+
+class WideEntity(pg.AbstractEntity):
+    db_table = 'bench_projection'
+
+    title = pg.Attr(title='Title', db_not_null=True)
+    amount = pg.Attr(title='Amount', value_type=int, db_not_null=True)
+
+
+def entities():
+    for idx in xrange(ROWS):
+        doc = {'title': 'entity %s' % idx, 'amount': idx}
+        doc.update(('extra%s' % x, 'value %s %s' % (x, idx) * 3)
+                   for x in xrange(WIDTH))
+        yield WideEntity(doc=doc)
+
+
+def bench(pool, only):
+    q, params = WideEntity.qbuilder.select(only=only)
+    started = time.time()
+    for __ in xrange(ROUNDS):
+        with pool.transaction() as cursor:
+            rows = cursor.execute(q, params).all()
+            [WideEntity(**x) for x in rows]
+    return (time.time() - started) / ROUNDS * 1e3
+
+
+def main():
+    uri = '%s.%s' % (URI, SCHEMA)
+    sql_create, __ = storage.syncdb(uri)
+    pool = pg.PgDbPool(uri, pool_size=1)
+    with pool.transaction() as cursor:
+        cursor.execute(sql_create)
+        WideEntity.bulk_load(cursor, entities())
+    try:
+        print('{:>12} {:>12}'.format('projection', 'ms/query'))
+        print('{:>12} {:>12.1f}'.format('full doc', bench(pool, None)))
+        print('{:>12} {:>12.1f}'.format('2 attrs', bench(
+            pool, ['title', 'amount'])))
+    finally:
+        with pool.transaction() as cursor:
+            cursor.execute('DROP SCHEMA "%s" CASCADE;' % SCHEMA)
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark for fetching ``entity_id, doc`` rows using different row
+factories (``row_factory`` parameter of :class:`jukoro.pg.PgTransaction`):
+time to fetch all rows, peak memory while holding them and time to hydrate
+entities using :meth:`jukoro.pg.PgResult.entities`
+
+Every row factory is measured in a separate process to get its own peak
+memory (maximum resident set size growth)
+
+Expects PostgreSQL to be available (see README for ``PG_URI``), creates
+temporary schema and drops it afterwards
+
+Run it::
+
+    $ python benchmarks/pg_rows.py
+    $ ROWS=100000 PG_URI="postgresql://localhost/jukoro_test" python benchmarks/pg_rows.py
+
+"""
+
+from __future__ import print_function
+
+import multiprocessing
+import os
+import resource
+import time
+
+from jukoro import pg
+from jukoro.pg import storage
+
+
+URI = os.environ.get('PG_URI', 'postgresql://localhost/jukoro_test')
+SCHEMA = 'ju_bench_rows'
+ROWS = int(os.environ.get('ROWS', 1000000))
+FACTORIES = ('dict', 'namedtuple', 'tuple')
+
+
+class RowEntity(pg.AbstractEntity):
+    db_table = 'bench_rows'
+
+    title = pg.Attr(title='Title', db_not_null=True)
+    amount = pg.Attr(title='Amount', value_type=int, db_not_null=True)
+
+
+def entities():
+    for idx in xrange(ROWS):
+        yield RowEntity(doc={'title': 'entity %s' % idx, 'amount': idx})
+
+
+def rss():
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def bench(uri, row_factory, queue):
+    pool = pg.PgDbPool(uri, pool_size=1)
+    q, params = RowEntity.qbuilder.select()
+    try:
+        with pool.transaction(row_factory=row_factory) as cursor:
+            before = rss()
+            started = time.time()
+            rows = cursor.execute(q, params).all()
+            fetch = time.time() - started
+            memory = (rss() - before) / 1024.
+            del rows
+            started = time.time()
+            for __ in cursor.execute(q, params).entities(RowEntity):
+                pass
+            hydrate = time.time() - started
+    finally:
+        pool.close()
+    queue.put((fetch, memory, hydrate))
+
+
+def main():
+    uri = '%s.%s' % (URI, SCHEMA)
+    sql_create, __ = storage.syncdb(uri)
+    pool = pg.PgDbPool(uri, pool_size=1)
+    with pool.transaction() as cursor:
+        cursor.execute(sql_create)
+        RowEntity.bulk_load(cursor, entities())
+    pool.close()
+    try:
+        print('{} rows'.format(ROWS))
+        print('{:>12} {:>10} {:>10} {:>12}'.format(
+            'row factory', 'fetch, s', 'rss, MB', 'entities, s'))
+        for row_factory in FACTORIES:
+            queue = multiprocessing.Queue()
+            proc = multiprocessing.Process(
+                target=bench, args=(uri, row_factory, queue))
+            proc.start()
+            res = queue.get()
+            proc.join()
+            print('{:>12} {:>10.2f} {:>10.1f} {:>12.2f}'.format(
+                row_factory, *res))
+    finally:
+        pool = pg.PgDbPool(uri, pool_size=1)
+        with pool.transaction() as cursor:
+            cursor.execute('DROP SCHEMA "%s" CASCADE;' % SCHEMA)
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
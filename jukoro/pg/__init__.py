@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 """
 Experimental package to work with PostgreSQL
-(*expected PostgreSQL version >= 9.4*)
+(*expected PostgreSQL version >= 9.4*, declared indices with ``include``
+and partitioned tables require PostgreSQL >= 11)
 
 Features:
 
@@ -27,12 +28,18 @@ Features:
 
 Modules:
 
+- :mod:`jukoro.pg.aio` - non-blocking abstractions to work with
+  pool/connection/transaction/result
 - :mod:`jukoro.pg.attrs` - abstractions to describe entity attributes
+- :mod:`jukoro.pg.codec` - json codecs to decode/encode ``jsonb`` values
 - :mod:`jukoro.pg.db` - abstractions to work with
   pool/connection/transaction/result
 - :mod:`jukoro.pg.entity` - abstractions to describe entity
 - :mod:`jukoro.pg.exceptions` - package exceptions
+- :mod:`jukoro.pg.expr` - expression tree to describe query conditions
 - :mod:`jukoro.pg.introspect` - abstractions to introspect database
+- :mod:`jukoro.pg.loader` - batched loader of entities by ids with identity
+  map
 - :mod:`jukoro.pg.query` - abstraction to prepare entities-related sql
   statements to execute
 - :mod:`jukoro.pg.storage` - abstractions to prepare sql statements
@@ -58,44 +65,38 @@ from psycopg2 import (
     Error, DataError, DatabaseError, ProgrammingError, IntegrityError,
     InterfaceError, InternalError, NotSupportedError, OperationalError)
 
-from jukoro import json
-
-from jukoro.pg.attrs import Attr, AttrDescr
-from jukoro.pg.db import PgDbPool, PgConnection, PgTransaction, PgResult
+from jukoro.pg.attrs import Attr, AttrDescr, DbIndex
+from jukoro.pg.codec import JsonCodec, SimpleJsonCodec, get_codec
+from jukoro.pg.db import (
+    PgDbPool, PgRoutingPool, PgConnection, PgTransaction, PgResult)
 from jukoro.pg.entity import AbstractEntity, AbstractUser
 from jukoro.pg.exceptions import (
-    PgError, BadUri, AlreadyRegistered, PoolClosed,
-    ConnectionClosed, CursorClosed, DoesNotExist)
+    PgError, BadUri, AlreadyRegistered, PoolClosed, PoolExhausted,
+    ConnectionClosed, CursorClosed, DoesNotExist, ReadOnly)
 from jukoro.pg.introspect import inspect
-from jukoro.pg.query import QueryViewBuilder, QueryBuilderDescr
-from jukoro.pg.utils import pg_uri_to_kwargs
-
-
-class PgJsonEncoder(json.JSONEncoder):
-    """
-    PostgreSQL-focused json encoder
-
-    Custom object can be encoded using simple convention - object can have
-    ``db_val`` property or method to get it's json-compatible value
-
-    """
-    json_attr = 'db_val'
+from jukoro.pg.loader import EntityLoader
+from jukoro.pg.query import (
+    QueryViewBuilder, QueryAsOfBuilder, QueryBuilderDescr)
+from jukoro.pg.utils import pg_uri_to_kwargs, PgJsonEncoder
 
 
 class PgJson(psycopg2.extras.Json):
     """
-    Custom ``psycopg2.extras.Json`` adapter using
-    :class:`~jukoro.pg.PgJsonEncoder` to encode values
+    Custom ``psycopg2.extras.Json`` adapter using json codec of connection
+    (see :mod:`jukoro.pg.codec`) to encode values
 
     """
     def dumps(self, obj):
-        return json.dumps(obj, cls=PgJsonEncoder)
+        codec = getattr(self._conn, 'json_codec', None) or get_codec()
+        return codec.dumps(obj)
 
 
 psycopg2.extensions.register_type(psycopg2.extensions.UNICODE)
 psycopg2.extensions.register_type(psycopg2.extensions.UNICODEARRAY)
 
 psycopg2.extensions.register_adapter(dict, PgJson)
-psycopg2.extras.register_default_json(globally=True, loads=json.loads)
-psycopg2.extras.register_default_jsonb(globally=True, loads=json.loads)
+psycopg2.extras.register_default_json(globally=True,
+                                      loads=get_codec().loads)
+psycopg2.extras.register_default_jsonb(globally=True,
+                                       loads=get_codec().loads)
 psycopg2.extras.register_uuid()
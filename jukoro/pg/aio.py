@@ -0,0 +1,809 @@
+# -*- coding: utf-8 -*-
+"""
+Module to provide non-blocking counterparts of :mod:`jukoro.pg.db`
+abstractions built on top of ``psycopg2`` asynchronous connections and
+``tornado`` coroutines (requires ``tornado``, see ``aio`` extra)
+
+- :class:`AsyncPgDbPool <jukoro.pg.aio.AsyncPgDbPool>` - abstraction for a
+  pool of connections
+- :class:`AsyncPgConnection <jukoro.pg.aio.AsyncPgConnection>` -
+  abstraction for a connection
+- :class:`AsyncPgTransaction <jukoro.pg.aio.AsyncPgTransaction>` -
+  abstraction for a transaction
+- :class:`AsyncPgResult <jukoro.pg.aio.AsyncPgResult>` - abstraction for
+  results
+
+Coroutines are ``tornado.gen.coroutine`` functions returning
+``tornado.concurrent.Future`` (value is returned by raising
+``tornado.gen.Return`` in Python 2), connection waits for query to
+complete registering its socket within current ``tornado.ioloop.IOLoop``.
+
+Single thread running ``IOLoop`` can keep as many queries in flight as
+pool has connections.
+
+Usage example:
+
+.. code-block:: pycon
+
+    >>> from tornado import gen
+    >>> from tornado.ioloop import IOLoop
+    >>> from jukoro.pg import aio
+    >>> uri = 'postgresql://localhost/jukoro_test.test_schema'
+    >>> pool = aio.AsyncPgDbPool(uri, pool_size=10)
+    >>> @gen.coroutine
+    ... def get_doc(cursor, entity_id):
+    ...     doc = yield cursor.execute_and_get(
+    ...         'SELECT "doc" FROM "test_pg__live" '
+    ...         'WHERE "entity_id" = %s;', (entity_id, ))
+    ...     raise gen.Return(doc)
+    ...
+    >>> docs = IOLoop.current().run_sync(lambda: gen.multi(
+    ...     [pool.run_in_transaction(get_doc, x) for x in (1, 2, 3)]))
+    >>> pool.close()
+
+Transaction can be managed explicitly as well, it is committed on
+``close`` unless query failed or ``failed=True`` is passed (the same way
+:class:`PgTransaction <jukoro.pg.db.PgTransaction>` context manager rolls
+back on exception):
+
+.. code-block:: python
+
+    @gen.coroutine
+    def update_doc(entity_id, doc):
+        cursor = yield pool.transaction(autocommit=False)
+        try:
+            yield cursor.execute(
+                'UPDATE "test_pg__live" SET "doc" = %s '
+                'WHERE "entity_id" = %s;', (doc, entity_id))
+            validate(doc)
+        except Exception:
+            exc_info = sys.exc_info()
+            try:
+                yield cursor.close(failed=True)
+            except psycopg2.Error:
+                logger.exception('exception rolling back transaction')
+            raise exc_info[0], exc_info[1], exc_info[2]
+        yield cursor.close()
+
+"""
+
+import logging
+import sys
+import time
+import uuid
+
+import psycopg2
+import psycopg2.extras
+import psycopg2.extensions
+
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+
+from jukoro.structures import LockRing, ObjectDict
+
+from jukoro.pg.db import (
+    BLOCK_SIZE, PoolQueue, sql_logger, raise_if_cursor_closed,
+    raise_if_connection_closed, raise_if_pool_closed)
+from jukoro.pg.exceptions import PoolClosed, PoolExhausted, DoesNotExist
+from jukoro.pg.utils import pg_uri_to_kwargs
+
+
+# module level logger
+logger = logging.getLogger(__name__)
+
+
+def _ready(fd, events):
+    """
+    Returns future resolved once file descriptor becomes ready for
+    ``events`` (``IOLoop.READ`` or ``IOLoop.WRITE``) within current
+    ``IOLoop``
+
+    """
+    future = Future()
+    loop = IOLoop.current()
+
+    def handler(fd, events):
+        loop.remove_handler(fd)
+        future.set_result(events)
+
+    loop.add_handler(fd, handler, events)
+    return future
+
+
+class AsyncPgResult(object):
+    """
+    Provides coroutines to work with query results
+
+    :param trx:     instance of ``AsyncPgTransaction``
+    :param name:    name of server-side cursor (for named transaction)
+
+    """
+
+    __slots__ = ('_trx', '_name', '_closed')
+
+    def __init__(self, trx, name=None):
+        self._trx = trx
+        self._name = name
+        self._closed = False
+
+    @property
+    def is_closed(self):
+        """
+        Returns current status of the instance
+
+        """
+        return self._closed
+
+    @property
+    @raise_if_cursor_closed
+    def rowcount(self):
+        """
+        Returns `psycopg2.extensions.cursor.rowcount` read-only attribute value
+        (-1 for named transaction)
+
+        """
+        if self._name is not None:
+            return -1
+        return self._trx._cursor.rowcount
+
+    @raise_if_cursor_closed
+    @gen.coroutine
+    def get(self):
+        """
+        Coroutine to get first row from query result
+
+        :returns: fetched from db row
+        :rtype:   dict (`psycopg2.extras.RealDictCursor`)
+        :raises DoesNotExist: if query returned no results
+
+        """
+        rows = yield self.block(1)
+        if not rows:
+            raise DoesNotExist
+        raise gen.Return(rows[0])
+
+    @raise_if_cursor_closed
+    @gen.coroutine
+    def all(self):
+        """
+        Coroutine to fetch all rows
+
+        :returns: all rows fetched from db
+        :rtype:   list
+
+        """
+        if self._name is None:
+            raise gen.Return(self._trx._cursor.fetchall())
+        rows = yield self._trx._fetch(self._name)
+        raise gen.Return(rows)
+
+    @raise_if_cursor_closed
+    @gen.coroutine
+    def block(self, size=None):
+        """
+        Coroutine to fetch block of rows (empty block means no more rows)
+
+        :param size:    number of rows to fetch (defaults to transaction
+                        ``block_size``)
+        :returns:       block of rows fetched from db
+        :rtype:         list
+
+        """
+        size = size or self._trx.block_size
+        if self._name is None:
+            raise gen.Return(self._trx._cursor.fetchmany(size))
+        rows = yield self._trx._fetch(self._name, size)
+        raise gen.Return(rows)
+
+    @gen.coroutine
+    def close(self):
+        """
+        Coroutine to close results (closes server-side cursor for named
+        transaction)
+
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if self._name is not None and not self._trx._failed:
+            yield self._trx._run('CLOSE "{}";'.format(self._name))
+
+
+class AsyncPgTransaction(object):
+    """
+    Provides coroutines to work with ``psycopg2`` asynchronous cursor
+
+    :param conn:       instance of ``AsyncPgConnection``
+    :param autocommit: set autocommit mode on (True) or off (False)
+    :param named:      stream results using server-side cursor
+                       (``DECLARE``/``FETCH``)
+    :param block_size: set size of block to fetch results by
+                       (defaults to BLOCK_SIZE)
+
+    Asynchronous connection is always in autocommit mode so transaction
+    without autocommit is started explicitly (``BEGIN``) before first query
+    and is finished with ``close`` (``COMMIT`` or ``ROLLBACK`` in case
+    query failed or caller passed ``failed=True``) or with
+    ``commit``/``rollback`` coroutines (see also
+    :meth:`AsyncPgDbPool.run_in_transaction`)
+
+    NB. initializing with ``autocommit=True`` and ``named=True`` is wrong
+    because there is no autocommit mode for named cursor. ``named`` parameter
+    considered to have a higher priority.
+
+    """
+
+    __slots__ = ('_pg_conn', '_autocommit', '_named', '_cursor', '_failed',
+                 '_result', '_closed', '_queries', '_block_size', '_began')
+
+    def __init__(self, conn, autocommit=True, named=False, **kwargs):
+        if named and autocommit:
+            logger.warn(
+                'incompatible parameters "autocommit = named = True"')
+            autocommit = False
+        self._pg_conn = conn  # instance of AsyncPgConnection
+        self._autocommit = autocommit
+        self._named = named
+        self._cursor = None
+        self._failed = False
+        self._result = None
+        self._closed = False
+        self._queries = []  # list of queries performed using this instance
+        self._block_size = kwargs.get('block_size', BLOCK_SIZE)
+        self._began = False
+
+    @property
+    def block_size(self):
+        """
+        Returns size of block to fetch results by
+
+        """
+        return self._block_size
+
+    @property
+    def is_closed(self):
+        """
+        Returns current state of instance
+
+        """
+        return self._closed
+
+    @property
+    def queries(self):
+        """
+        Iterator over queries executed using this instance
+
+        """
+        for q in self._queries:
+            yield q
+
+    @gen.coroutine
+    def _run(self, query, params=None, proc=False):
+        """
+        Coroutine to execute query (or stored procedure) and wait for
+        it to complete
+
+        """
+        if self._cursor is None:
+            self._cursor = self._pg_conn.cursor()
+        fn = self._cursor.callproc if proc else self._cursor.execute
+        sql_logger.debug(
+            'executing query "%s" with "%s"', query, params or [])
+        try:
+            fn(query, params)
+            yield self._pg_conn.wait()
+        except psycopg2.Error:
+            self._failed = True
+            raise
+        self._queries.append(self._cursor.query)
+
+    @gen.coroutine
+    def _fetch(self, name, size=None):
+        """
+        Coroutine to fetch rows from server-side cursor
+
+        """
+        yield self._run('FETCH FORWARD {} FROM "{}";'.format(
+            'ALL' if size is None else int(size), name))
+        raise gen.Return(self._cursor.fetchall())
+
+    @gen.coroutine
+    def _begin(self):
+        """
+        Coroutine to start transaction if required
+
+        """
+        if not self._autocommit and not self._began:
+            yield self._run('BEGIN;')
+            self._began = True
+
+    @gen.coroutine
+    def _close_result(self):
+        """
+        Coroutine to close result if any
+
+        """
+        if self._result is not None:
+            result, self._result = self._result, None
+            yield result.close()
+
+    @raise_if_cursor_closed
+    @gen.coroutine
+    def execute(self, query, params=None):
+        """
+        Coroutine to execute query using provided parameters
+
+        :param query:   sql query to execute
+        :param params:  parameters for sql query (None or tuple)
+        :returns:       results of query
+        :rtype:         instance of ``AsyncPgResult``
+
+        """
+        yield self._begin()
+        yield self._close_result()
+        name = None
+        if self._named:
+            name = uuid.uuid4().hex
+            query = 'DECLARE "{}" NO SCROLL CURSOR FOR {}'.format(
+                name, query.rstrip().rstrip(';'))
+        yield self._run(query, params)
+        self._result = AsyncPgResult(self, name)
+        raise gen.Return(self._result)
+
+    @raise_if_cursor_closed
+    @gen.coroutine
+    def execute_and_get(self, query, params=None):
+        """
+        Coroutine to execute query using provided parameters
+        and return first row from the results
+
+        :param query:   sql query to execute
+        :param params:  parameters for sql query (None or tuple)
+        :returns:       first row from the results of the query
+        :rtype:         defaults to dict
+                        (due to ``psycopg2.extras.RealDictCursor``)
+
+        """
+        res = yield self.execute(query, params)
+        row = yield res.get()
+        raise gen.Return(row)
+
+    @raise_if_cursor_closed
+    @gen.coroutine
+    def callproc(self, procname, params=None):
+        """
+        Coroutine to execute stored procedure using provided parameters
+        (results are not streamed for named transaction)
+
+        :param procname:    stored procedure to execute
+        :param params:      parameters for procedure (None or tuple)
+        :returns:           results of stored procedure call
+        :rtype:             instance of ``AsyncPgResult``
+
+        """
+        yield self._begin()
+        yield self._close_result()
+        yield self._run(procname, params, proc=True)
+        self._result = AsyncPgResult(self)
+        raise gen.Return(self._result)
+
+    @raise_if_cursor_closed
+    @gen.coroutine
+    def commit(self):
+        """
+        Coroutine to commit transaction started
+
+        """
+        yield self._close_result()
+        if self._began:
+            self._began = False
+            yield self._run('COMMIT;')
+
+    @raise_if_cursor_closed
+    @gen.coroutine
+    def rollback(self):
+        """
+        Coroutine to rollback transaction started
+
+        """
+        self._result = None
+        if self._began:
+            self._began = False
+            yield self._run('ROLLBACK;')
+
+    @gen.coroutine
+    def close(self, failed=False):
+        """
+        Coroutine to finish transaction (commit or rollback in case query
+        failed) and return connection to pool
+
+        :param failed:  rollback transaction if True (caller failed, e.g.
+                        raised exception in between of queries)
+
+        """
+        if self._closed:
+            return
+        try:
+            if failed or self._failed:
+                yield self.rollback()
+            else:
+                yield self.commit()
+        finally:
+            if self._cursor is not None:
+                self._cursor.close()
+            self._cursor = self._result = self._queries = None
+            self._closed = True
+            self._pg_conn.reattach()
+            self._pg_conn = None
+
+
+class AsyncPgConnection(object):
+    """
+    Provides a way to work with ``psycopg2`` asynchronous connection
+
+    Session parameters (search path, time zone, etc.) are the same as for
+    :class:`PgConnection <jukoro.pg.db.PgConnection>`
+
+    :param uri:         connection string
+    :param pool:        instance of ``AsyncPgDbPool``
+    :param autoclose:   close connection on reattach if True
+                        (ignored for pooled connection)
+
+    """
+
+    __slots__ = ('_uri', '_schema', '_pg_pool', '_conn_kwargs', '_conn',
+                 '_autoclose', '_closed', '_created', '_last_used')
+
+    def __init__(self, uri, pool=None, autoclose=False):
+        self._uri = uri
+        self._pg_pool = pool
+        kwargs = pg_uri_to_kwargs(uri)
+        self._schema = kwargs.pop('schema')
+        self._conn_kwargs = kwargs
+        self._conn = None  # psycopg2.connection
+        self._autoclose = autoclose
+        self._closed = False
+        self._created = None  # timestamp connection was established at
+        self._last_used = time.time()  # timestamp of last reattach
+
+    def __repr__(self):
+        return '<AsyncPgConnection(uri="{}")> at {}'.format(
+            self._uri, hex(id(self)))
+
+    @property
+    def is_closed(self):
+        """
+        Returns current state of instance
+
+        """
+        return self._closed
+
+    @property
+    def is_connected(self):
+        """
+        Returns True if connection to PostgreSQL is established
+
+        """
+        return self._conn is not None and not self._conn.closed
+
+    @property
+    def schema(self):
+        """
+        Returns schema name specified in connection uri
+
+        """
+        return self._schema
+
+    @property
+    def age(self):
+        """
+        Returns number of seconds since connection was established
+        (0 if not established yet)
+
+        """
+        if self._created is None:
+            return 0
+        return time.time() - self._created
+
+    @property
+    def idle(self):
+        """
+        Returns number of seconds since connection was returned to pool
+
+        """
+        return time.time() - self._last_used
+
+    @raise_if_connection_closed
+    @gen.coroutine
+    def connect(self):
+        """
+        Coroutine to establish connection to PostgreSQL
+        (does nothing if connection is established)
+
+        """
+        if self.is_connected:
+            return
+        kwargs = dict(self._conn_kwargs)
+        kwargs.setdefault('cursor_factory', psycopg2.extras.RealDictCursor)
+        self._conn = psycopg2.connect(async_=1, **kwargs)
+        try:
+            yield self.wait()
+        except psycopg2.Error:
+            self._conn = None
+            raise
+        self._created = time.time()
+
+    @gen.coroutine
+    def wait(self):
+        """
+        Coroutine to wait for asynchronous operation to complete
+
+        """
+        conn = self._conn
+        while True:
+            state = conn.poll()
+            if state == psycopg2.extensions.POLL_OK:
+                return
+            elif state == psycopg2.extensions.POLL_READ:
+                yield _ready(conn.fileno(), IOLoop.READ)
+            elif state == psycopg2.extensions.POLL_WRITE:
+                yield _ready(conn.fileno(), IOLoop.WRITE)
+            else:
+                raise psycopg2.OperationalError(
+                    'unexpected poll state "%s"' % state)
+
+    @raise_if_connection_closed
+    def cursor(self):
+        """
+        Creates new cursor for connection
+
+        :returns:       cursor
+        :rtype:         ``psycopg2.extensions.cursor``
+
+        """
+        return self._conn.cursor()
+
+    def close(self):
+        """
+        Closes instance (explicit way to free resources)
+
+        """
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        self._pg_pool = None
+        self._closed = True
+
+    @raise_if_connection_closed
+    def reattach(self):
+        """
+        Reattaches connection to ``AsyncPgDbPool`` instance
+        or closes connection if ``autoclose`` was set to True
+
+        Forgets underlying connection if it was closed by server
+
+        """
+        self._last_used = time.time()
+        if self._conn is not None and self._conn.closed:
+            self._conn = None
+            self._created = None
+        if self._pg_pool is not None:
+            self._pg_pool.unlock(self)
+        elif self._autoclose:
+            self.close()
+
+    @raise_if_connection_closed
+    def transaction(self, **kwargs):
+        """
+        Starts new transaction
+
+        :params kwargs: keyword arguments to initialize
+                        transaction manager with
+        :returns:       transaction manager
+        :rtype:         instance of ``AsyncPgTransaction``
+
+        """
+        return AsyncPgTransaction(self, **kwargs)
+
+
+class AsyncPgDbPool(object):
+    """
+    Manages pool of ``AsyncPgConnection`` instances
+
+    Semantics are the same as for :class:`PgDbPool <jukoro.pg.db.PgDbPool>`
+    (pool sizing, overflow connections and queue of waiting callers are
+    shared with it, see :class:`PoolQueue <jukoro.pg.db.PoolQueue>`)
+    except callers are coroutines waiting for free connection without
+    blocking ``IOLoop`` (pool is expected to be used within single thread
+    running ``IOLoop``)
+
+    :param uri:             connection string
+    :param pool_size:       size of pool to manage
+    :param max_overflow:    maximum number of overflow connections
+                            (defaults to ``None`` meaning no limit,
+                            ``0`` disables overflow connections)
+    :param timeout:         number of seconds to wait for free connection
+                            (defaults to ``None`` meaning wait forever)
+
+    """
+
+    __slots__ = ('_uri', '_queue', '_timeout', '_stats', '_closed')
+
+    def __init__(self, uri, pool_size=5, max_overflow=None, timeout=None):
+        self._uri = uri
+        self._timeout = timeout
+        self._stats = ObjectDict(overflow_total=0, waits=0, timeouts=0)
+        self._queue = PoolQueue(LockRing(), pool_size, max_overflow,
+                                self._stats)
+        self._closed = False
+
+    @property
+    def is_closed(self):
+        """
+        Returns current state of instance
+
+        :rtype: boolean
+
+        """
+        return self._closed
+
+    @property
+    def uri(self):
+        """
+        Returns connection string
+
+        :rtype: string
+
+        """
+        return self._uri
+
+    @property
+    def stats(self):
+        """
+        Returns snapshot of pool usage statistics:
+
+        - ``size`` - current length of pool
+        - ``busy`` - number of pooled connections in use
+        - ``overflow`` - number of overflow connections in use
+        - ``overflow_total`` - number of overflow connections created
+        - ``waiting`` - number of callers waiting for connection
+        - ``waits`` - number of times callers had to wait for connection
+        - ``timeouts`` - number of times waiting for connection timed out
+
+        :rtype: :class:`~jukoro.structures.ObjectDict`
+
+        """
+        stats = self._stats.copy()
+        stats.size = len(self._queue.pool)
+        stats.busy = stats.size - self._queue.pool.available
+        stats.overflow = len(self._queue.overflow)
+        stats.waiting = len(self._queue.waiters)
+        return stats
+
+    def __repr__(self):
+        return '<AsyncPgDbPool("{}")> at {}'.format(self._uri, hex(id(self)))
+
+    def __len__(self):
+        """
+        Returns current actual length of pool
+
+        :rtype: int
+
+        """
+        return len(self._queue.pool)
+
+    def close(self):
+        """
+        Closes pool closing all connections (including overflow ones)
+        and failing callers waiting for connection
+
+        """
+        self._closed = True
+        for conn in self._queue.clear(PoolClosed('pool closed')):
+            conn.close()
+
+    @raise_if_pool_closed
+    @gen.coroutine
+    def transaction(self, **kwargs):
+        """
+        Coroutine to create new transaction selecting connection from pool
+        and establishing it
+
+        :param kwargs:  keyword arguments to initialize
+                        ``AsyncPgTransaction`` instance
+        :returns:       transaction manager instance
+        :rtype:         ``AsyncPgTransaction``
+        :raises PoolExhausted:  if no connection became available within
+                                ``timeout`` seconds
+
+        """
+        conn = yield self._get_conn()
+        try:
+            yield conn.connect()
+        except psycopg2.Error:
+            conn.reattach()
+            raise
+        raise gen.Return(conn.transaction(**kwargs))
+
+    @gen.coroutine
+    def run_in_transaction(self, fn, *args, **kwargs):
+        """
+        Coroutine to run coroutine function within new transaction
+        committing it on success and rolling it back if function raised
+        exception
+
+        :param fn:      coroutine function to call as ``fn(cursor, *args)``
+        :param args:    arguments to call ``fn`` with
+        :param kwargs:  keyword arguments to initialize
+                        ``AsyncPgTransaction`` instance
+        :returns:       value ``fn`` returned
+
+        """
+        cursor = yield self.transaction(**kwargs)
+        try:
+            res = yield fn(cursor, *args)
+        except Exception:
+            # yield clears exception being handled
+            exc_info = sys.exc_info()
+            try:
+                yield cursor.close(failed=True)
+            except psycopg2.Error:
+                # keep caller's exception if rollback failed too
+                logger.exception('exception rolling back transaction')
+            raise exc_info[0], exc_info[1], exc_info[2]
+        yield cursor.close()
+        raise gen.Return(res)
+
+    @gen.coroutine
+    def _get_conn(self):
+        """
+        Coroutine to get connection from pool growing it up to
+        ``pool_size``, creating overflow connection or waiting for
+        connection to be returned to pool otherwise
+
+        :raises PoolExhausted:  if waiting for connection timed out
+        :raises PoolClosed:     if pool was closed while waiting
+
+        """
+        conn = self._queue.get(self._pool_conn)
+        if conn is not None:
+            raise gen.Return(conn)
+        waiter = Future()
+        self._queue.wait(waiter)
+        self._stats.waits += 1
+        if self._timeout is None:
+            conn = yield waiter
+            raise gen.Return(conn)
+        try:
+            conn = yield gen.with_timeout(
+                IOLoop.current().time() + self._timeout, waiter)
+        except gen.TimeoutError:
+            if not self._queue.cancel(waiter):
+                # connection was handed over right before timeout
+                raise gen.Return(waiter.result())
+            self._stats.timeouts += 1
+            logger.error('pool exhausted, waiting for connection timed out')
+            raise PoolExhausted('pool exhausted')
+        raise gen.Return(conn)
+
+    def _pool_conn(self, overflow=False):
+        """
+        Returns new pooled connection or overflow one (to be closed on
+        return to pool)
+
+        """
+        return AsyncPgConnection(self._uri, pool=self)
+
+    @raise_if_pool_closed
+    def unlock(self, conn):
+        """
+        Unlocks connection after usage handing it to first caller waiting
+        for connection if any, otherwise returns it to pool (or closes it
+        if it is an overflow one)
+
+        :param conn:    instance of ``AsyncPgConnection`` from the pool
+
+        """
+        if self._queue.put(conn):
+            conn.close()
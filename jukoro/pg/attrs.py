@@ -64,6 +64,7 @@ In terminal:
 """
 
 import logging
+import re
 
 from itertools import count
 
@@ -72,6 +73,9 @@ from jukoro import arrow
 
 logger = logging.getLogger(__name__)
 
+#: Pattern for nested keys allowed in :class:`DbIndex` path
+PATH_KEY = re.compile(r'^[A-Za-z0-9_]+$')
+
 
 # infinite counter to keep order of attrs while iterating over them
 _counter = count()
@@ -83,7 +87,9 @@ class Attr(object):
     :class:`Entity <jukoro.pg.entity.AbstractEntity>` attribute
 
     :param db_index:    boolean (optional) indicating there must be an index
-                        for this attribute in db
+                        for this attribute in db or instance (list of
+                        instances) of :class:`~jukoro.pg.attrs.DbIndex` to
+                        declare index (indices) explicitly
     :param value_type:  Python class (optional) to declare value type,
                         defaults to ``unicode``
     :param db_not_null: boolean (optional) indicating there must be
@@ -130,6 +136,24 @@ class Attr(object):
                 self.maxlen, self.minlen, self.wrapper
             )
 
+    @property
+    def db_indices(self):
+        """
+        Returns list of indices declared for attribute (``db_index=True``
+        stands for ``DbIndex(live=False)``)
+
+        :rtype: list of :class:`~jukoro.pg.attrs.DbIndex`
+
+        """
+        idx = self.db_index
+        if not idx:
+            return []
+        if isinstance(idx, DbIndex):
+            return [idx]
+        if isinstance(idx, (list, tuple)):
+            return list(idx)
+        return [DbIndex(live=False)]
+
     @property
     def is_int(self):
         """
@@ -186,6 +210,103 @@ class Attr(object):
                                                            type(other)))
 
 
+class DbIndex(object):
+    """
+    Declaration of database index for
+    :class:`Entity <jukoro.pg.entity.AbstractEntity>` attribute
+    (see :class:`~jukoro.pg.storage.Index`)
+
+    :param live:        boolean (optional) to create partial index covering
+                        only live entities (see
+                        :data:`~jukoro.pg.storage.LIVE`), defaults to
+                        ``True``; non-live btree index includes
+                        ``entity_start`` and ``entity_end`` columns
+    :param unique:      boolean (optional) to create unique index (implies
+                        ``live`` as historical versions share values, not
+                        supported for partitioned tables)
+    :param gin:         boolean (optional) to create GIN index on
+                        ``jsonb`` attribute value instead of btree index on
+                        casted one
+    :param path:        list (optional) of nested keys within attribute
+                        value to create GIN index for (letters, digits and
+                        underscores only as keys go into index name and
+                        definition)
+    :param opclass:     string (optional) GIN operator class, one of
+                        :attr:`opclasses`, defaults to ``jsonb_path_ops``
+                        (smaller, serves ``@>`` from
+                        :meth:`Key.contains <jukoro.pg.expr.Key.contains>`
+                        only); use ``jsonb_ops`` to serve ``?`` from
+                        :meth:`Key.exists <jukoro.pg.expr.Key.exists>`
+                        too (note ``Key(attr, key).exists()`` tests
+                        ``attr`` value so index attribute itself)
+    :param include:     list (optional) of table columns to add to btree
+                        index (covering index, PostgreSQL >= 11)
+
+    """
+    __slots__ = ('live', 'unique', 'gin', 'path', 'include', 'opclass')
+
+    #: Table columns allowed for ``include``
+    columns = ('id', 'entity_id', 'entity_start', 'entity_end')
+
+    #: GIN operator classes allowed for ``opclass``
+    opclasses = ('jsonb_path_ops', 'jsonb_ops')
+
+    def __init__(self, live=True, unique=False, gin=False, path=None,
+                 include=None, opclass=None):
+        if unique and not live:
+            raise ValueError('Unique index must be live')
+        if gin and (unique or include):
+            raise ValueError('GIN index can not be unique or covering')
+        if path and not gin:
+            raise ValueError('Path is supported for GIN index only')
+        if path and not all(isinstance(x, basestring) and PATH_KEY.match(x)
+                            for x in path):
+            raise ValueError(
+                'Path keys must match "{}"'.format(PATH_KEY.pattern))
+        if opclass is not None and not gin:
+            raise ValueError('Operator class is supported for GIN index only')
+        if opclass is not None and opclass not in self.opclasses:
+            raise ValueError(
+                'Operator class must be one of {}'.format(self.opclasses))
+        if include and not all(x in self.columns for x in include):
+            raise ValueError(
+                'Only {} columns can be included'.format(self.columns))
+        self.live = live
+        self.unique = unique
+        self.gin = gin
+        self.path = tuple(path or ())
+        self.include = tuple(include or ())
+        self.opclass = (opclass or self.opclasses[0]) if gin else None
+
+    def __repr__(self):
+        return '<DbIndex(live={}, unique={}, gin={}, path={}, ' \
+            'include={}, opclass={})>'.format(
+                self.live, self.unique, self.gin, self.path, self.include,
+                self.opclass)
+
+    @property
+    def suffix(self):
+        """
+        Returns suffix to name index by (empty for non-live btree index)
+
+        :rtype: str
+
+        """
+        parts = list(self.path)
+        if self.gin:
+            parts.append('gin')
+            if self.opclass != self.opclasses[0]:
+                parts.append('ops')
+        if self.unique:
+            parts.append('uniq')
+        if self.live:
+            parts.append('live')
+        if self.include:
+            parts.append('incl')
+            parts.extend(self.include)
+        return '_'.join(parts)
+
+
 class AttrDescr(object):
     """
     Python descriptor
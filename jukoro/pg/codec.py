@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Provides JSON codecs to decode ``json``/``jsonb`` values fetched from
+PostgreSQL and to encode ``dict`` query parameters
+
+- :class:`~jukoro.pg.codec.JsonCodec` - standard library :mod:`json`
+  (C accelerated scanner and encoder of CPython)
+- :class:`~jukoro.pg.codec.SimpleJsonCodec` - ``simplejson`` with C
+  speedups (opt-in, ``simplejson`` decodes ASCII-only strings to ``str``
+  instead of ``unicode`` under Python 2)
+
+Codecs follow :mod:`jukoro.json` conventions: JSON numbers having fraction
+are decoded to :class:`Decimal <decimal.Decimal>`, values are encoded
+using ``db_val`` convention and registered encoders (see
+:class:`~jukoro.pg.utils.PgJsonEncoder`), non-ASCII characters are kept
+as is (documents mixing non-ASCII ``str`` and ``unicode`` values are
+encoded to ``unicode`` under Python 2).
+
+Codec is selectable per pool (``json_codec`` parameter of
+:class:`~jukoro.pg.db.PgDbPool`), lazily decoded entities docs (see
+:meth:`PgResult.entities <jukoro.pg.db.PgResult.entities>`) keep codec of
+connection they were fetched with, values encoded outside of connection
+use default codec (``json``).
+
+Example
+-------
+
+.. code-block:: python
+
+    from jukoro import pg
+
+    pool = pg.PgDbPool(uri, json_codec='simplejson')
+    with pool.transaction() as cursor:
+        cursor.json_codec
+        # <SimpleJsonCodec(name="simplejson")>
+
+"""
+
+from __future__ import absolute_import
+
+import decimal
+
+try:
+    import simplejson
+except ImportError:
+    simplejson = None
+
+from jukoro import json
+from jukoro.pg.utils import PgJsonEncoder
+
+
+class JsonCodec(object):
+    """
+    Codec built on standard library :mod:`json` reusing single decoder and
+    encoder instances
+
+    """
+    __slots__ = ('_decoder', '_encoder', '_mixed_encoder')
+
+    name = 'json'
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._encoder = PgJsonEncoder(ensure_ascii=False)
+        # encoding other than 'utf-8' (even its alias) makes encoder decode
+        # str values first (see dumps)
+        self._mixed_encoder = PgJsonEncoder(ensure_ascii=False,
+                                            encoding='utf8')
+
+    def __repr__(self):
+        return '<{}(name="{}")>'.format(type(self).__name__, self.name)
+
+    def loads(self, s):
+        """
+        Decodes JSON document
+
+        :param s:   ``str`` or ``unicode`` instance to decode JSON from
+        :returns:   Python object
+
+        """
+        return self._decoder.decode(s)
+
+    def dumps(self, obj):
+        """
+        Encodes Python object to JSON
+
+        :param obj: object to encode
+        :rtype:     ``str`` or ``unicode``
+
+        """
+        try:
+            return self._encoder.encode(obj)
+        except UnicodeDecodeError:
+            # non-ASCII str mixed with unicode can't be joined, decoding
+            # str values as UTF-8 is slower so it is done on demand only
+            return self._mixed_encoder.encode(obj)
+
+
+class SimpleJsonCodec(JsonCodec):
+    """
+    Codec built on ``simplejson`` (C speedups are used if compiled)
+
+    :raises ImportError:    if ``simplejson`` is not installed
+
+    """
+    __slots__ = ()
+
+    name = 'simplejson'
+
+    def __init__(self):
+        if simplejson is None:
+            raise ImportError('simplejson is not installed')
+        # Decimal is passed to PgJsonEncoder.default (encoded as float),
+        # namedtuple is encoded as array the same way json does
+        self._decoder = simplejson.JSONDecoder(parse_float=decimal.Decimal)
+        self._encoder = simplejson.JSONEncoder(
+            ensure_ascii=False, use_decimal=False, namedtuple_as_object=False,
+            default=PgJsonEncoder().default)
+        # simplejson decodes non-ASCII str values as UTF-8 itself
+        self._mixed_encoder = self._encoder
+
+
+class RawJson(object):
+    """
+    Keeps ``json``/``jsonb`` text fetched from db along with codec to
+    decode it with later (see :meth:`PgResult.entities
+    <jukoro.pg.db.PgResult.entities>`)
+
+    :param value:   ``json`` text
+    :param codec:   codec instance
+
+    """
+    __slots__ = ('value', 'codec')
+
+    def __init__(self, value, codec):
+        self.value = value
+        self.codec = codec
+
+    def __repr__(self):
+        return '<{}({!r})>'.format(type(self).__name__, self.codec)
+
+    def decode(self):
+        """
+        Decodes kept ``json`` text using kept codec
+
+        :returns:   Python object
+
+        """
+        return self.codec.loads(self.value)
+
+
+# registered codecs by name
+CODECS = {
+    JsonCodec.name: JsonCodec,
+    SimpleJsonCodec.name: SimpleJsonCodec,
+}
+
+# codec instances by name
+_codecs = {}
+
+
+def get_codec(codec=None):
+    """
+    Returns codec instance
+
+    :param codec:       codec name (see ``CODECS``), codec instance or
+                        ``None`` for default codec (``json``)
+    :returns:           codec instance
+    :rtype:             :class:`~jukoro.pg.codec.JsonCodec`
+    :raises ValueError: if codec is unknown
+    :raises ImportError:    if codec library is not installed
+
+    """
+    if codec is None:
+        codec = JsonCodec.name
+    if not isinstance(codec, basestring):
+        return codec
+    if codec not in _codecs:
+        if codec not in CODECS:
+            raise ValueError('Unknown json codec "{}"'.format(codec))
+        _codecs[codec] = CODECS[codec]()
+    return _codecs[codec]
@@ -5,6 +5,8 @@ Module to provide abstractions to work with PostgreSQL built on top of
 
 - :class:`PgDbPool <jukoro.pg.db.PgDbPool>` - abstraction for a pool of
   connections
+- :class:`PgRoutingPool <jukoro.pg.db.PgRoutingPool>` - abstraction for a
+  pool of connections to primary server and its read-only replicas
 - :class:`PgConnection <jukoro.pg.db.PgConnection>` - abstraction for a
   connection
 - :class:`PgTransaction <jukoro.pg.db.PgTransaction>` - abstraction for a
@@ -14,19 +16,28 @@ Module to provide abstractions to work with PostgreSQL built on top of
 
 """
 
+import collections
+import decimal
+import functools
+import itertools
 import logging
+import re
 import threading
+import time
 import uuid
 
+from multiprocessing.pool import ThreadPool
+
 import psycopg2
 import psycopg2.extras
 import psycopg2.extensions
 
 from jukoro.decorators import raise_if
-from jukoro.structures import LockRing
+from jukoro.structures import LockRing, ObjectDict
 
+from jukoro.pg.codec import RawJson, get_codec
 from jukoro.pg.exceptions import (
-    PoolClosed, ConnectionClosed, CursorClosed, DoesNotExist)
+    PoolClosed, PoolExhausted, ConnectionClosed, CursorClosed, DoesNotExist)
 from jukoro.pg.utils import pg_uri_to_kwargs
 
 
@@ -38,6 +49,63 @@ logger = logging.getLogger(__name__)
 # sql queries logger
 sql_logger = logging.getLogger('jukoro.pg.sql')
 
+# statements PostgreSQL is able to prepare
+PREPARABLE = re.compile(r'^\s*(SELECT|INSERT|UPDATE|DELETE|VALUES|WITH)\b',
+                        re.IGNORECASE)
+# query placeholders ("%s") and escaped percent signs ("%%")
+PLACEHOLDERS = re.compile(r'%(.)', re.DOTALL)
+# name of statement cache entry for queries which can't be prepared
+UNPREPARABLE = ''
+# types PostgreSQL resolves parameters of unknown type to
+UNTYPED = frozenset(['text', 'unknown'])
+# integer types (EXECUTE rounds non-integral values assigned to them)
+INTEGER_TYPES = frozenset(['smallint', 'integer', 'bigint'])
+# json and jsonb types oids
+JSON_OID = 114
+JSONB_OID = 3802
+
+
+def _cast_json(value, cursor):
+    # jsonb values are kept as text along with connection codec while
+    # cursor fetches rows for lazy entities (see PgResult.entities),
+    # decoded using connection codec otherwise
+    if value is None:
+        return value
+    codec = getattr(cursor.connection, 'json_codec', None) or get_codec()
+    if getattr(cursor, 'raw_jsonb', False):
+        return RawJson(value, codec)
+    return codec.loads(value)
+
+
+# per cursor json and jsonb typecaster
+JSON_TYPE = psycopg2.extensions.new_type((JSON_OID, JSONB_OID), 'JU_JSON',
+                                         _cast_json)
+
+
+class RawConnection(psycopg2.extensions.connection):
+    """
+    Connection keeping codec to decode and encode json values with (see
+    :mod:`jukoro.pg.codec`)
+
+    """
+    json_codec = None
+
+
+class TupleCursor(psycopg2.extensions.cursor):
+    """
+    Cursor fetching rows as plain tuples (subclassed to keep attributes
+    like ``raw_jsonb`` flag, see :meth:`PgResult.entities`)
+
+    """
+
+
+# cursor factories by type of fetched rows (see PgTransaction row_factory)
+ROW_FACTORIES = {
+    'dict': psycopg2.extras.RealDictCursor,
+    'namedtuple': psycopg2.extras.NamedTupleCursor,
+    'tuple': TupleCursor,
+}
+
 
 def is_closed(instance, *args, **kwargs):
     """
@@ -83,13 +151,38 @@ class PgResult(object):
         """
         return self._cursor is None
 
+    @property
+    @raise_if_cursor_closed
+    def fields(self):
+        """
+        Returns names of fields in query result
+
+        :rtype: list
+
+        """
+        return [x[0] for x in self._cursor.description or ()]
+
+    def as_dict(self, row):
+        """
+        Returns row fetched using any of row factories as dict (see
+        ``row_factory`` parameter of
+        :class:`PgTransaction <jukoro.pg.db.PgTransaction>`)
+
+        :param row: fetched from db row
+        :rtype:     dict
+
+        """
+        if row is None or isinstance(row, dict):
+            return row
+        return dict(itertools.izip(self.fields, row))
+
     @raise_if_cursor_closed
     def get(self):
         """
         Method to get first row from query result
 
         :returns: fetched from db row
-        :rtype:   dict (`psycopg2.extras.RealDictCursor`)
+        :rtype:   dict (`psycopg2.extras.RealDictCursor`) by default
         :raises DoesNotExist: if query returned no results
 
         """
@@ -98,6 +191,22 @@ class PgResult(object):
         except psycopg2.ProgrammingError:
             raise DoesNotExist
 
+    def scalar(self):
+        """
+        Method to get value of first field of first row from query result
+        (regardless of row factory)
+
+        :returns: fetched from db value
+        :raises DoesNotExist: if query returned no results
+
+        """
+        row = self.get()
+        if row is None:
+            raise DoesNotExist
+        if isinstance(row, dict):
+            return row[self.fields[0]]
+        return row[0]
+
     @raise_if_cursor_closed
     def all(self):
         """
@@ -134,6 +243,49 @@ class PgResult(object):
                 yield it
             block = self.block()
 
+    @raise_if_cursor_closed
+    def entities(self, klass, lazy=False):
+        """
+        Generator function to iterate over the rows from db yielding
+        instances of :class:`Entity <jukoro.pg.entity.AbstractEntity>`
+        (rows are expected to have ``entity_id`` and ``doc`` fields, see
+        :class:`~jukoro.pg.query.QueryViewBuilder`)
+
+        :param klass:   :class:`Entity <jukoro.pg.entity.AbstractEntity>`
+                        class
+        :param lazy:    boolean (optional) to keep ``doc`` as ``jsonb`` text
+                        and to decode it on first attribute access (using
+                        json codec of connection)
+        :yields:        ``klass`` instances
+
+        Decoding is deferred for ``jsonb`` fields of rows fetched by this
+        generator only. Rows are hydrated regardless of row factory (see
+        ``row_factory`` parameter of
+        :class:`PgTransaction <jukoro.pg.db.PgTransaction>`)
+
+        """
+        cursor, pos = self._cursor, None
+        while True:
+            cursor.raw_jsonb = lazy
+            try:
+                block = self.block()
+            finally:
+                cursor.raw_jsonb = False
+            if not block:
+                break
+            if isinstance(block[0], dict):
+                for row in block:
+                    yield klass(**row)
+                continue
+            if pos is None:
+                # named cursor has description available after fetch only
+                names = self.fields
+                pos = (names.index('entity_id'), names.index('doc'),
+                       'partial' in names)
+            id_pos, doc_pos, partial = pos
+            for row in block:
+                yield klass(row[id_pos], row[doc_pos], partial)
+
     @property
     @raise_if_cursor_closed
     def rowcount(self):
@@ -215,6 +367,10 @@ class PgTransaction(object):
     :param named:      set named cursor mode on (True) or off (False)
     :param block_size: set size of block to iterate over the results
                        (defaults to BLOCK_SIZE)
+    :param row_factory: type of fetched rows - ``dict`` (default),
+                        ``namedtuple`` or ``tuple`` (cheaper for large
+                        results, see ``ROW_FACTORIES``)
+    :raises ValueError: if ``row_factory`` is unknown
 
     NB. initializing with ``autocommit=True`` and ``named=True`` is wrong
     because there is no autocommit mode for named cursor. ``named`` parameter
@@ -223,7 +379,8 @@ class PgTransaction(object):
     """
 
     __slots__ = ('_pg_conn', '_autocommit', '_named', '_cursor', '_failed',
-                 '_result', '_closed', '_queries', '_block_size')
+                 '_result', '_closed', '_queries', '_block_size',
+                 '_row_factory')
 
     def __init__(self, conn, autocommit=True, named=False, **kwargs):
         if named and autocommit:
@@ -239,6 +396,11 @@ class PgTransaction(object):
         self._closed = False
         self._queries = []  # list of queries performed using this instance
         self._block_size = kwargs.get('block_size', BLOCK_SIZE)
+        row_factory = kwargs.get('row_factory', 'dict')
+        if row_factory not in ROW_FACTORIES:
+            raise ValueError(
+                'Unknown row factory "{}"'.format(row_factory))
+        self._row_factory = ROW_FACTORIES[row_factory]
 
     def _ensure_cursor(self):
         """
@@ -250,14 +412,12 @@ class PgTransaction(object):
         if self._cursor is not None:
             return
         # FIXME check if _pg_conn is available
-        if self._named or not self._autocommit:
-            if self._pg_conn.autocommit:
-                self._pg_conn.autocommit = False
-        else:
-            if not self._pg_conn.autocommit:
-                self._pg_conn.autocommit = True
-        self._cursor = self._pg_conn.cursor(self._named)
+        # named cursor has autocommit mode off (see __init__),
+        # connection switches mode only if it differs
+        self._pg_conn.autocommit = self._autocommit
+        self._cursor = self._pg_conn.cursor(self._named, self._row_factory)
         self._cursor.arraysize = self._block_size
+        psycopg2.extensions.register_type(JSON_TYPE, self._cursor)
         if self._named:
             self._cursor.itersize = self._block_size
 
@@ -398,6 +558,43 @@ class PgTransaction(object):
 
         return self._exec(procname, params=params, proc=True)
 
+    @property
+    def json_codec(self):
+        """
+        Returns codec to decode and encode json values with (see
+        :mod:`jukoro.pg.codec`)
+
+        :rtype: :class:`~jukoro.pg.codec.JsonCodec`
+
+        """
+        return self._pg_conn.json_codec
+
+    def copy_expert(self, sql, stream, size=8192, params=None):
+        """
+        Executes ``COPY`` statement reading data from (``COPY ... FROM
+        STDIN``) or writing data to (``COPY ... TO STDOUT``) file-like
+        object
+
+        :param sql:     ``COPY`` statement
+        :param stream:  file-like object to read data from or to write
+                        data to
+        :param size:    size of buffer to read data with
+        :param params:  parameters to bind to statement client-side
+                        (``COPY`` does not support server-side ones)
+        :returns:       number of rows copied
+
+        NB. not available for named transaction
+
+        """
+        self._ensure_cursor()
+        self._close_result()
+        if params:
+            sql = self._cursor.mogrify(sql, params)
+        sql_logger.debug('executing copy "%s"', sql)
+        self._cursor.copy_expert(sql, stream, size)
+        self._queries.append(sql)
+        return self._cursor.rowcount
+
     def _exec(self, q_or_proc, params=None, proc=False):
         """
         Internal method to actually execute query or stored procedure using
@@ -414,6 +611,8 @@ class PgTransaction(object):
 
         """
         self._ensure_cursor()
+        if not proc and not self._named:
+            q_or_proc, params = self._pg_conn.prepare(q_or_proc, params)
         fn = self._cursor.callproc if proc else self._cursor.execute
         sql_logger.debug(
             'executing query "%s" with "%s"', q_or_proc, params or [])
@@ -424,6 +623,113 @@ class PgTransaction(object):
         return self._result
 
 
+class StatementCache(object):
+    """
+    Per-connection cache of server-side prepared statements with LRU
+    eviction
+
+    Keeps mapping of query template (query with ``%s`` placeholders) to
+    name of prepared statement and counts cache hits, misses and evictions
+    (counters are reset by :meth:`drain`)
+
+    Queries which failed to be prepared are kept with ``UNPREPARABLE`` name
+    to be executed as is without retries
+
+    Keeps parameters types PostgreSQL inferred for prepared statements too
+    (see :meth:`types`)
+
+    :param size:    maximum number of prepared statements to keep
+
+    """
+
+    __slots__ = ('_size', '_store', '_types', '_seq', 'hits', 'misses',
+                 'evictions')
+
+    def __init__(self, size):
+        self._size = size
+        self._store = collections.OrderedDict()
+        self._types = {}
+        self._seq = itertools.count()
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._store)
+
+    def get(self, query):
+        """
+        Returns name of statement prepared for query (marking it as recently
+        used) or None
+
+        :param query:   query template
+
+        """
+        name = self._store.pop(query, None)
+        if name is None:
+            self.misses += 1
+            return None
+        self._store[query] = name
+        self.hits += 1
+        return name
+
+    def name(self):
+        """
+        Returns unique name for new prepared statement
+
+        """
+        return 'ju_stmt_{}'.format(next(self._seq))
+
+    def types(self, name):
+        """
+        Returns parameters types of prepared statement
+
+        :param name:    name of prepared statement
+        :rtype:         tuple
+
+        """
+        return self._types.get(name, ())
+
+    def add(self, query, name, types=()):
+        """
+        Adds prepared statement to cache evicting least recently used one
+        if cache is full
+
+        :param query:   query template
+        :param name:    name of prepared statement
+        :param types:   parameters types of prepared statement
+        :returns:       name of evicted statement (or None)
+
+        """
+        evicted = None
+        if len(self._store) >= self._size:
+            __, evicted = self._store.popitem(last=False)
+            self._types.pop(evicted, None)
+            self.evictions += 1
+        self._store[query] = name
+        if name != UNPREPARABLE:
+            self._types[name] = tuple(types)
+        return evicted or None
+
+    def clear(self):
+        """
+        Forgets all prepared statements (connection was reestablished)
+
+        """
+        self._store.clear()
+        self._types.clear()
+
+    def drain(self):
+        """
+        Returns counters and resets them
+
+        :returns:   hits, misses and evictions
+        :rtype:     tuple
+
+        """
+        res = (self.hits, self.misses, self.evictions)
+        self.hits = self.misses = self.evictions = 0
+        return res
+
+
 class PgConnection(object):
     """
     Provides a way to work with ``psycopg2.extensions.connection``
@@ -437,10 +743,22 @@ class PgConnection(object):
       (defaults to "public" if not specified)
     - autocommit to True
     - transaction isolation level to READ COMMITED
+    - session parameters specified in uri query
+
+    Session parameters are sent within connection request so no extra
+    round trips are needed to initialize connection
+    (see :func:`~jukoro.pg.utils.pg_uri_to_kwargs`)
 
     :param uri:         connection string
     :param pool:        instance of ``PgDbPool`` to return connection to
     :param autoclose:   if True closes connection after exit from transaction
+    :param statement_cache_size:    number of server-side prepared
+                                    statements to keep per connection
+                                    (defaults to 0 meaning queries are not
+                                    prepared, see :meth:`prepare`)
+    :param json_codec:  codec name or instance to decode and encode json
+                        values with (defaults to ``None`` meaning default
+                        codec, see :func:`~jukoro.pg.codec.get_codec`)
 
     Usage example:
 
@@ -494,9 +812,11 @@ class PgConnection(object):
     """
 
     __slots__ = ('_uri', '_schema', '_pg_pool', '_conn_kwargs', '_conn',
-                 '_autoclose', '_closed')
+                 '_autoclose', '_closed', '_created', '_last_used',
+                 '_autocommit', '_statements', '_json_codec')
 
-    def __init__(self, uri, pool=None, autoclose=False):
+    def __init__(self, uri, pool=None, autoclose=False,
+                 statement_cache_size=0, json_codec=None):
         self._uri = uri
         self._pg_pool = pool
         kwargs = pg_uri_to_kwargs(uri)
@@ -505,6 +825,13 @@ class PgConnection(object):
         self._conn = None  # psycopg2.connection
         self._autoclose = autoclose
         self._closed = False
+        self._created = None  # timestamp connection was established at
+        self._last_used = time.time()  # timestamp of last reattach
+        self._autocommit = True  # connection mode
+        self._statements = None
+        if statement_cache_size:
+            self._statements = StatementCache(statement_cache_size)
+        self._json_codec = get_codec(json_codec)
 
         # logger.debug('connection created %s', repr(self))
 
@@ -520,35 +847,53 @@ class PgConnection(object):
 
         """
         if self._conn is None:
+            # session parameters are passed within connection "options"
+            # (see jukoro.pg.utils.pg_uri_to_kwargs)
             self._conn = _connect(**self._conn_kwargs)
-            self._conn.set_session(
-                psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED,
-                autocommit=True)
-            self._conn.set_client_encoding('UTF8')
-            self._conn.autocommit = True
-            cur = self._conn.cursor()
-            cur.execute('SET TIME ZONE "UTC";')
-            cur.execute('SET search_path TO %s;', (self.schema, ))
-            cur.close()
+            self._conn.autocommit = self._autocommit = True
+            self._conn.json_codec = self._json_codec
+            self._created = time.time()
+            if self._statements is not None:
+                # prepared statements do not survive reconnect
+                self._statements.clear()
         return self._conn
 
     @property
     def autocommit(self):
         """
-        Returns connection ``autocommit`` property value
+        Returns connection ``autocommit`` mode
+        (cached value, doesn't establish connection)
 
         """
-        return self.conn.autocommit
+        return self._autocommit
 
     @autocommit.setter
+    @raise_if_connection_closed
     def autocommit(self, value):
         """
         Sets connection ``autocommit`` property to value
+        (only if it differs from current mode)
 
         :param value: boolean to set autocommit to
 
         """
-        self.conn.autocommit = value
+        if value != self._autocommit:
+            self.conn.autocommit = value
+            self._autocommit = value
+
+    @property
+    def in_transaction(self):
+        """
+        Returns True if connection has transaction in progress
+        (checks status reported by ``libpq``, no queries performed)
+
+        :rtype: boolean
+
+        """
+        if self._conn is None:
+            return False
+        status = self._conn.get_transaction_status()
+        return status != psycopg2.extensions.TRANSACTION_STATUS_IDLE
 
     @property
     def is_closed(self):
@@ -570,6 +915,29 @@ class PgConnection(object):
         """
         return self._schema
 
+    @property
+    def age(self):
+        """
+        Returns number of seconds passed since connection to PostgreSQL
+        was established (0 if it is not established yet)
+
+        :rtype: float
+
+        """
+        if self._created is None:
+            return 0
+        return time.time() - self._created
+
+    @property
+    def idle(self):
+        """
+        Returns number of seconds passed since instance was used last time
+
+        :rtype: float
+
+        """
+        return time.time() - self._last_used
+
     @raise_if_connection_closed
     def commit(self):
         """
@@ -599,19 +967,185 @@ class PgConnection(object):
         self._closed = True
 
     @raise_if_connection_closed
-    def cursor(self, named=False):
+    def cursor(self, named=False, cursor_factory=None):
         """
         Creates new cursor for connection
 
-        :param named:   if True creates named cursor
-        :returns:       cursor
-        :rtype:         ``psycopg2.extensions.cursor``
+        :param named:           if True creates named cursor
+        :param cursor_factory:  cursor class (defaults to connection's
+                                cursor factory)
+        :returns:               cursor
+        :rtype:                 ``psycopg2.extensions.cursor``
 
         """
         if named:
             return self.conn.cursor(
-                name=str(uuid.uuid4()), scrollable=True, withhold=True)
-        return self.conn.cursor()
+                name=str(uuid.uuid4()), scrollable=True, withhold=True,
+                cursor_factory=cursor_factory)
+        return self.conn.cursor(cursor_factory=cursor_factory)
+
+    @property
+    def json_codec(self):
+        """
+        Returns codec to decode and encode json values with
+
+        :rtype: :class:`~jukoro.pg.codec.JsonCodec`
+
+        """
+        return self._json_codec
+
+    @property
+    def statements(self):
+        """
+        Returns cache of prepared statements (or None if disabled)
+
+        :rtype: ``StatementCache``
+
+        """
+        return self._statements
+
+    @raise_if_connection_closed
+    def prepare(self, query, params=None):
+        """
+        Prepares server-side statement for query (unless already prepared)
+        and returns query and parameters to execute it with
+
+        Query is returned as is in case cache of prepared statements is
+        disabled or query can't be prepared (it isn't one of ``SELECT``,
+        ``INSERT``, ``UPDATE``, ``DELETE``, ``VALUES``, ``WITH`` or it has
+        named or tuple parameters)
+
+        Query is executed as is too (and is not prepared again) in case
+        PostgreSQL fails to infer types of its parameters or infers ``text``
+        type for non-string parameter (``SELECT %s`` would return string
+        instead of number otherwise). ``PREPARE`` runs within savepoint so
+        failure doesn't abort transaction
+
+        Prepared statement is not used for parameters not matching types
+        PostgreSQL inferred (``EXECUTE`` casts them silently, e.g. rounds
+        ``2.4`` passed for ``integer`` parameter) and query is executed as
+        is for such parameters
+
+        Statements are keyed by query template so queries are expected to
+        be created with placeholders for all values (as
+        :class:`~jukoro.pg.query.QueryViewBuilder` does)
+
+        :param query:   sql query with ``%s`` placeholders
+        :param params:  parameters for sql query (None, list or tuple)
+        :returns:       query and query parameters
+        :rtype:         tuple
+
+        """
+        cache = self._statements
+        if cache is None or isinstance(params, dict) \
+                or not PREPARABLE.match(query) \
+                or any(isinstance(x, tuple) for x in params or ()):
+            return query, params
+        name = cache.get(query)
+        if name is None:
+            stmt = query
+            if params is not None:
+                stmt, cnt = _to_positional(query)
+                if stmt is None or cnt != len(params):
+                    return query, params
+            name, types = self._prepare(cache.name(), stmt, params)
+            cursor = self.conn.cursor()
+            try:
+                evicted = cache.add(query, name, types)
+                if evicted is not None:
+                    cursor.execute('DEALLOCATE {};'.format(evicted))
+            finally:
+                cursor.close()
+        if name == UNPREPARABLE \
+                or not _params_fit(cache.types(name), params):
+            return query, params
+        if not params:
+            return 'EXECUTE {};'.format(name), params
+        placeholders = ','.join(['%s'] * len(params))
+        return 'EXECUTE {}({});'.format(name, placeholders), params
+
+    def _prepare(self, name, stmt, params):
+        """
+        Prepares statement checking types PostgreSQL inferred for its
+        parameters
+
+        :param name:    name of statement to prepare
+        :param stmt:    sql query with ``$n`` placeholders
+        :param params:  parameters for sql query (None, list or tuple)
+        :returns:       name of prepared statement (or ``UNPREPARABLE``)
+                        and its parameters types
+        :rtype:         tuple
+
+        """
+        conn = self.conn
+        # failed statement aborts transaction block
+        savepoint = not conn.autocommit
+        cursor = conn.cursor()
+        try:
+            if savepoint:
+                cursor.execute('SAVEPOINT ju_prepare;')
+            try:
+                cursor.execute('PREPARE {} AS {}'.format(
+                    name, stmt.strip().rstrip(';')))
+            except psycopg2.Error:
+                logger.debug('unable to prepare "%s"', stmt, exc_info=True)
+                if savepoint:
+                    cursor.execute('ROLLBACK TO SAVEPOINT ju_prepare;')
+                return UNPREPARABLE, ()
+            finally:
+                if savepoint:
+                    cursor.execute('RELEASE SAVEPOINT ju_prepare;')
+            cursor.execute(
+                'SELECT "parameter_types"::text[] AS "types" '
+                'FROM "pg_prepared_statements" WHERE "name" = %s;', (name, ))
+            row = cursor.fetchone()
+            types = row['types'] if isinstance(row, dict) else row[0]
+            if any(x in UNTYPED and not _is_untyped(y)
+                   for (x, y) in zip(types, params or ())):
+                cursor.execute('DEALLOCATE {};'.format(name))
+                return UNPREPARABLE, ()
+        finally:
+            cursor.close()
+        return name, types
+
+    @raise_if_connection_closed
+    def ping(self):
+        """
+        Checks connection to PostgreSQL is alive executing simple query
+        (does nothing if connection is not established yet)
+
+        :returns:   True if connection is alive and False otherwise
+
+        """
+        if self._conn is None:
+            return True
+        if self._conn.closed:
+            return False
+        try:
+            cur = self._conn.cursor()
+            cur.execute('SELECT 1;')
+            cur.close()
+            if not self._conn.autocommit:
+                self._conn.rollback()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+        return True
+
+    @raise_if_connection_closed
+    def recycle(self):
+        """
+        Closes underlying ``psycopg2.extensions.connection`` keeping
+        instance usable (new connection will be established on demand)
+
+        """
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except psycopg2.Error:
+                pass
+            self._conn = None
+        self._created = None
+        self._autocommit = True
 
     @raise_if_connection_closed
     def reattach(self):
@@ -619,7 +1153,14 @@ class PgConnection(object):
         Reattaches connection to ``PgDbPool`` instance
         or closes connection if ``autoclose`` was set to True
 
+        Forgets underlying connection if it was closed by server
+
         """
+        self._last_used = time.time()
+        if self._conn is not None and self._conn.closed:
+            self._conn = None
+            self._created = None
+            self._autocommit = True
         if self._pg_pool is not None:
             self._pg_pool.unlock(self)
         elif self._autoclose:
@@ -639,14 +1180,242 @@ class PgConnection(object):
         return PgTransaction(self, **kwargs)
 
 
+class PoolQueue(object):
+    """
+    Pool sizing and queue of callers waiting for connection shared by
+    :class:`PgDbPool` and :class:`AsyncPgDbPool
+    <jukoro.pg.aio.AsyncPgDbPool>` (not thread-safe, performs no I/O)
+
+    Pool grows up to ``pool_size`` connections, then overflow connections
+    are created while their number is less than ``max_overflow`` and
+    callers wait otherwise. Connection returned to pool is handed directly
+    to the caller waiting for a longest time, callers arrived later don't
+    take free connections while there are waiting ones (so waiting callers
+    are served in order of arrival)
+
+    Waiters are expected to have ``set_result`` and ``set_exception``
+    methods (the same way futures do)
+
+    :param pool:            instance of
+                            :class:`~jukoro.structures.LockRing` to keep
+                            pooled connections in
+    :param pool_size:       maximum number of pooled connections
+    :param max_overflow:    maximum number of overflow connections
+                            (``None`` meaning no limit)
+    :param stats:           :class:`~jukoro.structures.ObjectDict` to count
+                            created overflow connections in
+                            (``overflow_total``)
+
+    """
+
+    __slots__ = ('pool', 'overflow', 'waiters', '_pool_size',
+                 '_max_overflow', '_stats')
+
+    def __init__(self, pool, pool_size, max_overflow, stats):
+        self.pool = pool
+        self.overflow = set()
+        self.waiters = collections.deque()
+        self._pool_size = pool_size
+        self._max_overflow = max_overflow
+        self._stats = stats
+
+    def get(self, factory, key=None):
+        """
+        Returns free connection, new pooled or overflow connection
+
+        :param factory:     callable to create connection with as
+                            ``factory(overflow)``
+        :param key:         partition key to prefer free connection from
+                            (see :meth:`LockRing.next
+                            <jukoro.structures.LockRing.next>`)
+        :returns:           connection or ``None`` if caller must wait
+                            (see :meth:`wait`)
+
+        """
+        if not self.waiters:
+            try:
+                return self.pool.next(key)
+            except IndexError:
+                pass
+        if len(self.pool) < self._pool_size:
+            self.pool.push(factory(False))
+            return self.pool.next(key)
+        if self._max_overflow is None \
+                or len(self.overflow) < self._max_overflow:
+            logger.debug('pool exhausted, making overflow connection')
+            conn = factory(True)
+            self.overflow.add(conn)
+            self._stats.overflow_total += 1
+            return conn
+
+    def wait(self, waiter):
+        """
+        Queues caller waiting for connection
+
+        :param waiter:  object to hand connection to
+
+        """
+        self.waiters.append(waiter)
+
+    def cancel(self, waiter):
+        """
+        Removes caller from queue (in case waiting timed out)
+
+        :param waiter:  queued waiter
+        :returns:       True if waiter was queued and False otherwise
+
+        """
+        try:
+            self.waiters.remove(waiter)
+        except ValueError:
+            return False
+        return True
+
+    def put(self, conn):
+        """
+        Hands connection to caller waiting for a longest time if any,
+        returns it to pool otherwise
+
+        :param conn:    connection from pool
+        :returns:       True if connection is an overflow one and must be
+                        closed by caller
+
+        """
+        if self.waiters:
+            self.waiters.popleft().set_result(conn)
+            return False
+        if conn in self.overflow:
+            self.overflow.discard(conn)
+            return True
+        self.pool.push(conn)
+        return False
+
+    def clear(self, exc):
+        """
+        Removes all connections (to be closed by caller) and fails waiting
+        callers
+
+        :param exc:     exception to fail waiting callers with
+        :returns:       list of removed connections
+
+        """
+        conns = [self.pool.pop() for __ in xrange(len(self.pool))]
+        conns.extend(self.overflow)
+        self.overflow.clear()
+        self.pool.reset()
+        while self.waiters:
+            self.waiters.popleft().set_exception(exc)
+        return conns
+
+
+class Waiter(object):
+    """
+    Thread waiting for connection from :class:`PgDbPool`
+
+    :param lock:    pool lock (waiter condition is bound to it)
+
+    """
+
+    __slots__ = ('_cond', '_conn', '_exc')
+
+    def __init__(self, lock):
+        self._cond = threading.Condition(lock)
+        self._conn = None
+        self._exc = None
+
+    def set_result(self, conn):
+        """
+        Hands connection to waiting thread and wakes it up
+
+        """
+        self._conn = conn
+        self._cond.notify()
+
+    def set_exception(self, exc):
+        """
+        Fails waiting thread with exception and wakes it up
+
+        """
+        self._exc = exc
+        self._cond.notify()
+
+    def wait(self, timeout=None):
+        """
+        Waits up to ``timeout`` seconds for connection to be handed over
+
+        Expected to be called with pool lock acquired
+
+        :param timeout:     number of seconds to wait (``None`` meaning
+                            wait forever)
+        :returns:           connection or ``None`` if not handed yet
+
+        """
+        if self._conn is None and self._exc is None:
+            self._cond.wait(timeout)
+        if self._exc is not None:
+            raise self._exc
+        return self._conn
+
+
 class PgDbPool(object):
     """
     Manages pool of ``PgConnection`` instances
     In case all connections are busy (pool is exhausted) will transparently
     create new ``PgConnection`` with ``autoclose=True`` parameter
-
-    :param uri:         connection string
-    :param pool_size:   size of pool to manage
+    (overflow connection) while number of overflow connections is less than
+    ``max_overflow``, otherwise waits up to ``timeout`` seconds for
+    connection to be returned to pool
+
+    Waiting callers are served in order of arrival: connection returned to
+    pool is handed directly to the caller waiting for a longest time (see
+    :class:`PoolQueue`)
+
+    :param uri:             connection string
+    :param pool_size:       size of pool to manage
+    :param max_overflow:    maximum number of overflow connections
+                            (defaults to ``None`` meaning no limit,
+                            ``0`` disables overflow connections)
+    :param timeout:         number of seconds to wait for free connection
+                            (defaults to ``None`` meaning wait forever)
+    :param min_size:        number of connections to create while warming
+                            up pool and to keep in pool while closing idle
+                            ones (defaults to ``pool_size``, ``0`` starts
+                            with empty pool)
+    :param warm_up:         if True establishes ``min_size`` connections
+                            to PostgreSQL on init (see :meth:`warm_up`)
+    :param warm_up_threads: maximum number of threads to establish
+                            connections with while warming up pool
+                            (defaults to 8)
+    :param max_lifetime:    number of seconds after which connection is
+                            reestablished on checkout
+                            (defaults to ``None`` meaning forever)
+    :param check_idle:      number of seconds connection must be idle to be
+                            validated on checkout
+                            (defaults to ``None`` meaning no validation)
+    :param idle_timeout:    number of seconds after which idle connection is
+                            closed by reaper
+                            (defaults to ``None`` meaning no reaping)
+    :param reap_interval:   number of seconds between reaper runs
+                            (defaults to 60)
+    :param statement_cache_size:    number of server-side prepared
+                                    statements to keep per connection
+                                    (defaults to 0 meaning queries are not
+                                    prepared, see
+                                    :meth:`PgConnection.prepare`)
+    :param json_codec:      codec name or instance to decode and encode
+                            json values with (defaults to ``None`` meaning
+                            default codec, see
+                            :func:`~jukoro.pg.codec.get_codec`)
+
+    Hard limit for number of connections opened by pool is
+    ``pool_size + max_overflow``
+
+    Pool starts with ``min_size`` connections (established lazily on first
+    use unless ``warm_up`` is True) and grows on demand up to ``pool_size``
+    connections. In case
+    ``idle_timeout`` is specified background thread (reaper) closes
+    connections idle for more than ``idle_timeout`` seconds shrinking pool
+    back to ``min_size`` connections.
 
     Usage example:
 
@@ -680,18 +1449,65 @@ class PgDbPool(object):
         0
         >>>
 
+    Bounded pool example:
+
+    .. code-block:: pycon
+
+        >>> pool = pg.PgDbPool(uri, pool_size=1, max_overflow=0, timeout=0.5)
+        >>> cursor = pool.transaction()
+        >>> pool.transaction()
+        Traceback (most recent call last):
+        ...
+        jukoro.pg.exceptions.PoolExhausted: pool exhausted
+        >>> pool.stats
+        {'broken': 0, 'busy': 1, 'mode_switches': 0, 'overflow': 0,
+         'overflow_total': 0, 'reaped': 0, 'recycled': 0, 'size': 1,
+         'statement_evictions': 0, 'statement_hits': 0,
+         'statement_misses': 0, 'timeouts': 1, 'wait_max': 0.500...,
+         'wait_time': 0.500..., 'waiting': 0, 'waits': 1}
+
     """
 
-    __slots__ = ('_uri', '_pool_size', '_pool',
-                 '_warmed_up', '_closed', '_lock')
+    __slots__ = ('_uri', '_pool_size', '_min_size', '_pool', '_queue',
+                 '_timeout', '_max_lifetime', '_check_idle', '_idle_timeout',
+                 '_reap_interval', '_reaper', '_stats',
+                 '_warm_up_threads', '_warmed_up', '_closed', '_lock',
+                 '_stop', '_statement_cache_size', '_json_codec')
 
-    def __init__(self, uri, pool_size=5, **kwargs):
+    def __init__(self, uri, pool_size=5, max_overflow=None, timeout=None,
+                 **kwargs):
         self._uri = uri
         self._pool_size = pool_size
-        self._pool = LockRing()
+        min_size = kwargs.get('min_size')
+        if min_size is None:
+            min_size = pool_size
+        if min_size < 0:
+            raise ValueError('min_size must not be negative')
+        self._min_size = min(min_size, pool_size)
+        # free connections are partitioned by autocommit mode
+        self._pool = LockRing(key=_conn_mode)
+        self._timeout = timeout
+        self._max_lifetime = kwargs.get('max_lifetime')
+        self._check_idle = kwargs.get('check_idle')
+        self._idle_timeout = kwargs.get('idle_timeout')
+        self._reap_interval = kwargs.get('reap_interval', 60)
+        self._reaper = None
+        self._stats = ObjectDict(overflow_total=0, waits=0, wait_time=0.0,
+                                 wait_max=0.0, timeouts=0, recycled=0,
+                                 broken=0, reaped=0, mode_switches=0,
+                                 statement_hits=0, statement_misses=0,
+                                 statement_evictions=0)
+        self._queue = PoolQueue(self._pool, pool_size, max_overflow,
+                                self._stats)
+        self._warm_up_threads = kwargs.get('warm_up_threads', 8)
+        self._statement_cache_size = kwargs.get('statement_cache_size', 0)
+        self._json_codec = get_codec(kwargs.get('json_codec'))
         self._warmed_up = False
         self._closed = False
         self._lock = threading.Lock()
+        self._stop = threading.Event()
+        if kwargs.get('warm_up'):
+            self.warm_up()
 
     @property
     def is_closed(self):
@@ -713,6 +1529,48 @@ class PgDbPool(object):
         """
         return self._uri
 
+    @property
+    def stats(self):
+        """
+        Returns snapshot of pool usage statistics:
+
+        - ``size`` - current length of pool
+        - ``busy`` - number of pooled connections in use
+        - ``overflow`` - number of overflow connections in use
+        - ``overflow_total`` - number of overflow connections created
+        - ``waiting`` - number of callers waiting for connection
+        - ``waits`` - number of times callers had to wait for connection
+        - ``wait_time`` - total number of seconds callers waited
+        - ``wait_max`` - longest wait in seconds
+        - ``timeouts`` - number of times waiting for connection timed out
+        - ``recycled`` - number of connections reestablished due to
+          ``max_lifetime``
+        - ``broken`` - number of connections reestablished due to failed
+          validation
+        - ``reaped`` - number of idle connections closed by reaper
+        - ``mode_switches`` - number of times connection was checked out
+          having autocommit mode different from requested one
+        - ``statement_hits`` - number of queries executed using already
+          prepared statement
+        - ``statement_misses`` - number of queries not found in prepared
+          statements cache
+        - ``statement_evictions`` - number of prepared statements
+          deallocated to free room in cache
+
+        Prepared statements counters are updated on connection return to
+        pool
+
+        :rtype: :class:`~jukoro.structures.ObjectDict`
+
+        """
+        with self._lock:
+            stats = self._stats.copy()
+            stats.size = len(self._pool)
+            stats.busy = stats.size - self._pool.available
+            stats.overflow = len(self._queue.overflow)
+            stats.waiting = len(self._queue.waiters)
+        return stats
+
     def __repr__(self):
         return '<PgDbPool("{}")> at {}'.format(self._uri, hex(id(self)))
 
@@ -727,15 +1585,15 @@ class PgDbPool(object):
 
     def close(self):
         """
-        Closes pool closing all connections
+        Closes pool closing all connections (including overflow ones)
+        and failing callers waiting for connection
 
         """
+        self._stop.set()
         with self._lock:
-            for __ in xrange(len(self._pool)):
-                conn = self._pool.pop()
-                conn.close()
             self._closed = True
-            self._pool.reset()
+            for conn in self._queue.clear(PoolClosed('pool closed')):
+                conn.close()
 
     @raise_if_pool_closed
     def transaction(self, **kwargs):
@@ -743,72 +1601,626 @@ class PgDbPool(object):
         Creates new transaction selecting connection from pool and calling
         ``PgConnection.transaction`` method
 
+        Prefers free connection having autocommit mode matching requested
+        transaction mode (to avoid mode switches)
+
         :param kwargs:  keyword arguments to initialize ``PgTransaction``
                         instance
         :returns:       transaction manager instance
         :rtype:         ``PgTransaction``
+        :raises PoolExhausted:  if no connection became available within
+                                ``timeout`` seconds
 
         """
-        with self._lock:
-            conn = self._get_conn()
+        autocommit = kwargs.get('autocommit', True) \
+            and not kwargs.get('named', False)
+        conn = self._checkout(autocommit)
         return conn.transaction(**kwargs)
 
-    def _get_conn(self):
+    @raise_if_pool_closed
+    def _checkout(self, autocommit=True):
+        """
+        Returns validated connection from pool (see :meth:`_get_conn`)
+
+        :param autocommit:  autocommit mode to prefer connection with
+        :returns:   connection manager
+        :rtype:     ``PgConnection``
+
+        """
+        with self._lock:
+            conn = self._get_conn(autocommit)
+            if conn.autocommit != autocommit:
+                self._stats.mode_switches += 1
+        self._check(conn)
+        return conn
+
+    def _get_conn(self, autocommit=True):
         """
         Returns connection from pool if available
-        Creates free connection if pool is exhausted
+        Creates new pooled connection if pool is exhausted and its size is
+        less than ``pool_size``
+        Creates overflow connection if pool is exhausted and overflow limit
+        is not reached
+        Waits for connection to be returned to pool otherwise
         Warms up pool if it is not yet warmed up
 
+        Expected to be called with ``_lock`` acquired
+
+        :param autocommit:  autocommit mode to prefer connection with
         :returns:   connection manager
         :rtype:     ``PgConnection``
+        :raises PoolExhausted:  if waiting for connection timed out
+        :raises PoolClosed:     if pool was closed while waiting
 
         """
         if not self._warmed_up:
             self._warm_up()
+        conn = self._queue.get(self._pool_conn, autocommit)
+        if conn is not None:
+            return conn
+        waiter = Waiter(self._lock)
+        self._queue.wait(waiter)
+        self._stats.waits += 1
+        started = time.time()
         try:
-            conn = self._pool.next()
-        except (IndexError, StopIteration):
-            logger.error('pool exhausted, making new connection')
-            conn = self._new_conn(autoclose=True)
-        return conn
+            while True:
+                remaining = None
+                if self._timeout is not None:
+                    remaining = started + self._timeout - time.time()
+                conn = waiter.wait(remaining)
+                if conn is not None:
+                    return conn
+                if remaining is not None \
+                        and time.time() - started >= self._timeout:
+                    self._queue.cancel(waiter)
+                    self._stats.timeouts += 1
+                    logger.error('pool exhausted, waiting for connection '
+                                 'timed out')
+                    raise PoolExhausted('pool exhausted')
+        finally:
+            waited = time.time() - started
+            self._stats.wait_time += waited
+            self._stats.wait_max = max(self._stats.wait_max, waited)
+
+    def _check(self, conn):
+        """
+        Reestablishes connection to PostgreSQL in case it is older than
+        ``max_lifetime`` seconds or in case it was idle for more than
+        ``check_idle`` seconds and failed validation
+
+        :param conn:    instance of ``PgConnection``
+
+        """
+        if self._max_lifetime is not None \
+                and conn.age > self._max_lifetime:
+            conn.recycle()
+            with self._lock:
+                self._stats.recycled += 1
+        elif self._check_idle is not None \
+                and conn.idle > self._check_idle and not conn.ping():
+            logger.warning('connection is broken, reconnecting')
+            conn.recycle()
+            with self._lock:
+                self._stats.broken += 1
+
+    def _reap(self):
+        """
+        Closes connections idle for more than ``idle_timeout`` seconds
+        keeping at least ``min_size`` connections in pool
+
+        """
+        to_close = []
+        with self._lock:
+            while len(self._pool) > self._min_size:
+                conn = self._pool.peek()
+                if conn is None or conn.idle <= self._idle_timeout:
+                    break
+                to_close.append(self._pool.pop())
+            self._stats.reaped += len(to_close)
+        for conn in to_close:
+            conn.close()
+        if to_close:
+            logger.info('reaped %s idle connections from pool "%s"',
+                        len(to_close), repr(self))
+
+    def _run_reaper(self):
+        """
+        Runs reaper every ``reap_interval`` seconds until pool is closed
+
+        """
+        while not self._stop.wait(self._reap_interval):
+            try:
+                self._reap()
+            except Exception:
+                logger.exception('exception reaping idle connections')
 
     def _new_conn(self, **kwargs):
         """
         Returns new instance of ``PgConnection``
 
         """
+        kwargs.setdefault('statement_cache_size',
+                          self._statement_cache_size)
+        kwargs.setdefault('json_codec', self._json_codec)
         return PgConnection(self._uri, **kwargs)
 
+    def _pool_conn(self, overflow=False):
+        """
+        Returns new pooled connection or overflow one (to be closed on
+        return to pool)
+
+        """
+        if overflow:
+            return self._new_conn(pool=self, autoclose=True)
+        return self._new_conn(pool=self)
+
     @raise_if_pool_closed
     def unlock(self, conn):
         """
-        Unlocks connection after usage
-        (returns it to pool and makes available to chose)
+        Unlocks connection after usage handing it to first caller waiting
+        for connection if any, otherwise returns it to pool (makes
+        available to chose) or closes it if it is an overflow one
 
         :param conn:    instance of ``PgConnection`` from the pool
 
         """
-        self._pool.push(conn)
+        with self._lock:
+            if conn.statements is not None:
+                hits, misses, evictions = conn.statements.drain()
+                self._stats.statement_hits += hits
+                self._stats.statement_misses += misses
+                self._stats.statement_evictions += evictions
+            is_overflow = self._queue.put(conn)
+        if is_overflow:
+            conn.close()
 
-    def _warm_up(self):
+    @raise_if_pool_closed
+    def warm_up(self):
         """
-        Warms up pool establishing connection to PostgreSQL
+        Warms up pool establishing connections to PostgreSQL concurrently
+        (using up to ``warm_up_threads`` threads) while pool has less than
+        ``min_size`` connections
+
+        Expected to be called before pool is used (connections added to
+        pool lazily are not established)
+
+        Connections failed to be established are kept in pool and will
+        try to connect on first use
 
         """
+        with self._lock:
+            missing = self._min_size - len(self._pool)
+        if missing <= 0:
+            return
+        conns = [self._new_conn(pool=self) for __ in xrange(missing)]
+        workers = ThreadPool(min(missing, self._warm_up_threads))
+        try:
+            established = sum(workers.map(_establish, conns))
+        finally:
+            workers.close()
+            workers.join()
+        with self._lock:
+            if self._closed:
+                for conn in conns:
+                    conn.close()
+                return
+            self._warm_up(conns)
+        logger.info('established %s of %s connections for pool "%s"',
+                    established, missing, repr(self))
+
+    def _warm_up(self, conns=None):
+        """
+        Warms up pool adding ``min_size`` connections to it (connections
+        to PostgreSQL will be established lazily on first use) or adding
+        ``conns`` if specified
+
+        Starts reaper if ``idle_timeout`` was specified
+
+        Expected to be called with ``_lock`` acquired
+
+        :param conns:   list of ``PgConnection`` instances to add to pool
+
+        """
+        if conns is None:
+            conns = [self._new_conn(pool=self)
+                     for __ in xrange(self._min_size)]
+        for conn in conns:
+            if len(self._pool) < self._pool_size:
+                self._pool.push(conn)
+            else:
+                conn.close()
+        if self._warmed_up:
+            return
         self._warmed_up = True
-        for __ in xrange(self._pool_size):
-            self._pool.push(self._new_conn(pool=self))
+        if self._idle_timeout is not None:
+            self._reaper = threading.Thread(target=self._run_reaper,
+                                            name='jukoro-pg-reaper')
+            self._reaper.daemon = True
+            self._reaper.start()
         logger.info(
-            'warmed up pool "%s" length %s', repr(self), self._pool_size)
+            'warmed up pool "%s" length %s', repr(self), len(self._pool))
+
+
+class PgReplicaTransaction(PgTransaction):
+    """
+    Transaction routed to replica by :class:`PgRoutingPool`
+
+    In case of connection error (``psycopg2.OperationalError`` or
+    ``psycopg2.InterfaceError``) within context manager drops broken
+    connection (there is nothing to roll back) and calls ``on_broken``
+    callback
+
+    :param conn:        instance of PgConnection
+    :param on_broken:   callable to call without arguments
+    :param kwargs:      keyword arguments to initialize ``PgTransaction``
+                        instance with
+
+    """
+
+    __slots__ = ('_on_broken', )
+
+    broken = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+    def __init__(self, conn, on_broken, **kwargs):
+        super(PgReplicaTransaction, self).__init__(conn, **kwargs)
+        self._on_broken = on_broken
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None or not issubclass(exc_type, self.broken):
+            return super(PgReplicaTransaction, self).__exit__(
+                exc_type, exc_value, tb)
+        logger.warning('replica connection is broken')
+        self._failed = True
+        self._pg_conn.recycle()
+        self.close()
+        self._on_broken()
+
+
+class PgRoutingPool(object):
+    """
+    Manages pools of ``PgConnection`` instances for primary PostgreSQL
+    server and its read-only replicas (streaming replication standbys)
+
+    Read-only transactions (explicit ``readonly=True``) are routed to
+    replicas, other transactions (named cursor ones too) are routed to
+    primary. Replica failed to establish connection is excluded from
+    routing for ``retry_interval`` seconds and transaction falls back to
+    next available replica or to primary, the same way transaction falls
+    back in case replica pool is exhausted. Replica transaction failed
+    with connection error (see :class:`PgReplicaTransaction`) excludes
+    replica from routing too, so following transactions fall back while
+    the error is raised to caller
+
+    Pooled replica connections are not validated on every checkout (it
+    costs extra round-trip per transaction), use ``check_idle`` parameter
+    to validate connections idle for some time (see :class:`PgDbPool`)
+
+    :param uri:             primary server connection string
+    :param replicas:        list of replicas connection strings
+    :param strategy:        replica selection strategy - ``round_robin``
+                            (default) or ``least_busy`` (replica having
+                            least number of connections in use)
+    :param retry_interval:  number of seconds failed replica is excluded
+                            from routing for (defaults to 30)
+    :param kwargs:          keyword arguments to initialize primary and
+                            replicas ``PgDbPool`` instances with
+
+    NB. replicas are expected to lag behind primary so queries which must
+    see just committed changes should be routed to primary.
+
+    Usage example:
+
+    .. code-block:: pycon
+
+        >>> from jukoro import pg
+        >>> uri = 'postgresql://primary/jukoro_test.test_schema'
+        >>> replicas = ['postgresql://replica1/jukoro_test.test_schema',
+        ...             'postgresql://replica2/jukoro_test.test_schema']
+        >>> pool = pg.PgRoutingPool(uri, replicas, strategy='least_busy')
+        >>> qb = MyEntity.qbuilder
+        >>> with pool.transaction(readonly=True) as cursor:
+        ...     res = cursor.execute(*qb.select({'attr1': 'a'})).all()
+        ...
+        >>> with pool.transaction(autocommit=False) as cursor:
+        ...     entity = MyEntity(attr1='b').save(cursor)
+        ...
+        >>> pool.stats.replicas[0].busy
+        0
+        >>> pool.close()
+
+    """
+
+    __slots__ = ('_primary', '_replicas', '_strategy', '_retry_interval',
+                 '_down', '_next', '_stats', '_closed', '_lock')
+
+    strategies = ('round_robin', 'least_busy')
+
+    def __init__(self, uri, replicas=None, strategy='round_robin',
+                 retry_interval=30, **kwargs):
+        if strategy not in self.strategies:
+            raise ValueError(
+                'unknown replica selection strategy "{}"'.format(strategy))
+        self._primary = PgDbPool(uri, **kwargs)
+        self._replicas = [PgDbPool(x, **kwargs) for x in replicas or ()]
+        self._strategy = strategy
+        self._retry_interval = retry_interval
+        # timestamps failed replicas are excluded from routing until
+        self._down = [0.0] * len(self._replicas)
+        self._next = itertools.count()
+        self._stats = ObjectDict(replica_failures=0, replica_exhausted=0,
+                                 fallbacks=0)
+        self._closed = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_closed(self):
+        """
+        Returns current state of instance
+
+        :rtype: boolean
+
+        """
+        return self._closed
+
+    @property
+    def uri(self):
+        """
+        Returns primary server connection string
+
+        :rtype: string
+
+        """
+        return self._primary.uri
+
+    @property
+    def primary(self):
+        """
+        Returns pool of connections to primary server
+
+        :rtype: ``PgDbPool``
+
+        """
+        return self._primary
+
+    @property
+    def replicas(self):
+        """
+        Returns pools of connections to replicas
+
+        :rtype: tuple of ``PgDbPool``
+
+        """
+        return tuple(self._replicas)
+
+    @property
+    def stats(self):
+        """
+        Returns snapshot of routing statistics:
+
+        - ``primary`` - primary pool stats (see :attr:`PgDbPool.stats`)
+        - ``replicas`` - list of replicas pools stats
+        - ``replica_failures`` - number of times replica failed to
+          establish connection
+        - ``replica_exhausted`` - number of times replica pool was
+          exhausted
+        - ``fallbacks`` - number of read-only transactions routed to
+          primary due to no replica available
+
+        :rtype: :class:`~jukoro.structures.ObjectDict`
+
+        """
+        with self._lock:
+            stats = self._stats.copy()
+        stats.primary = self._primary.stats
+        stats.replicas = [x.stats for x in self._replicas]
+        return stats
+
+    def __repr__(self):
+        return '<PgRoutingPool("{}", replicas={})> at {}'.format(
+            self.uri, len(self._replicas), hex(id(self)))
+
+    def __len__(self):
+        """
+        Returns total length of primary and replicas pools
+
+        :rtype: int
+
+        """
+        return len(self._primary) + sum(len(x) for x in self._replicas)
+
+    def close(self):
+        """
+        Closes primary and replicas pools
+
+        """
+        self._primary.close()
+        for pool in self._replicas:
+            pool.close()
+        self._closed = True
+
+    @raise_if_pool_closed
+    def warm_up(self):
+        """
+        Warms up primary and replicas pools (see :meth:`PgDbPool.warm_up`)
+
+        """
+        for pool in [self._primary] + self._replicas:
+            pool.warm_up()
+
+    @raise_if_pool_closed
+    def transaction(self, readonly=False, **kwargs):
+        """
+        Creates new transaction selecting connection from replica pool for
+        read-only transaction or from primary pool otherwise
+
+        :param readonly:    route transaction to replica if True
+        :param kwargs:      keyword arguments to initialize
+                            ``PgTransaction`` instance
+        :returns:           transaction manager instance
+        :rtype:             ``PgTransaction``
+        :raises PoolExhausted:  if no connection became available within
+                                ``timeout`` seconds
+
+        """
+        if readonly and self._replicas:
+            autocommit = kwargs.get('autocommit', True) \
+                and not kwargs.get('named', False)
+            for idx in self._route():
+                try:
+                    conn = self._replicas[idx]._checkout(autocommit)
+                except PoolExhausted:
+                    logger.warning('replica "%s" pool is exhausted',
+                                   repr(self._replicas[idx]))
+                    with self._lock:
+                        self._stats.replica_exhausted += 1
+                    continue
+                if _establish(conn):
+                    return PgReplicaTransaction(
+                        conn, functools.partial(self._fail, idx), **kwargs)
+                self._fail(idx, conn)
+            logger.warning('no replica available, routing to primary')
+            with self._lock:
+                self._stats.fallbacks += 1
+        return self._primary.transaction(**kwargs)
+
+    def _route(self):
+        """
+        Returns indexes of available replicas in order to try them
+
+        Starting replica is shifted on every call (round-robin), in case of
+        ``least_busy`` strategy replicas are additionally ordered by number
+        of connections in use
+
+        :rtype: list
+
+        """
+        now = time.time()
+        with self._lock:
+            alive = [idx for idx, until in enumerate(self._down)
+                     if until <= now]
+        if not alive:
+            return alive
+        shift = next(self._next) % len(alive)
+        alive = alive[shift:] + alive[:shift]
+        if self._strategy == 'least_busy':
+            # stable sort keeps round-robin order for equally busy replicas
+            alive.sort(key=self._busy)
+        return alive
+
+    def _busy(self, idx):
+        """
+        Returns number of connections in use for replica pool
+
+        """
+        stats = self._replicas[idx].stats
+        return stats.busy + stats.overflow
+
+    def _fail(self, idx, conn=None):
+        """
+        Returns failed connection (if any) to replica pool and excludes
+        replica from routing for ``retry_interval`` seconds
+
+        """
+        if conn is not None:
+            conn.recycle()
+            conn.reattach()
+        with self._lock:
+            self._down[idx] = time.time() + self._retry_interval
+            self._stats.replica_failures += 1
+        logger.warning('replica "%s" is excluded from routing for %s seconds',
+                       repr(self._replicas[idx]), self._retry_interval)
+
+
+def _to_positional(query):
+    """
+    Replaces ``%s`` placeholders in query with positional ``$n`` ones
+    (and ``%%`` with ``%``)
+
+    :param query:   sql query
+    :returns:       transformed query (or None if query has unsupported
+                    placeholders) and number of placeholders
+    :rtype:         tuple
+
+    """
+    counter = itertools.count(1)
+
+    def repl(match):
+        char = match.group(1)
+        if char == '%':
+            return '%'
+        if char == 's':
+            return '${}'.format(next(counter))
+        raise ValueError(char)
+
+    try:
+        stmt = PLACEHOLDERS.sub(repl, query)
+    except ValueError:
+        return None, 0
+    return stmt, next(counter) - 1
+
+
+def _is_untyped(value):
+    """
+    Returns True if value is passed to PostgreSQL as literal of unknown
+    type (string or NULL)
+
+    """
+    return value is None or isinstance(value, basestring)
+
+
+def _params_fit(types, params):
+    """
+    Returns True if parameters can be passed to prepared statement having
+    ``types`` parameters types without implicit conversion (string or
+    NULL for ``text`` parameter, integral number for integer parameter)
+
+    """
+    for (x, y) in zip(types, params or ()):
+        if x in UNTYPED and not _is_untyped(y):
+            return False
+        if x not in INTEGER_TYPES:
+            continue
+        if isinstance(y, float) and not y.is_integer():
+            return False
+        if isinstance(y, decimal.Decimal) and y != y.to_integral_value():
+            return False
+    return True
+
+
+def _conn_mode(conn):
+    """
+    Returns autocommit mode of ``PgConnection`` instance
+    (to partition free connections in pool by)
+
+    """
+    return conn.autocommit
+
+
+def _establish(conn):
+    """
+    Establishes connection to PostgreSQL for ``PgConnection`` instance
+
+    :param conn:    instance of ``PgConnection``
+    :returns:       True if connection was established and False otherwise
+
+    """
+    try:
+        conn.conn
+    except psycopg2.Error:
+        logger.exception('unable to establish connection')
+        return False
+    return True
 
 
 def _connect(**kwargs):
     """
     Creates and returns new ``psycopg2.extensions.connection`` instance using
-    ``psycopg2.extras.RealDictCursor`` cursor factory by default
+    ``psycopg2.extras.RealDictCursor`` cursor factory and
+    :class:`RawConnection` connection factory by default
 
-    Cursor factory can be overriden in ``kwargs``
+    Cursor and connection factories can be overriden in ``kwargs``
 
     """
     kwargs.setdefault('cursor_factory', psycopg2.extras.RealDictCursor)
+    kwargs.setdefault('connection_factory', RawConnection)
     return psycopg2.connect(**kwargs)
@@ -35,12 +35,18 @@ Example definition of Entity class:
 
 """
 
+import gzip
 import logging
+import time
 
 from jukoro import json
+from jukoro.structures import ObjectDict
 
 from jukoro.pg.attrs import Attr, AttrDescr, AttrsDescr
-from jukoro.pg.query import QueryBuilderDescr
+from jukoro.pg.codec import RawJson, get_codec
+from jukoro.pg.query import (
+    CHUNK_SIZE, QueryBuilderDescr, page_limit, plan_rows)
+from jukoro.pg.utils import IterStream, iter_stream
 from jukoro.pg import storage
 
 
@@ -61,6 +67,25 @@ def _slugs(base):
     return []
 
 
+def _inherited(name, dct, bases):
+    """
+    Returns class attribute value declared in ``dct`` or inherited from
+    ``bases``
+
+    :param name:    attribute name
+    :param dct:     class namespace
+    :param bases:   class bases
+    :returns:       attribute value or ``None``
+
+    """
+    if name in dct:
+        return dct[name]
+    for base in bases:
+        if hasattr(base, name):
+            return getattr(base, name)
+    return None
+
+
 class EntityMeta(type):
     """
     Metaclass to create ``AbstractEntity`` derived class
@@ -82,7 +107,12 @@ class EntityMeta(type):
     In case class has ``db_table`` attribute defined transforms it to
     Python descriptor :class:`DBTableName <jukoro.pg.storage.DBTableName>` and
     creates ``db_view`` attribute
-    (instance of :class:`DBViewName <jukoro.pg.storage.DBViewName>`)
+    (instance of :class:`DBViewName <jukoro.pg.storage.DBViewName>`) and
+    ``db_history`` attribute (instance of
+    :class:`DBHistoryName <jukoro.pg.storage.DBHistoryName>` if class has
+    ``db_history`` set to ``True``, ``None`` otherwise), checks
+    ``db_partition`` attribute value (both resolved through ``bases`` too,
+    partitioned table can not have history table or unique indices)
 
     Registers class within ``jukoro.pg.storage`` registry if it has
     ``db_table`` attribute defined
@@ -115,6 +145,18 @@ class EntityMeta(type):
                     '"entity" table name is reserved, take another one')
             dct['db_table'] = storage.DBTableName(tn)
             dct['db_view'] = db_view = storage.DBViewName(tn)
+            if _inherited('db_history', dct, bases):
+                dct['db_history'] = storage.DBHistoryName(tn)
+            else:
+                dct['db_history'] = None
+            partition = _inherited('db_partition', dct, bases)
+            if partition not in (None, ) + storage.PARTITION_KEYS:
+                raise AttributeError(
+                    '"db_partition" must be one of {}'.format(
+                        storage.PARTITION_KEYS))
+            if partition and dct['db_history']:
+                raise AttributeError(
+                    '"db_partition" and "db_history" can not be combined')
 
             if 'qbuilder' not in dct:
                 dct['qbuilder'] = QueryBuilderDescr(db_view.name)
@@ -128,6 +170,11 @@ class EntityMeta(type):
 
         klass = super(EntityMeta, mcs).__new__(mcs, name, bases, dct)
 
+        if tn and partition and any(
+                x.unique for attr in klass.attrs for x in attr.db_indices):
+            raise AttributeError(
+                'Unique indices are not supported for partitioned table')
+
         if tn is not None and not dct.get('skip_registry', False):
             storage.register(klass)
         return klass
@@ -146,18 +193,32 @@ class AbstractEntity(object):
 
     :param entity_id:   (int) entity_id
     :param doc:         (dict) dictionary containing attributes values
+                        (or its ``jsonb`` text to decode lazily)
+    :param partial:     (bool) ``doc`` contains only some of attributes
+                        (see :meth:`QueryViewBuilder.projection
+                        <jukoro.pg.query.QueryViewBuilder.projection>`)
 
     """
     __metaclass__ = EntityMeta
-    __slots__ = ('_entity_id', '_doc')
+    __slots__ = ('_entity_id', '_doc', '_partial')
 
     #: Class attribute to have access to
     #: :class:`query builder <jukoro.pg.query.QueryViewBuilder>`
     qbuilder = None
-
-    def __init__(self, entity_id=None, doc=None):
+    #: Class attribute to keep closed versions of entities in separate
+    #: ``<db_table>__history`` table (set to ``True`` in derived class),
+    #: ``db_table`` keeps live versions only then
+    db_history = None
+    #: Class attribute to partition entity table by ``entity_start`` month
+    #: (``'entity_start'``) or by ``entity_end`` (``'entity_end'``, live
+    #: versions partition and monthly partitions for closed versions), see
+    #: :func:`~jukoro.pg.storage.create_partitions`
+    db_partition = None
+
+    def __init__(self, entity_id=None, doc=None, partial=False):
         self._entity_id = entity_id
         self._doc = doc or {}
+        self._partial = partial
 
     @property
     def entity_id(self):
@@ -174,10 +235,29 @@ class AbstractEntity(object):
         """
         Returns container with attributes values
 
+        ``doc`` kept as ``jsonb`` text (see :meth:`PgResult.entities
+        <jukoro.pg.db.PgResult.entities>`) is decoded on first access
+
         :rtype: dict
 
         """
-        return self._doc
+        doc = self._doc
+        if isinstance(doc, RawJson):
+            doc = self._doc = doc.decode()
+        elif isinstance(doc, basestring):
+            doc = self._doc = get_codec().loads(doc)
+        return doc
+
+    @property
+    def partial(self):
+        """
+        Returns ``True`` if instance was loaded with only some of attributes
+        (such instance can not be saved)
+
+        :rtype: bool
+
+        """
+        return self._partial
 
     @property
     def created(self):
@@ -189,7 +269,7 @@ class AbstractEntity(object):
         Value of this attribute is autofilled in PostgreSQL
 
         """
-        return self._doc.get('_created')
+        return self.doc.get('_created')
 
     @property
     def updated(self):
@@ -201,7 +281,7 @@ class AbstractEntity(object):
         Value of this attribute is autofilled in PostgreSQL
 
         """
-        return self._doc.get('_updated')
+        return self.doc.get('_updated')
 
     @property
     def deleted(self):
@@ -214,7 +294,7 @@ class AbstractEntity(object):
 
         """
         # TODO (useless for now)
-        return self._doc.get('_deleted')
+        return self.doc.get('_deleted')
 
     def update(self, **kwargs):
         """
@@ -251,19 +331,283 @@ class AbstractEntity(object):
         return self.entity_id
 
     @classmethod
-    def by_id(cls, cursor, entity_id):
+    def by_id(cls, cursor, entity_id, only=None):
         """
         Loads entity from db
 
         :param cursor:      instance of
                             :class:`PgTransaction <jukoro.pg.db.PgTransaction>`
         :param entity_id:   (int) entity id to load
+        :param only:        list of attributes to load (partial instance
+                            is returned, see :attr:`partial`)
         :returns:           new instance
         :rtype:             ``cls``
         """
-        q, params = cls.qbuilder.by_id(entity_id)
-        res = cursor.execute_and_get(q, params)
-        return cls(**res)
+        q, params = cls.qbuilder.by_id(entity_id, only=only)
+        res = cursor.execute(q, params)
+        return cls(**res.as_dict(res.get()))
+
+    @classmethod
+    def history(cls, cursor, entity_id):
+        """
+        Loads all versions of entity from db (see
+        :meth:`QueryViewBuilder.history
+        <jukoro.pg.query.QueryViewBuilder.history>`), the last one is
+        deleted if it has ``_deleted`` attribute set
+
+        :param cursor:      instance of
+                            :class:`PgTransaction <jukoro.pg.db.PgTransaction>`
+        :param entity_id:   (int) entity id to load versions for
+        :returns:           versions ordered by start
+        :rtype:             list of
+                            :class:`~jukoro.structures.ObjectDict` having
+                            ``entity``, ``start`` and ``end`` keys
+
+        """
+        q, params = cls.qbuilder.history(entity_id)
+        res = cursor.execute(q, params)
+        return [ObjectDict(entity=cls(x['entity_id'], x['doc']),
+                           start=x['entity_start'], end=x['entity_end'])
+                for x in map(res.as_dict, res.all())]
+
+    @classmethod
+    def page(cls, cursor, *conds, **kwargs):
+        """
+        Loads page of entities from db using keyset pagination (see
+        :meth:`QueryViewBuilder.page <jukoro.pg.query.QueryViewBuilder.page>`)
+
+        :param cursor:              instance of
+                                    :class:`PgTransaction
+                                    <jukoro.pg.db.PgTransaction>`
+        :param conds:               list of conditions to select entities by
+        :param kwargs['order_by']:  rules to order entities by
+        :param kwargs['limit']:     page size (required, positive integer)
+        :param kwargs['after']:     continuation token returned with previous
+                                    page
+        :param kwargs['only']:      list of attributes to load (partial
+                                    instances are returned)
+        :returns:                   list of instances and continuation token
+                                    for next page (``None`` for last page)
+        :rtype:                     ``tuple`` in form ``(list, str)``
+        :raises ValueError:         if ``limit`` is missed or is not a
+                                    positive integer
+
+        """
+        limit = page_limit(kwargs.pop('limit', None))
+        qb = cls.qbuilder
+        # one extra row to know if there is a next page
+        q, params = qb.page(*conds, limit=limit + 1, **kwargs)
+        entities = list(cursor.execute(q, params).entities(cls))
+        token = None
+        if len(entities) > limit:
+            entities = entities[:limit]
+            token = qb.page_token(entities[-1], kwargs.get('order_by'))
+        return entities, token
+
+    @classmethod
+    def count(cls, cursor, *conds, **kwargs):
+        """
+        Counts entities in db (see :meth:`QueryViewBuilder.select
+        <jukoro.pg.query.QueryViewBuilder.select>` for conditions)
+
+        :param cursor:              instance of
+                                    :class:`PgTransaction
+                                    <jukoro.pg.db.PgTransaction>`
+        :param conds:               list of conditions to count entities by
+        :param kwargs['estimate']:  ``True`` to get planner estimate instead
+                                    of exact number (fast for huge tables)
+        :returns:                   number of entities
+        :rtype:                     int
+
+        """
+        if kwargs.get('estimate', False):
+            q, params = cls.qbuilder.estimate(*conds)
+            res = cursor.execute(q, params)
+            return plan_rows(res.as_dict(res.get()))
+        q, params = cls.qbuilder.count(*conds)
+        return cursor.execute(q, params).scalar()
+
+    @classmethod
+    def exists(cls, cursor, *conds):
+        """
+        Tests if there are entities in db matching conditions
+
+        :param cursor:      instance of
+                            :class:`PgTransaction <jukoro.pg.db.PgTransaction>`
+        :param conds:       list of conditions to test entities by
+        :rtype:             bool
+
+        """
+        q, params = cls.qbuilder.exists(*conds)
+        return cursor.execute(q, params).scalar()
+
+    @classmethod
+    def aggregate(cls, cursor, aggregates, *conds, **kwargs):
+        """
+        Aggregates entities in db (see :meth:`QueryViewBuilder.aggregate
+        <jukoro.pg.query.QueryViewBuilder.aggregate>`)
+
+        :param cursor:              instance of
+                                    :class:`PgTransaction
+                                    <jukoro.pg.db.PgTransaction>`
+        :param aggregates:          dictionary of ``(function, attribute)``
+                                    pairs to aggregate
+        :param conds:               list of conditions to select entities by
+        :param kwargs['group_by']:  attribute or list of attributes to group
+                                    entities by
+        :returns:                   list of rows (dicts)
+        :rtype:                     list
+
+        """
+        q, params = cls.qbuilder.aggregate(aggregates, *conds, **kwargs)
+        res = cursor.execute(q, params)
+        return map(res.as_dict, res.all())
+
+    @classmethod
+    def bulk_create(cls, cursor, entities, chunk_size=CHUNK_SIZE,
+                    timings=None):
+        """
+        Creates entities in db using one query per ``chunk_size`` entities
+        and yields created instances as soon as chunk is stored
+
+        Entities are consumed lazily (can be a generator) and nothing is
+        stored until returned generator is iterated
+
+        :param cursor:      instance of
+                            :class:`PgTransaction <jukoro.pg.db.PgTransaction>`
+        :param entities:    iterable of ``cls`` instances to create
+        :param chunk_size:  maximum number of entities per query
+                            (defaults to ``CHUNK_SIZE``)
+        :param timings:     list to append per-chunk timings to (instances
+                            of :class:`~jukoro.structures.ObjectDict` having
+                            ``rows`` and ``elapsed`` seconds attributes)
+        :returns:           generator of created instances
+        :rtype:             generator of ``cls``
+
+        """
+        queries = cls.qbuilder.create_chunks(entities, chunk_size)
+        return _execute_chunks(cls, cursor, queries, 'created', timings)
+
+    @classmethod
+    def bulk_update(cls, cursor, entities, chunk_size=CHUNK_SIZE,
+                    timings=None):
+        """
+        Updates entities in db using one set-based query per ``chunk_size``
+        entities (see :meth:`QueryViewBuilder.bulk_update
+        <jukoro.pg.query.QueryViewBuilder.bulk_update>`) and yields updated
+        instances as soon as chunk is stored
+
+        Much faster than :meth:`save` for large number of entities as view
+        trigger is not called per entity, history is kept the same way
+
+        Entities are consumed lazily (can be a generator) and nothing is
+        stored until returned generator is iterated
+
+        :param cursor:      instance of
+                            :class:`PgTransaction <jukoro.pg.db.PgTransaction>`
+        :param entities:    iterable of ``cls`` instances to update
+        :param chunk_size:  maximum number of entities per query
+                            (defaults to ``CHUNK_SIZE``)
+        :param timings:     list to append per-chunk timings to (see
+                            :meth:`bulk_create`)
+        :returns:           generator of updated instances
+        :rtype:             generator of ``cls``
+
+        """
+        queries = cls.qbuilder.bulk_update_chunks(entities, chunk_size)
+        return _execute_chunks(cls, cursor, queries, 'updated', timings)
+
+    @classmethod
+    def bulk_load(cls, cursor, entities):
+        """
+        Loads entities into db using ``COPY`` (see
+        :meth:`QueryViewBuilder.load <jukoro.pg.query.QueryViewBuilder.load>`)
+
+        Much faster than :meth:`bulk_create` for large number of entities as
+        view trigger is not called per entity, but created entities are not
+        returned
+
+        Entities are consumed lazily (can be a generator) and encoded using
+        json codec of connection (see :mod:`jukoro.pg.codec`)
+
+        :param cursor:      instance of
+                            :class:`PgTransaction <jukoro.pg.db.PgTransaction>`
+        :param entities:    iterable of ``cls`` instances to load
+        :returns:           number of loaded entities
+        :rtype:             int
+
+        """
+        queries = cls.qbuilder.load()
+        cursor.execute(queries.create)
+        dumps = cursor.json_codec.dumps
+        cursor.copy_expert(queries.copy_from, IterStream(
+            _copy_line(x.doc, dumps) for x in entities))
+        cnt = cursor.execute(queries.insert).rowcount
+        cursor.execute(queries.drop)
+        return cnt
+
+    @classmethod
+    def export(cls, cursor, stream, *conds, **kwargs):
+        """
+        Exports live entities from db to file-like object using ``COPY ...
+        TO STDOUT`` (see :meth:`QueryViewBuilder.export
+        <jukoro.pg.query.QueryViewBuilder.export>`)
+
+        Data is streamed as it comes from PostgreSQL without decoding rows
+
+        :param cursor:              instance of
+                                    :class:`PgTransaction
+                                    <jukoro.pg.db.PgTransaction>`
+        :param stream:              file-like object to write data to
+                                    (see :meth:`export_iter` to get data
+                                    using generator)
+        :param conds:               list of conditions to select entities by
+                                    (see :meth:`QueryViewBuilder.select
+                                    <jukoro.pg.query.QueryViewBuilder.select>`)
+        :param kwargs['fmt']:       ``ndjson`` (default) or ``csv``
+        :param kwargs['compress']:  ``True`` to gzip data (default ``False``)
+        :param kwargs:              ``order_by``, ``limit`` and ``offset``
+                                    (see :meth:`QueryViewBuilder.select
+                                    <jukoro.pg.query.QueryViewBuilder.select>`)
+        :returns:                   number of exported entities
+        :rtype:                     int
+
+        """
+        compress = kwargs.pop('compress', False)
+        q, params = cls.qbuilder.export(*conds, **kwargs)
+        if not compress:
+            return cursor.copy_expert(q, stream, params=params)
+        gz = gzip.GzipFile(fileobj=stream, mode='wb')
+        try:
+            return cursor.copy_expert(q, gz, params=params)
+        finally:
+            # does not close underlying stream
+            gz.close()
+
+    @classmethod
+    def export_iter(cls, cursor, *conds, **kwargs):
+        """
+        Exports live entities from db as generator yielding raw ``COPY ...
+        TO STDOUT`` data chunks (see :meth:`export`)
+
+        ``COPY`` runs in background thread writing to
+        :class:`QueueStream <jukoro.pg.utils.QueueStream>` while caller
+        consumes chunks, so cursor must not be used until generator is
+        exhausted (stopping iteration early aborts ``COPY`` and transaction
+        has to be rolled back)
+
+        :param cursor:              instance of
+                                    :class:`PgTransaction
+                                    <jukoro.pg.db.PgTransaction>`
+        :param conds:               list of conditions to select entities by
+        :param kwargs:              ``fmt``, ``compress``, ``order_by``,
+                                    ``limit`` and ``offset`` (see
+                                    :meth:`export`)
+        :yields:                    data chunks (``str``)
+
+        """
+        return iter_stream(
+            lambda stream: cls.export(cursor, stream, *conds, **kwargs))
 
     def save(self, cursor):
         """
@@ -277,6 +621,7 @@ class AbstractEntity(object):
 
         :returns:           saved or updated instance recreated (new instance)
         :rtype:             same as self
+        :raises ValueError: if instance is partial
 
         """
         klass = type(self)
@@ -284,9 +629,10 @@ class AbstractEntity(object):
             q, params = klass.qbuilder.create(self)
         else:
             q, params = klass.qbuilder.update(self)
-        res = cursor.execute_and_get(q, params)
-        logger.debug('res: %s', res)
-        return klass(**res)
+        res = cursor.execute(q, params)
+        row = res.as_dict(res.get())
+        logger.debug('res: %s', row)
+        return klass(**row)
 
     def delete(self, cursor):
         """
@@ -307,7 +653,10 @@ class AbstractEntity(object):
         :rtype:     str
 
         """
-        return json.dumps({'entity_id': self._entity_id, 'doc': self._doc})
+        value = {'entity_id': self._entity_id, 'doc': self.doc}
+        if self._partial:
+            value['partial'] = True
+        return json.dumps(value)
 
     @classmethod
     def deserialize(cls, value):
@@ -348,6 +697,33 @@ class AbstractEntity(object):
                                                            type(other)))
 
 
+def _execute_chunks(klass, cursor, queries, action, timings):
+    """
+    Executes chunked queries yielding ``klass`` instances from returned rows
+
+    """
+    for q, params in queries:
+        started = time.time()
+        entities = list(cursor.execute(q, params).entities(klass))
+        elapsed = time.time() - started
+        logger.debug('%s %s "%s" entities for %.5f s',
+                     action, len(entities), klass.__name__, elapsed)
+        if timings is not None:
+            timings.append(ObjectDict(rows=len(entities), elapsed=elapsed))
+        for entity in entities:
+            yield entity
+
+
+def _copy_line(doc, dumps):
+    """
+    Encodes doc to line of ``COPY`` text format using ``dumps`` function of
+    json codec
+
+    """
+    # json escapes control characters so only backslashes need escaping
+    return dumps(doc).replace('\\', '\\\\') + '\n'
+
+
 class AbstractUser(AbstractEntity):
     """
     Abstract User implementation
@@ -17,6 +17,10 @@ class PoolClosed(PgError):
     """ Pool closed error """
 
 
+class PoolExhausted(PgError):
+    """ Pool has no free connections and wait timed out error """
+
+
 class ConnectionClosed(PgError):
     """ Connection closed error """
 
@@ -27,3 +31,7 @@ class CursorClosed(PgError):
 
 class DoesNotExist(PgError):
     """ Query returned nothing error """
+
+
+class ReadOnly(PgError):
+    """ Write query requested from read only query builder error """
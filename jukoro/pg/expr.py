@@ -0,0 +1,553 @@
+# -*- coding: utf-8 -*-
+"""
+Provides expression tree to describe conditions for
+:class:`QueryViewBuilder <jukoro.pg.query.QueryViewBuilder>` queries
+
+- :class:`~jukoro.pg.expr.Key` - reference to ``doc`` attribute (or nested
+  path) producing conditions
+- :class:`~jukoro.pg.expr.And`, :class:`~jukoro.pg.expr.Or`,
+  :class:`~jukoro.pg.expr.Not` - logical composition (also available as
+  ``&``, ``|`` and ``~`` operators)
+- :class:`~jukoro.pg.expr.Contains` - ``jsonb`` **contains** ``@>`` test for
+  the whole ``doc``
+
+Every expression has a "shape" (expression structure without parameters
+values) and compiled sql is cached per shape (see
+:class:`~jukoro.pg.expr.SqlCache`), so building the same query again only
+collects parameters.
+
+Example
+-------
+
+.. code-block:: ipythonconsole
+
+    In [1]: from jukoro.pg.expr import Key, Contains
+
+    In [2]: from project.entities import User
+
+    In [3]: cond = (Key('logged_in') > 1420070400) & ~Key('email').like('%@example.com') | Contains({'username': 'ysegorov'})
+
+    In [4]: User.qbuilder.select(cond, Key('profile', 'city').is_null())
+    Out[4]:
+    ('SELECT "entity_id","doc" FROM "ju_user__live" WHERE ((("doc"->>\'logged_in\')::BIGINT > %s AND (NOT ("doc"->>\'email\')::TEXT LIKE %s)) OR ("doc" @> %s)) OR (("doc"#>>\'{profile,city}\')::TEXT IS NULL);',
+    [1420070400, '%@example.com', {'username': 'ysegorov'}])
+
+"""
+
+import abc
+
+from jukoro import json
+
+from jukoro.pg.attrs import AttrDescr, PATH_KEY
+from jukoro.pg.utils import PgJsonEncoder
+
+
+# default maximum number of compiled queries to keep in cache
+CACHE_SIZE = 1024
+
+# condition templates, "{expr}" is a casted attribute value,
+# "{json}" is a jsonb attribute value, "{parent}" is a jsonb value of
+# attribute's parent (doc itself for top level attributes)
+TEMPLATES = {
+    'eq': '{expr} = %s',
+    'ne': '{expr} != %s',
+    'lt': '{expr} < %s',
+    'lte': '{expr} <= %s',
+    'gt': '{expr} > %s',
+    'gte': '{expr} >= %s',
+    'in': '{expr} IN %s',
+    'any': '{expr} = ANY(%s)',
+    'like': '{expr} LIKE %s',
+    'ilike': '{expr} ILIKE %s',
+    'between': '{expr} BETWEEN %s AND %s',
+    'null': '{expr} IS NULL',
+    'not_null': '{expr} IS NOT NULL',
+    'exists': '{parent} ? %s',
+    'contains': '{json} @> %s::jsonb',
+}
+
+# operations requiring jsonb value (not available for "entity_id")
+JSONB_OPS = frozenset(['exists', 'contains'])
+
+# types allowed to cast values to
+CASTS = frozenset([
+    'TEXT', 'VARCHAR', 'SMALLINT', 'INT', 'INTEGER', 'BIGINT', 'NUMERIC',
+    'DECIMAL', 'REAL', 'FLOAT', 'DOUBLE PRECISION', 'BOOLEAN', 'BOOL',
+    'DATE', 'TIME', 'TIMESTAMP', 'TIMESTAMPTZ', 'INTERVAL', 'UUID',
+])
+
+
+class SqlCache(object):
+    """
+    Bounded cache of compiled sql text per query shape
+
+    :param size:    maximum number of compiled queries to keep (cache is
+                    cleared when it's full)
+
+    """
+
+    __slots__ = ('_size', '_data', 'hits', 'misses')
+
+    def __init__(self, size=CACHE_SIZE):
+        self._size = size
+        self._data = {}
+        self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, factory):
+        """
+        Returns compiled sql for ``key`` calling ``factory`` to compile it
+        in case of cache miss
+
+        :param key:     hashable query shape
+        :param factory: callable without arguments returning sql
+        :rtype:         str
+
+        """
+        try:
+            sql = self._data[key]
+        except KeyError:
+            self.misses += 1
+            sql = factory()
+            if len(self._data) >= self._size:
+                # shapes are expected to be few, so overflow means
+                # generated shapes and there is no point to be smart
+                self._data.clear()
+            self._data[key] = sql
+        else:
+            self.hits += 1
+        return sql
+
+    def clear(self):
+        """
+        Clears cache and its counters
+
+        """
+        self._data.clear()
+        self.hits = self.misses = 0
+
+
+#: Module-level cache of compiled sql shared by query builders
+cache = SqlCache()
+
+
+class Expr(object):
+    """
+    Abstract base class for expressions
+
+    Subclasses must implement ``shape`` property, ``sql`` and ``collect``
+    methods
+
+    """
+
+    __metaclass__ = abc.ABCMeta
+    __slots__ = ()
+
+    @abc.abstractproperty
+    def shape(self):
+        """
+        Returns hashable expression structure without parameters values
+
+        :rtype: tuple
+
+        """
+
+    @abc.abstractmethod
+    def sql(self, klass):
+        """
+        Returns sql text of expression
+
+        :param klass:   :class:`Entity <jukoro.pg.entity.AbstractEntity>`
+                        to get attributes casts from
+        :rtype:         str
+
+        """
+
+    @abc.abstractmethod
+    def collect(self, params):
+        """
+        Appends expression parameters to ``params`` list in order of
+        placeholders in sql
+
+        :param params:  list to append parameters to
+
+        """
+
+    def compile(self, klass):
+        """
+        Returns sql text (cached per shape) and parameters of expression
+
+        :param klass:   :class:`Entity <jukoro.pg.entity.AbstractEntity>`
+                        to get attributes casts from
+        :returns:       sql and parameters
+        :rtype:         ``tuple`` in form ``(str, list)``
+
+        """
+        params = []
+        self.collect(params)
+        return cache.get((klass, self.shape), lambda: self.sql(klass)), params
+
+    def __and__(self, other):
+        return And(self, other)
+
+    def __or__(self, other):
+        return Or(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+
+class Key(object):
+    """
+    Reference to ``doc`` attribute or nested path within ``doc``
+
+    :param path:            attribute name and (optional) nested keys,
+                            ``Key('entity_id')`` refers to ``entity_id``
+                            field
+    :param kwargs['cast']:  type to cast value to (defaults to entity
+                            attribute's
+                            :attr:`~jukoro.pg.attrs.Attr.db_cast` for known
+                            top level attribute and to ``TEXT`` otherwise)
+    :param kwargs['strict']: raise ``AttributeError`` for unknown top level
+                            attribute while compiling (defaults to
+                            ``False``)
+    :raises ValueError:     if path is empty, path keys do not match
+                            :data:`~jukoro.pg.attrs.PATH_KEY` or cast type
+                            is not one of ``CASTS``
+
+    """
+
+    __slots__ = ('_path', '_cast', '_strict')
+
+    def __init__(self, *path, **kwargs):
+        if not path or not all(path):
+            raise ValueError('Key path must not be empty')
+        if not all(isinstance(x, basestring) and PATH_KEY.match(x)
+                   for x in path):
+            raise ValueError(
+                'Key path keys must match "{}"'.format(PATH_KEY.pattern))
+        cast = kwargs.pop('cast', None)
+        if cast is not None:
+            cast = ' '.join(str(cast).split()).upper()
+            if cast not in CASTS:
+                raise ValueError('Unsupported cast "{}"'.format(cast))
+        self._path = tuple(path)
+        self._cast = cast
+        self._strict = kwargs.pop('strict', False)
+
+    @property
+    def path(self):
+        """
+        Returns path of the key
+
+        :rtype: tuple
+
+        """
+        return self._path
+
+    @property
+    def shape(self):
+        """
+        Returns hashable key description
+
+        :rtype: tuple
+
+        """
+        return self._path, self._cast
+
+    def cast(self, klass):
+        """
+        Returns type to cast value to in queries
+
+        :param klass:   :class:`Entity <jukoro.pg.entity.AbstractEntity>`
+        :rtype:         str
+
+        """
+        if self._cast:
+            return self._cast
+        if len(self._path) == 1:
+            if self._strict:
+                return getattr(klass, self._path[0]).db_cast
+            attr = getattr(klass, self._path[0], None)
+            if isinstance(attr, AttrDescr):
+                return attr.db_cast
+        return 'TEXT'
+
+    def parts(self, klass):
+        """
+        Returns sql parts to render condition templates with
+
+        :param klass:   :class:`Entity <jukoro.pg.entity.AbstractEntity>`
+        :rtype:         dict
+
+        """
+        path = list(self._path)
+        if path == ['entity_id']:
+            return {'expr': '"entity_id"'}
+        return {'expr': '({})::{}'.format(_path(path, '>'), self.cast(klass)),
+                'json': '({})'.format(_path(path)),
+                'parent': '({})'.format(_path(path[:-1]))}
+
+    def op(self, op, *values):
+        """
+        Creates condition using one of operations from ``TEMPLATES``
+
+        :param op:      operation name
+        :param values:  operation parameters
+        :rtype:         :class:`Cond`
+        :raises ValueError: if operation is unknown or requires ``jsonb``
+                            value for ``entity_id`` key
+
+        """
+        if op not in TEMPLATES:
+            raise ValueError('Unknown operator "{}"'.format(op))
+        if op in JSONB_OPS and self._path == ('entity_id', ):
+            raise ValueError(
+                'Operator "{}" is not supported for "entity_id"'.format(op))
+        return Cond(op, self, values)
+
+    def __eq__(self, value):
+        return self.op('eq', value)
+
+    def __ne__(self, value):
+        return self.op('ne', value)
+
+    def __lt__(self, value):
+        return self.op('lt', value)
+
+    def __le__(self, value):
+        return self.op('lte', value)
+
+    def __gt__(self, value):
+        return self.op('gt', value)
+
+    def __ge__(self, value):
+        return self.op('gte', value)
+
+    __hash__ = object.__hash__
+
+    def in_(self, values):
+        """
+        Creates ``= ANY(values)`` condition
+
+        :param values:  iterable of values
+
+        """
+        return self.op('any', list(values))
+
+    def like(self, pattern):
+        return self.op('like', pattern)
+
+    def ilike(self, pattern):
+        return self.op('ilike', pattern)
+
+    def between(self, low, high):
+        return self.op('between', low, high)
+
+    def is_null(self):
+        """
+        Creates condition matching missed attribute (or attribute having
+        ``null`` value)
+
+        """
+        return self.op('null')
+
+    def not_null(self):
+        return self.op('not_null')
+
+    def exists(self):
+        """
+        Creates condition matching existing attribute using ``jsonb``
+        ``?`` operator (attribute having ``null`` value exists)
+
+        """
+        return self.op('exists', self._path[-1])
+
+    def contains(self, value):
+        """
+        Creates condition matching attribute containing ``value`` using
+        ``jsonb`` ``@>`` operator
+
+        :param value:   jsonable value (encoded using
+                        :class:`~jukoro.pg.utils.PgJsonEncoder`)
+
+        """
+        return self.op('contains', json.dumps(value, cls=PgJsonEncoder))
+
+
+def _path(path, text=''):
+    # sql to get jsonb (or text) value by path within "doc"
+    if not path:
+        return '"doc"'
+    if len(path) == 1:
+        return '"doc"->{}\'{}\''.format(text, path[0])
+    return '"doc"#>{}\'{{{}}}\''.format(text, ','.join(path))
+
+
+class Cond(Expr):
+    """
+    Single condition, see :meth:`Key.op`
+
+    :param op:      operation name
+    :param key:     instance of :class:`Key`
+    :param values:  operation parameters
+
+    """
+
+    __slots__ = ('_op', '_key', '_values')
+
+    def __init__(self, op, key, values):
+        self._op = op
+        self._key = key
+        self._values = values
+
+    @property
+    def shape(self):
+        return self._op, self._key.shape
+
+    def sql(self, klass):
+        return TEMPLATES[self._op].format(**self._key.parts(klass))
+
+    def collect(self, params):
+        params.extend(self._values)
+
+
+class Contains(Expr):
+    """
+    ``jsonb`` **contains** ``@>`` test for the whole ``doc``
+
+    :param value:   dictionary ``doc`` must contain
+
+    """
+
+    __slots__ = ('_value', )
+
+    def __init__(self, value):
+        self._value = value
+
+    @property
+    def shape(self):
+        return ('contains', )
+
+    def sql(self, klass):
+        return '("doc" @> %s)'
+
+    def collect(self, params):
+        params.append(self._value)
+
+
+class _Group(Expr):
+    """
+    Base class for ``AND``/``OR`` groups of expressions
+
+    """
+
+    __slots__ = ('_exprs', )
+    glue = None
+
+    def __init__(self, *exprs):
+        if not exprs:
+            raise ValueError('At least one expression expected')
+        self._exprs = tuple(as_expr(x) for x in exprs)
+
+    @property
+    def shape(self):
+        return (self.glue, ) + tuple(x.shape for x in self._exprs)
+
+    def sql(self, klass):
+        glue = ' {} '.format(self.glue)
+        return '(%s)' % glue.join(x.sql(klass) for x in self._exprs)
+
+    def collect(self, params):
+        for x in self._exprs:
+            x.collect(params)
+
+
+class And(_Group):
+    """
+    ``AND`` group of expressions
+
+    """
+    __slots__ = ()
+    glue = 'AND'
+
+
+class Or(_Group):
+    """
+    ``OR`` group of expressions
+
+    """
+    __slots__ = ()
+    glue = 'OR'
+
+
+class Not(Expr):
+    """
+    Negation of expression
+
+    """
+
+    __slots__ = ('_expr', )
+
+    def __init__(self, expr):
+        self._expr = as_expr(expr)
+
+    @property
+    def shape(self):
+        return ('NOT', self._expr.shape)
+
+    def sql(self, klass):
+        return '(NOT {})'.format(self._expr.sql(klass))
+
+    def collect(self, params):
+        self._expr.collect(params)
+
+
+def as_expr(cond):
+    """
+    Converts condition to expression
+
+    :param cond:    instance of :class:`Expr`, dictionary (converted to
+                    :class:`Contains`) or list of ``(attribute, operation,
+                    value)`` triplets (converted to :class:`And`), see
+                    :meth:`QueryViewBuilder.select
+                    <jukoro.pg.query.QueryViewBuilder.select>`
+    :rtype:         :class:`Expr`
+    :raises ValueError: if condition or operation is unknown
+
+    """
+    if isinstance(cond, Expr):
+        return cond
+    if isinstance(cond, dict):
+        return Contains(cond)
+    if isinstance(cond, (list, tuple)):
+        return And(*[Key(attr, strict=True).op(op, value)
+                     for attr, op, value in cond])
+    raise ValueError('Unknown condition "{}"'.format(cond))
+
+
+def compile_where(klass, *conds):
+    """
+    Compiles conditions to ``WHERE`` clause ``OR`` ing them
+
+    :param klass:   :class:`Entity <jukoro.pg.entity.AbstractEntity>`
+                    to get attributes casts from
+    :param conds:   list of conditions (see :func:`as_expr`)
+    :returns:       sql (empty if there are no conditions) and parameters
+    :rtype:         ``tuple`` in form ``(str, list)``
+
+    """
+    if not conds:
+        return '', []
+    exprs = [as_expr(x) for x in conds]
+    # top level single condition needs own parentheses
+    exprs = [And(x) if isinstance(x, Cond) else x for x in exprs]
+    params = []
+    for x in exprs:
+        x.collect(params)
+    key = ('where', klass) + tuple(x.shape for x in exprs)
+    sql = cache.get(key, lambda: ' WHERE %s' % ' OR '.join(
+        x.sql(klass) for x in exprs))
+    return sql, params
@@ -5,7 +5,7 @@ Provides a way to introspect database and returns its current state for:
 - schemas
 - sequences
 - tables
-- views
+- views (and views comments)
 - triggers
 - indices
 - constraints
@@ -97,6 +97,21 @@ WHERE
     table_schema = %(schema)s;
 """
 
+_VIEW_COMMENTS = """
+SELECT
+    c.relname || '=' || obj_description(c.oid, 'pg_class') as qname
+FROM
+    pg_class AS c
+JOIN
+    pg_namespace AS n ON n.oid = c.relnamespace
+WHERE
+    c.relkind = 'v'
+AND
+    obj_description(c.oid, 'pg_class') IS NOT NULL
+AND
+    n.nspname = %(schema)s;
+"""
+
 _TRIGGERS = """
 SELECT
     trigger_name as qname
@@ -148,6 +163,7 @@ INTROMAP = OrderedDict(
     sequences=_SEQUENCES,
     tables=_TABLES,
     views=_VIEWS,
+    view_comments=_VIEW_COMMENTS,
     triggers=_TRIGGERS,
     indices=_INDICES,
     constraints=_CONSTRAINTS,
@@ -190,7 +206,8 @@ class PgIntrospect(object):
 class StateValues(object):
     """
     Acts as a container for current database state for specific type
-    (one of schemas/sequences/tables/views/triggers/indices/constraints)
+    (one of schemas/sequences/tables/views/view_comments/triggers/indices/
+    constraints)
 
     :param values:  list of values retrieved from database using
                     :class:`~jukoro.pg.introspect.PgIntrospect`
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+Provides batched loader of entities by ids with request-scoped identity map
+(in a manner of DataLoader)
+
+- :class:`~jukoro.pg.loader.EntityLoader` - collects ids of entities to load
+  per :class:`Entity <jukoro.pg.entity.AbstractEntity>` class and loads them
+  using one (chunked) ``"entity_id" = ANY(%s)`` query per class when some of
+  them is requested, keeps loaded entities for the rest of the request
+
+Loader is expected to live as long as a unit of work (request) does and
+does not track entities changes, use
+:meth:`~jukoro.pg.loader.EntityLoader.prime` to put saved entity into
+identity map.
+
+Example
+-------
+
+.. code-block:: python
+
+    from jukoro import pg
+
+    from project.entities import Order, Customer
+
+
+    with pool.transaction() as cursor:
+        loader = pg.EntityLoader(cursor)
+        q, params = Order.qbuilder.select({'status': 'new'})
+        orders = [Order(**x) for x in cursor.execute(q, params).all()]
+        # single query to load all customers of orders
+        customers = loader.resolve(orders, 'customer', Customer)
+
+        # deferred ids are loaded in one query on first request
+        loader.defer(Customer, 11, 12, 13)
+        customer = loader.get(Customer, 12)
+
+"""
+
+from jukoro.structures import ObjectDict
+from jukoro.utils import chunks
+
+from jukoro.pg.exceptions import DoesNotExist
+from jukoro.pg.expr import Key
+from jukoro.pg.query import CHUNK_SIZE
+
+
+# identity map value for ids having no live entity in database
+_MISSING = object()
+
+
+class EntityLoader(object):
+    """
+    Batched loader of entities by ids with identity map
+
+    :param cursor:      instance of
+                        :class:`PgTransaction <jukoro.pg.db.PgTransaction>`
+    :param chunk_size:  maximum number of ids per query
+
+    """
+    __slots__ = ('_cursor', '_chunk_size', '_pending', '_map', '_stats')
+
+    def __init__(self, cursor, chunk_size=CHUNK_SIZE):
+        self._cursor = cursor
+        self._chunk_size = chunk_size
+        self._pending = {}
+        self._map = {}
+        self._stats = ObjectDict(queries=0, loaded=0, hits=0, misses=0)
+
+    def __len__(self):
+        return len(self._map)
+
+    @property
+    def stats(self):
+        """
+        Returns loader counters: ``queries`` executed, entities ``loaded``,
+        identity map ``hits`` and ``misses`` for requested ids
+
+        :rtype: :class:`~jukoro.structures.ObjectDict`
+
+        """
+        return ObjectDict(self._stats)
+
+    def defer(self, klass, *ids):
+        """
+        Schedules entities to be loaded with the next query for ``klass``
+        (duplicates and already loaded ids are skipped)
+
+        :param klass:   :class:`Entity <jukoro.pg.entity.AbstractEntity>`
+                        class
+        :param ids:     entities ids
+
+        """
+        pending = self._pending.setdefault(klass, [])
+        seen = set(pending)
+        for entity_id in ids:
+            if entity_id is None or entity_id in seen or \
+                    (klass, entity_id) in self._map:
+                continue
+            seen.add(entity_id)
+            pending.append(entity_id)
+
+    def get(self, klass, entity_id):
+        """
+        Returns entity by id loading it together with all deferred entities
+        of the same class
+
+        :param klass:           :class:`Entity
+                                <jukoro.pg.entity.AbstractEntity>` class
+        :param entity_id:       entity id
+        :returns:               loaded entity
+        :rtype:                 ``klass``
+        :raises DoesNotExist:   if there is no live entity with such id
+
+        """
+        entity = self.get_many(klass, [entity_id])[0]
+        if entity is None:
+            raise DoesNotExist(
+                '{} with id {} does not exist'.format(klass.__name__,
+                                                      entity_id))
+        return entity
+
+    def get_many(self, klass, ids):
+        """
+        Returns entities by ids loading them together with all deferred
+        entities of the same class
+
+        :param klass:   :class:`Entity <jukoro.pg.entity.AbstractEntity>`
+                        class
+        :param ids:     entities ids
+        :returns:       entities in the same order as ``ids`` (``None`` for
+                        ids having no live entity or being ``None``)
+        :rtype:         list
+
+        """
+        ids = list(ids)
+        self.defer(klass, *ids)
+        self._dispatch(klass)
+        stats, res = self._stats, []
+        for entity_id in ids:
+            entity = self._map.get((klass, entity_id), _MISSING)
+            if entity is _MISSING:
+                stats.misses += 1
+                entity = None
+            else:
+                stats.hits += 1
+            res.append(entity)
+        return res
+
+    def resolve(self, entities, attr, klass):
+        """
+        Loads entities referenced by ``attr`` attribute of ``entities``
+        (reference is stored as id, see
+        :meth:`AbstractEntity.db_val
+        <jukoro.pg.entity.AbstractEntity.db_val>`)
+
+        :param entities:    list of entities having references
+        :param attr:        attribute name keeping reference
+        :param klass:       :class:`Entity <jukoro.pg.entity.AbstractEntity>`
+                            class of referenced entities
+        :returns:           referenced entities in the same order as
+                            ``entities`` (``None`` for empty or broken
+                            references)
+        :rtype:             list
+
+        """
+        return self.get_many(klass, [x.doc.get(attr) for x in entities])
+
+    def prime(self, *entities):
+        """
+        Puts entities into identity map (replacing previously loaded ones)
+
+        :param entities:    instances of
+                            :class:`Entity <jukoro.pg.entity.AbstractEntity>`
+                            having ``entity_id`` defined
+
+        """
+        for entity in entities:
+            self._map[(type(entity), entity.entity_id)] = entity
+
+    def forget(self, klass, *ids):
+        """
+        Removes entities from identity map (or all entities of ``klass`` if
+        ``ids`` are not specified) to load them again on request
+
+        :param klass:   :class:`Entity <jukoro.pg.entity.AbstractEntity>`
+                        class
+        :param ids:     entities ids
+
+        """
+        if not ids:
+            ids = [k[1] for k in self._map if k[0] is klass]
+        for entity_id in ids:
+            self._map.pop((klass, entity_id), None)
+
+    def clear(self):
+        """
+        Clears identity map and deferred ids
+
+        """
+        self._pending.clear()
+        self._map.clear()
+
+    def _dispatch(self, klass):
+        # loads deferred entities of klass using one query per chunk
+        ids = self._pending.pop(klass, None)
+        if not ids:
+            return
+        stats = self._stats
+        for chunk in chunks(ids, self._chunk_size):
+            q, params = klass.qbuilder.select(Key('entity_id').in_(chunk))
+            entities = list(self._cursor.execute(q, params).entities(klass))
+            stats.queries += 1
+            stats.loaded += len(entities)
+            for entity in entities:
+                self._map[(klass, entity.entity_id)] = entity
+            for entity_id in chunk:
+                self._map.setdefault((klass, entity_id), _MISSING)
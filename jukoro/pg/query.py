@@ -5,13 +5,14 @@ Provides simplified abstractions to create CRUD queries
 - :class:`~jukoro.pg.query.QueryViewBuilder` - query builder expected to work
   with "live" database data (see :mod:`jukoro.pg.storage` for storage
   mechanics)
+- :class:`~jukoro.pg.query.QueryAsOfBuilder` - read only query builder to
+  work with entities versions valid at some point in time
 - :class:`~jukoro.pg.query.QueryBuilderDescr` - Python descriptor to provide
   access from :class:`Entity <jukoro.pg.entity.AbstractEntity>` to
   :class:`QueryBuilder <jukoro.pg.query.QueryViewBuilder>`
 
 Roadmap:
 
-- way to work with historical data in read only mode
 - way to namespace fields within query
 - way to nest queries
 
@@ -65,8 +66,8 @@ Usage example:
 
     In [7]: User.qbuilder.by_id(11, 12, 13)
     Out[7]:
-    ('SELECT "entity_id","doc" FROM "ju_user__live" WHERE "entity_id" IN %s ORDER BY "entity_id" ASC;',
-    ((11, 12, 13),))
+    ('SELECT "entity_id","doc" FROM "ju_user__live" WHERE "entity_id" = ANY(%s) ORDER BY "entity_id" ASC;',
+    ([11, 12, 13],))
 
     In [8]: User.qbuilder.select({'username': 'ysegorov'})
     Out[8]:
@@ -105,8 +106,97 @@ method to perform query.
 
 """
 
+import base64
+import re
+from collections import OrderedDict
+
+from jukoro import json
+from jukoro.structures import ObjectDict
+from jukoro.utils import chunks
+
+from jukoro.pg.attrs import AttrDescr, PATH_KEY
+from jukoro.pg.exceptions import ReadOnly
+from jukoro.pg.expr import cache, compile_where
+from jukoro.pg.storage import LIVE
+
+
+# default number of entities per query for bulk operations
+CHUNK_SIZE = 1000
+
+# queries to load entities using COPY into staging table
+SQL_LOAD_CREATE = """
+CREATE TEMPORARY TABLE IF NOT EXISTS "{staging}" ("doc" jsonb NOT NULL);
+TRUNCATE "{staging}";
+"""
+SQL_LOAD_COPY = 'COPY "{staging}" ("doc") FROM STDIN;'
+SQL_LOAD_INSERT = """
+INSERT INTO "{db_table}" ("doc")
+    SELECT public.jsonb_merge_key_value_pairs(
+            s."doc", '_created', ts."v", '_updated', ts."v")
+        FROM "{staging}" AS s,
+            (SELECT public.current_timestamp_to_iso8601() AS "v") AS ts;
+"""
+SQL_LOAD_DROP = 'DROP TABLE "{staging}";'
+
+# query to update entities in database table bypassing view triggers, closes
+# live versions and inserts new ones (same as TRIGGER_UPDATE does per row)
+SQL_BULK_UPDATE = """
+WITH v ("entity_id", "doc") AS (VALUES {placeholders}),
+closed AS (
+    UPDATE "{db_table}" AS t SET "entity_end" = CURRENT_TIMESTAMP
+        FROM v
+        WHERE t."entity_id" = v."entity_id"
+            AND t."entity_start" <= now() AND t.{live}
+        RETURNING t."entity_id")
+INSERT INTO "{db_table}" ("entity_id", "doc")
+    SELECT v."entity_id", public.jsonb_merge_key_value_pairs(
+            v."doc", '_updated', public.current_timestamp_to_iso8601())
+        FROM v JOIN closed ON closed."entity_id" = v."entity_id"
+    RETURNING {fields};
+"""
+# the same for entities keeping closed versions in history table (moves
+# live versions to history table as TRIGGER_UPDATE_HISTORY does per row)
+SQL_BULK_UPDATE_HISTORY = """
+WITH v ("entity_id", "doc") AS (VALUES {placeholders}),
+closed AS (
+    DELETE FROM "{db_table}" AS t USING v
+        WHERE t."entity_id" = v."entity_id"
+            AND t."entity_start" <= now() AND t.{live}
+        RETURNING t.*),
+moved AS (
+    INSERT INTO "{db_history}"
+            ("id", "entity_id", "entity_start", "entity_end", "doc")
+        SELECT "id", "entity_id", "entity_start", CURRENT_TIMESTAMP, "doc"
+            FROM closed)
+INSERT INTO "{db_table}" ("entity_id", "doc")
+    SELECT v."entity_id", public.jsonb_merge_key_value_pairs(
+            v."doc", '_updated', public.current_timestamp_to_iso8601())
+        FROM v JOIN closed ON closed."entity_id" = v."entity_id"
+    RETURNING {fields};
+"""
+
+# fields to select entity versions by
+VERSION_FIELDS = '"entity_id","doc","entity_start","entity_end"'
+# entity versions valid at some point in time (range predicates match
+# ("entity_id", "entity_start", "entity_end" DESC) index)
+SQL_AS_OF = 'SELECT * FROM "{db_table}" ' \
+    'WHERE "entity_start" <= {ts} AND "entity_end" > {ts}'
+
+# supported aggregate functions
+AGGREGATES = ('count', 'sum', 'min', 'max', 'avg')
+# valid aggregate result field name
+IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+# fields and COPY options to export rows, ndjson is exported as csv using
+# quote and delimiter characters never met in jsonb text representation to
+# avoid escaping
+EXPORT_FORMATS = {
+    'ndjson': ('json_build_object(\'entity_id\', "entity_id", '
+               '\'doc\', "doc")',
+               'FORMAT csv, QUOTE e\'\\x01\', DELIMITER e\'\\x02\''),
+    'csv': ('"entity_id","doc"', 'FORMAT csv, HEADER true'),
+}
 
-# TODO become really query builder
 
 class QueryViewBuilder(object):
     """
@@ -136,30 +226,62 @@ class QueryViewBuilder(object):
         """
         return '"%s"' % '","'.join(['entity_id', 'doc'])
 
-    def by_id(self, *ids):
+    def projection(self, only=None):
+        """
+        Returns fields to select only named ``doc`` attributes (``doc`` is
+        built server-side using ``jsonb_build_object``, so rows keep
+        ``entity_id`` and ``doc`` keys and have ``partial`` key set to
+        ``true``)
+
+        :param only:    list of attributes names to select (all fields are
+                        selected if empty)
+        :rtype:         string
+        :raises ValueError: if attribute name does not match
+                            :data:`~jukoro.pg.attrs.PATH_KEY`
+
+        Missed attributes get ``null`` values in projected ``doc``
+
+        """
+        if not only:
+            return self.fields
+        if isinstance(only, basestring):
+            only = (only, )
+        if not all(isinstance(x, basestring) and PATH_KEY.match(x)
+                   for x in only):
+            raise ValueError(
+                'Attributes names must match "{}"'.format(PATH_KEY.pattern))
+        pairs = ('\'{0}\', "doc"->\'{0}\''.format(x) for x in only)
+        return '"entity_id",jsonb_build_object({}) AS "doc",' \
+            'true AS "partial"'.format(', '.join(pairs))
+
+    def by_id(self, *ids, **kwargs):
         """
         Creates query to select row/rows from database view by
         entity_id/multiple ids
 
-        Respects number of ``ids`` to create query using ``IN`` operator
-        or ``=``
+        Respects number of ``ids`` to create query using ``= ANY``
+        operator or ``=``
 
-        :param ids:     list of ``ids`` to select rows by
-        :returns:       query and query parameters
-        :rtype:         ``tuple`` in form ``(str, tuple)``
+        :param ids:             list of ``ids`` to select rows by
+        :param kwargs['only']:  list of attributes to select (see
+                                :meth:`projection`)
+        :returns:               query and query parameters
+        :rtype:                 ``tuple`` in form ``(str, tuple)``
+
+        Several ``ids`` are passed as one array parameter so query text
+        does not depend on number of ``ids``
 
         """
-        # TODO chunks
         if not ids or not all(ids):
             raise ValueError(
                 'at least one "entity_id" must be defined to get instance')
-        target = self._target
-        op = '=' if len(ids) == 1 else 'IN'
-        params = ids if len(ids) == 1 else (ids, )
-        where = 'WHERE "entity_id" {op} %s'.format(op=op)
-        q = 'SELECT {fields} FROM "{target}" {where} ORDER BY "entity_id" ASC;'
-        q = q.format(target=target, fields=self.fields, where=where)
-        return (q, params)
+        source, params = self._source()
+        params.append(ids[0] if len(ids) == 1 else list(ids))
+        where = _where_ids(len(ids))
+        fields = self.projection(kwargs.get('only'))
+        q = 'SELECT {fields} FROM {source} {where} ORDER BY "entity_id" ASC;'
+        q = q.format(source=source, fields=fields, where=where)
+        return (q, tuple(params))
 
     def create(self, *entities):
         """
@@ -173,8 +295,9 @@ class QueryViewBuilder(object):
         :returns:           query and query parameters
         :rtype:             ``tuple`` in form ``(str, list)``
 
+        Use :meth:`create_chunks` to create large number of entities
+
         """
-        # TODO chunks
         target = self._target
         placeholders = ','.join(['(%s)'] * len(entities))
         params = [x.doc for x in entities]
@@ -184,6 +307,44 @@ class QueryViewBuilder(object):
             target=target, fields=self.fields, placeholders=placeholders)
         return (q, params)
 
+    def create_chunks(self, entities, chunk_size=CHUNK_SIZE):
+        """
+        Creates queries to create rows in database view splitting entities
+        to chunks of ``chunk_size`` (see :meth:`create`)
+
+        Entities are consumed lazily so ``entities`` can be a generator
+
+        :param entities:    iterable of instances of
+                            :class:`Entity <jukoro.pg.entity.AbstractEntity>`
+        :param chunk_size:  maximum number of entities per query
+        :returns:           generator of query and query parameters
+        :rtype:             generator of ``tuple`` in form ``(str, list)``
+
+        """
+        for chunk in chunks(entities, chunk_size):
+            yield self.create(*chunk)
+
+    def load(self):
+        """
+        Creates queries to load entities into database table bypassing
+        view triggers: ``COPY`` into temporary staging table and single
+        ``INSERT ... SELECT`` filling ``_created`` and ``_updated``
+        attributes (``entity_id`` and ``entity_start`` get default values)
+
+        :returns:   queries to create (or truncate) staging table
+                    (``create``), to copy data into it (``copy_from``), to
+                    move data to database table (``insert``) and to drop
+                    staging table (``drop``)
+        :rtype:     :class:`~jukoro.structures.ObjectDict`
+
+        """
+        names = {'db_table': self._klass.db_table.name}
+        names['staging'] = 'ju_load__{}'.format(names['db_table'])
+        return ObjectDict(create=SQL_LOAD_CREATE.format(**names),
+                          copy_from=SQL_LOAD_COPY.format(**names),
+                          insert=SQL_LOAD_INSERT.format(**names),
+                          drop=SQL_LOAD_DROP.format(**names))
+
     def update(self, *entities):
         """
         Creates query to update row/rows in database view returning updated
@@ -202,8 +363,12 @@ class QueryViewBuilder(object):
         end-of-live timestamp and new value will be created storing entity's
         start-of-live timestamp)
 
+        Partial entities (see :meth:`projection`) can not be updated
+
+        Use :meth:`update_chunks` to update large number of entities
+
         """
-        # TODO chunks
+        _check_partial(entities)
         target = self._target
         placeholders, params = [], []
         q = 'UPDATE "{target}" AS t SET "doc" = (v."doc")::jsonb ' \
@@ -211,17 +376,98 @@ class QueryViewBuilder(object):
             'WHERE v."entity_id" = t."entity_id" ' \
             'RETURNING t."entity_id", t."doc";'
         for entity in entities:
-            placeholders.append('(%s, %s)')
+            # explicit casts to have parameters types known for prepared
+            # statement
+            placeholders.append('(%s::bigint, %s::jsonb)')
             params.extend([entity.entity_id, entity.doc])
         q = q.format(target=target, placeholders=','.join(placeholders))
         return (q, params)
 
+    def update_chunks(self, entities, chunk_size=CHUNK_SIZE):
+        """
+        Creates queries to update rows in database view splitting entities
+        to chunks of ``chunk_size`` (see :meth:`update`)
+
+        Entities are consumed lazily so ``entities`` can be a generator
+
+        :param entities:    iterable of instances of
+                            :class:`Entity <jukoro.pg.entity.AbstractEntity>`
+        :param chunk_size:  maximum number of entities per query
+        :returns:           generator of query and query parameters
+        :rtype:             generator of ``tuple`` in form ``(str, list)``
+
+        """
+        for chunk in chunks(entities, chunk_size):
+            yield self.update(*chunk)
+
+    def bulk_update(self, *entities):
+        """
+        Creates query to update rows in database table bypassing view
+        triggers: live versions of entities are closed and new versions are
+        inserted using two set-based statements (combined in one query using
+        ``WITH``), history is kept the same way as with :meth:`update`
+        (closed versions are moved to history table if entity has
+        ``db_history`` defined)
+
+        Entities without live version are skipped, if ``entity_id`` is met
+        several times the last entity wins, partial entities (see
+        :meth:`projection`) can not be updated
+
+        :param entities:    list of instances of
+                            :class:`Entity <jukoro.pg.entity.AbstractEntity>`
+                            (or of any other type having accessible and
+                            jsonable ``.entity_id`` and ``.doc`` attributes)
+        :returns:           query and query parameters
+        :rtype:             ``tuple`` in form ``(str, list)``
+        :raises ValueError: if ``not entities or
+                            not all(x.entity_id in entities)`` or some of
+                            entities are partial
+
+        Use :meth:`bulk_update_chunks` to update large number of entities
+
+        """
+        if not entities or not all(x.entity_id for x in entities):
+            raise ValueError(
+                'All entities to update must have "entity_id" defined')
+        _check_partial(entities)
+        docs = OrderedDict((x.entity_id, x.doc) for x in entities)
+        params = []
+        for entity_id, doc in docs.iteritems():
+            params.extend([entity_id, doc])
+        placeholders = ','.join(['(%s::bigint, %s::jsonb)'] * len(docs))
+        klass, tmpl, kwargs = self._klass, SQL_BULK_UPDATE, {}
+        if klass.db_history is not None:
+            tmpl = SQL_BULK_UPDATE_HISTORY
+            kwargs['db_history'] = klass.db_history.name
+        q = tmpl.format(db_table=klass.db_table.name,
+                        fields=self.fields,
+                        placeholders=placeholders,
+                        live=LIVE, **kwargs)
+        return (q.strip(), params)
+
+    def bulk_update_chunks(self, entities, chunk_size=CHUNK_SIZE):
+        """
+        Creates queries to update rows in database table splitting entities
+        to chunks of ``chunk_size`` (see :meth:`bulk_update`)
+
+        Entities are consumed lazily so ``entities`` can be a generator
+
+        :param entities:    iterable of instances of
+                            :class:`Entity <jukoro.pg.entity.AbstractEntity>`
+        :param chunk_size:  maximum number of entities per query
+        :returns:           generator of query and query parameters
+        :rtype:             generator of ``tuple`` in form ``(str, list)``
+
+        """
+        for chunk in chunks(entities, chunk_size):
+            yield self.bulk_update(*chunk)
+
     def delete(self, *entities):
         """
         Creates query to delete row/rows from database view
 
-        Respects number of ``entities`` to create query using ``IN`` operator
-        or ``=``
+        Respects number of ``entities`` to create query using ``= ANY``
+        operator or ``=``
 
         :param entities:    list of instances of
                             :class:`Entity <jukoro.pg.entity.AbstractEntity>`
@@ -232,19 +478,18 @@ class QueryViewBuilder(object):
         :raises ValueError: if ``not entities or
                             not all(x.entity_id in entities)``
 
+        Several ``entity_id`` are passed as one array parameter so query
+        text does not depend on number of ``entities``
+
         """
-        # TODO chunks
         entities = filter(None, entities)
         if not entities or not all(x.entity_id for x in entities):
             raise ValueError(
                 'All entities to delete must have "entity_id" defined')
         target = self._target
-        op = '=' if len(entities) == 1 else 'IN'
-        params = tuple(x.entity_id for x in entities)
-        if len(entities) > 1:
-            # it must be only one parameter
-            params = (params, )
-        where = 'WHERE "entity_id" {op} %s'.format(op=op)
+        ids = [x.entity_id for x in entities]
+        params = (ids[0] if len(ids) == 1 else ids, )
+        where = _where_ids(len(ids))
         q = 'DELETE FROM "{target}" {where};'
         q = q.format(target=target, where=where)
         return (q, params)
@@ -260,6 +505,8 @@ class QueryViewBuilder(object):
                                     (see below for supported formats)
         :param kwargs['limit']:     limit number of returned rows to
         :param kwargs['offset']:    offset returned rows by
+        :param kwargs['only']:      list of attributes to select (see
+                                    :meth:`projection`)
 
         Let's assume ``cond`` is a single condition and::
 
@@ -305,6 +552,15 @@ class QueryViewBuilder(object):
 
             (t1 AND t2)
 
+        - expression (instance of :class:`~jukoro.pg.expr.Expr`) for nested
+          ``AND``/``OR``/``NOT`` conditions, ``IS NULL``, ``LIKE``,
+          ``BETWEEN``, ``jsonb`` path and exists tests (see
+          :mod:`jukoro.pg.expr`)
+
+        Query sql is cached per conditions shape (see
+        :class:`~jukoro.pg.expr.SqlCache`) so repeated calls only collect
+        parameters
+
         Conditions examples:
 
         .. code-block:: ipythonconsole
@@ -342,27 +598,395 @@ class QueryViewBuilder(object):
             order_by=['attr1', '-attr2']
 
         """
-        target, fields = self._target, self.fields
-        q = 'SELECT {fields} FROM "{target}"' \
-            '{where}{order_by}{limit}{offset}'
+        fields = self.projection(kwargs.pop('only', None))
+        return self._select(fields, *conds, **kwargs)
+
+    def page(self, *conds, **kwargs):
+        """
+        Creates query to select page of rows from database view using
+        keyset (seek) pagination instead of ``OFFSET``
+
+        :param conds:               list of conditions to select rows by
+                                    (see :meth:`select`)
+        :param kwargs['order_by']:  rules to order data by (see
+                                    :meth:`select`), only ``entity_id`` and
+                                    ``NOT NULL`` entity attributes are
+                                    supported, ``entity_id`` is added as a
+                                    last key if not specified
+        :param kwargs['limit']:     page size (required, positive integer)
+        :param kwargs['after']:     continuation token (see
+                                    :meth:`page_token`) to select rows
+                                    following last seen one
+        :param kwargs['only']:      list of attributes to select (see
+                                    :meth:`projection`), attributes from
+                                    ``order_by`` are added to it
+        :returns:                   query and query parameters
+        :rtype:                     ``tuple`` in form ``(str, list)``
+        :raises ValueError:         if ``limit`` is missed or is not a
+                                    positive integer, ``order_by`` contains
+                                    unsupported attributes or token does not
+                                    match ``order_by``
+
+        If all keys have the same sorting direction seek predicate is
+        a row comparison (``("k1", "entity_id") > (%s, %s)``) suitable for
+        btree indices
+
+        """
+        limit = page_limit(kwargs.get('limit'))
+        keys = _page_keys(self._klass, kwargs.pop('order_by', []))
+        source, params = self._source()
+        where, values = _transform_conditions(self._klass, *conds)
+        params.extend(values)
+        after = kwargs.pop('after', None)
+        if after is not None:
+            seek, values = _transform_seek(keys, _decode_token(keys, after))
+            if where:
+                where = ' WHERE ({}) AND {}'.format(
+                    where[len(' WHERE '):], seek)
+            else:
+                where = ' WHERE {}'.format(seek)
+            params.extend(values)
+        order_by = ' ORDER BY %s' % ', '.join(
+            '{} {}'.format(expr, 'DESC' if desc else 'ASC')
+            for __, expr, desc in keys)
+        q = 'SELECT {fields} FROM {source}{where}{order_by} LIMIT %s;'
+        only = kwargs.get('only')
+        if only:
+            if isinstance(only, basestring):
+                only = (only, )
+            # keys are needed to create continuation token
+            only = list(only) + [x[0] for x in keys
+                                 if x[0] != 'entity_id' and x[0] not in only]
+        q = q.format(fields=self.projection(only),
+                     source=source, where=where, order_by=order_by)
+        params.append(limit)
+        return (q, params)
+
+    def page_token(self, row, order_by=None):
+        """
+        Creates opaque continuation token for :meth:`page` from last seen
+        row
+
+        :param row:         last seen row (dict having ``entity_id`` and
+                            ``doc`` keys, ``namedtuple`` or plain ``tuple``
+                            starting with ``entity_id`` and ``doc`` values,
+                            see ``row_factory`` parameter of
+                            :class:`PgTransaction
+                            <jukoro.pg.db.PgTransaction>`) or instance of
+                            :class:`Entity <jukoro.pg.entity.AbstractEntity>`
+        :param order_by:    rules data was ordered by (must be the same as
+                            for :meth:`page`)
+        :returns:           continuation token
+        :rtype:             str
+
+        """
+        if isinstance(row, dict):
+            entity_id, doc = row['entity_id'], row['doc']
+        elif hasattr(row, 'entity_id'):
+            entity_id, doc = row.entity_id, row.doc
+        else:
+            # plain tuple row has "entity_id" and "doc" fields first (see
+            # fields and projection)
+            entity_id, doc = row[0], row[1]
+        keys = _page_keys(self._klass, order_by)
+        values = [entity_id if name == 'entity_id' else doc.get(name)
+                  for name, __, __ in keys]
+        return _encode_token(keys, values)
+
+    def count(self, *conds):
+        """
+        Creates query to count rows in database view
+
+        :param conds:   list of conditions to count rows by
+                        (see :meth:`select`)
+        :returns:       query (returning ``count`` field) and query
+                        parameters
+        :rtype:         ``tuple`` in form ``(str, list)``
+
+        """
+        where, params = self._where(*conds)
+        q = 'SELECT COUNT(*) AS "count" FROM {source}{where};'
+        return (q.format(source=self._source()[0], where=where), params)
+
+    def estimate(self, *conds):
+        """
+        Creates query to estimate number of rows in database view without
+        scanning it (``EXPLAIN`` using planner statistics, see
+        :func:`plan_rows` to get estimate from query result)
+
+        :param conds:   list of conditions to estimate rows by
+                        (see :meth:`select`)
+        :returns:       query and query parameters
+        :rtype:         ``tuple`` in form ``(str, list)``
+
+        Estimate is as good as table statistics are (``ANALYZE``)
+
+        """
+        where, params = self._where(*conds)
+        q = 'EXPLAIN (FORMAT JSON) SELECT 1 FROM {source}{where};'
+        return (q.format(source=self._source()[0], where=where), params)
+
+    def exists(self, *conds):
+        """
+        Creates query to test if there are rows in database view
 
-        where, params = _transform_conditions(self._klass, *conds)
-        order_by = _transform_order_by(self._klass,
-                                       kwargs.pop('order_by', []))
-        limit, offset = '', ''
+        :param conds:   list of conditions to test rows by
+                        (see :meth:`select`)
+        :returns:       query (returning ``exists`` field) and query
+                        parameters
+        :rtype:         ``tuple`` in form ``(str, list)``
 
-        if 'limit' in kwargs:
-            limit = ' LIMIT %s '
+        """
+        where, params = self._where(*conds)
+        q = 'SELECT EXISTS (SELECT 1 FROM {source}{where}) AS "exists";'
+        return (q.format(source=self._source()[0], where=where), params)
+
+    def aggregate(self, aggregates, *conds, **kwargs):
+        """
+        Creates query to aggregate rows in database view
+
+        :param aggregates:          dictionary with result field name as a
+                                    key and ``(function, attribute)`` pair
+                                    as a value, where function is one of
+                                    ``count``, ``sum``, ``min``, ``max``,
+                                    ``avg`` and attribute can be ``None``
+                                    for ``count``
+        :param conds:               list of conditions to select rows by
+                                    (see :meth:`select`)
+        :param kwargs['group_by']:  attribute or list of attributes to group
+                                    rows by (result rows have fields named
+                                    after attributes and are ordered by
+                                    them)
+        :returns:                   query and query parameters
+        :rtype:                     ``tuple`` in form ``(str, list)``
+        :raises ValueError:         if aggregate function or attribute is
+                                    unknown, result field name is not a
+                                    valid identifier or there are no
+                                    aggregates
+
+        Attribute values are casted according to
+        :attr:`~jukoro.pg.attrs.Attr.db_cast`, for example::
+
+            qb.aggregate({'total': ('sum', 'amount'), 'cnt': ('count', None)},
+                         {'active': True}, group_by='country')
+
+        """
+        if not aggregates:
+            raise ValueError('At least one aggregate expected')
+        group_by = kwargs.pop('group_by', None) or ()
+        if isinstance(group_by, basestring):
+            group_by = (group_by, )
+        where, params = self._where(*conds)
+        fields = []
+        for attr in group_by:
+            fields.append('{} AS "{}"'.format(self._cast(attr), attr))
+        for name, (fn, attr) in sorted(aggregates.iteritems()):
+            if fn not in AGGREGATES:
+                raise ValueError('Unknown aggregate "{}"'.format(fn))
+            if not isinstance(name, basestring) or not IDENTIFIER.match(name):
+                raise ValueError(
+                    'Invalid aggregate field name "{}"'.format(name))
+            value = '*' if attr is None else self._cast(attr)
+            fields.append('{}({}) AS "{}"'.format(fn.upper(), value, name))
+        q = 'SELECT {fields} FROM {source}{where}{group_by};'
+        group_by = ', '.join(str(x + 1) for x in xrange(len(group_by)))
+        if group_by:
+            group_by = ' GROUP BY {0} ORDER BY {0}'.format(group_by)
+        q = q.format(fields=', '.join(fields), source=self._source()[0],
+                     where=where, group_by=group_by)
+        return (q, params)
+
+    def _cast(self, attr):
+        # casted attribute value
+        descr = getattr(self._klass, attr, None) \
+            if isinstance(attr, basestring) else None
+        if not isinstance(descr, AttrDescr):
+            raise ValueError('Unknown attribute "{}"'.format(attr))
+        return '("doc"->>\'{attr}\')::{cast}'.format(
+            attr=attr, cast=descr.db_cast)
+
+    def export(self, *conds, **kwargs):
+        """
+        Creates ``COPY ... TO STDOUT`` query to export rows from database
+        view (to be used with :meth:`PgTransaction.copy_expert
+        <jukoro.pg.db.PgTransaction.copy_expert>`)
+
+        :param conds:               list of conditions to select rows by
+                                    (see :meth:`select`)
+        :param kwargs['fmt']:       export format, ``ndjson`` (default, one
+                                    ``{"entity_id": ..., "doc": ...}`` json
+                                    object per line) or ``csv`` (with header
+                                    row, ``entity_id`` and ``doc`` columns)
+        :param kwargs['order_by']:  rules to order data by
+                                    (see :meth:`select`)
+        :param kwargs['limit']:     limit number of returned rows to
+        :param kwargs['offset']:    offset returned rows by
+        :returns:                   query and query parameters
+        :rtype:                     ``tuple`` in form ``(str, list)``
+        :raises ValueError:         if format is unknown
+
+        Query parameters must be bound client-side (``COPY`` does not
+        support them)
+
+        """
+        fmt = kwargs.pop('fmt', 'ndjson')
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError('Unknown export format "{}"'.format(fmt))
+        fields, options = EXPORT_FORMATS[fmt]
+        q, params = self._select(fields, *conds, **kwargs)
+        q = 'COPY ({q}) TO STDOUT WITH ({options});'.format(
+            q=q.rstrip(';'), options=options)
+        return (q, params)
+
+    def history(self, entity_id):
+        """
+        Creates query to select all versions of entity (including closed
+        and deleted ones) from database table ordered by ``entity_start``
+
+        :param entity_id:   entity id
+        :returns:           query (returning ``entity_id``, ``doc``,
+                            ``entity_start`` and ``entity_end`` fields) and
+                            query parameters
+        :rtype:             ``tuple`` in form ``(str, tuple)``
+
+        """
+        klass = self._klass
+        source = '"{}"'.format(klass.db_table.name)
+        if klass.db_history is not None:
+            source = '(SELECT * FROM {} UNION ALL SELECT * FROM "{}") ' \
+                'AS "versions"'.format(source, klass.db_history.name)
+        q = 'SELECT {fields} FROM {source} WHERE "entity_id" = %s ' \
+            'ORDER BY "entity_start" ASC;'
+        return (q.format(fields=VERSION_FIELDS, source=source), (entity_id, ))
+
+    def as_of(self, ts):
+        """
+        Returns read only query builder to select entities versions valid at
+        ``ts`` point in time (see :class:`QueryAsOfBuilder`)
+
+        :param ts:  ``datetime.datetime`` (or
+                    :class:`~jukoro.arrow.base.JuArrow`) point in time
+        :rtype:     :class:`QueryAsOfBuilder`
+
+        """
+        return QueryAsOfBuilder.for_entity(self._klass, ts)
+
+    def _source(self):
+        # sql to select rows from and its parameters
+        return '"{}"'.format(self._target), []
+
+    def _where(self, *conds):
+        # conditions prepended with source parameters
+        source, params = self._source()
+        where, values = _transform_conditions(self._klass, *conds)
+        params.extend(values)
+        return where, params
+
+    def _select(self, fields, *conds, **kwargs):
+        where, params = self._where(*conds)
+        order_by = kwargs.pop('order_by', [])
+        if isinstance(order_by, basestring):
+            order_by = (order_by, )
+        limit, offset = 'limit' in kwargs, 'offset' in kwargs
+        if limit:
             params.append(kwargs['limit'])
-        if 'offset' in kwargs:
-            offset = ' OFFSET %s '
+        if offset:
             params.append(kwargs['offset'])
-
-        q = q.format(target=target, fields=fields, where=where,
-                     order_by=order_by, limit=limit, offset=offset)
-        q = q.strip() + ';'
+        # sql text is cached per query shape (source depends on builder
+        # state, i.e. point in time placeholder of QueryAsOfBuilder)
+        source = self._source()[0]
+        key = ('select', type(self), source, self._klass, fields,
+               where, tuple(order_by), limit, offset)
+        q = cache.get(key, lambda: self._compile_select(
+            source, fields, where, order_by, limit, offset))
         return (q, params)
 
+    def _compile_select(self, source, fields, where, order_by, limit,
+                        offset):
+        q = 'SELECT {fields} FROM {source}' \
+            '{where}{order_by}{limit}{offset}'
+        q = q.format(source=source, fields=fields, where=where,
+                     order_by=_transform_order_by(self._klass, order_by),
+                     limit=' LIMIT %s ' if limit else '',
+                     offset=' OFFSET %s ' if offset else '')
+        return q.strip() + ';'
+
+
+def _read_only(self, *args, **kwargs):
+    raise ReadOnly('Query builder is read only')
+
+
+class QueryAsOfBuilder(QueryViewBuilder):
+    """
+    Read only query builder to select entities versions valid at some point
+    in time from database table (and history table if entity has
+    ``db_history`` defined) instead of ``*__live`` view
+
+    :param db_target:       database table name to create queries for
+    :param klass:           :class:`Entity <jukoro.pg.entity.AbstractEntity>`
+    :param kwargs['ts']:    ``datetime.datetime`` (or
+                            :class:`~jukoro.arrow.base.JuArrow`) point in
+                            time (optional, defaults to query time
+                            ``now()``)
+
+    Supports the same read queries as :class:`QueryViewBuilder` does
+    (:meth:`~QueryViewBuilder.by_id`, :meth:`~QueryViewBuilder.select`,
+    :meth:`~QueryViewBuilder.page`, :meth:`~QueryViewBuilder.count`, etc.)
+    and raises :class:`~jukoro.pg.exceptions.ReadOnly` for
+    create/update/delete queries
+
+    Example:
+
+    .. code-block:: ipythonconsole
+
+        In [1]: User.qbuilder.as_of(ts).by_id(11)
+        Out[1]:
+        ('SELECT "entity_id","doc" FROM (SELECT * FROM "ju_user" WHERE "entity_start" <= %s AND "entity_end" > %s) AS "ju_user" WHERE "entity_id" = %s ORDER BY "entity_id" ASC;',
+        (ts, ts, 11))
+
+    """
+
+    def __init__(self, db_target, klass, ts=None):
+        super(QueryAsOfBuilder, self).__init__(db_target, klass)
+        self._ts = ts
+
+    @classmethod
+    def for_entity(cls, klass, ts):
+        """
+        Returns query builder for entity table
+
+        :param klass:   :class:`Entity <jukoro.pg.entity.AbstractEntity>`
+        :param ts:      point in time
+        :rtype:         :class:`QueryAsOfBuilder`
+
+        """
+        return cls(klass.db_table.name, klass, ts=ts)
+
+    create = create_chunks = load = update = update_chunks = bulk_update = \
+        bulk_update_chunks = delete = _read_only
+
+    def as_of(self, ts):
+        """
+        Returns query builder for another point in time
+
+        :param ts:  point in time
+        :rtype:     :class:`QueryAsOfBuilder`
+
+        """
+        return type(self)(self._target, self._klass, ts=ts)
+
+    def _source(self):
+        klass, ts = self._klass, self._ts
+        placeholder = 'now()' if ts is None else '%s'
+        tables = [self._target]
+        if klass.db_history is not None:
+            tables.append(klass.db_history.name)
+        parts = [SQL_AS_OF.format(db_table=x, ts=placeholder) for x in tables]
+        source = '({}) AS "{}"'.format(' UNION ALL '.join(parts),
+                                       self._target)
+        params = [] if ts is None else [ts, ts] * len(parts)
+        return source, params
+
 
 class QueryBuilderDescr(object):
     """
@@ -399,23 +1023,6 @@ class QueryBuilderDescr(object):
         raise AttributeError
 
 
-OPS = {
-    'eq': '=',
-    'ne': '!=',
-    'in': 'IN',
-    'lt': '<',
-    'gt': '>',
-    'lte': '<=',
-    'gte': '>=',
-}
-
-
-def _transform_op(op):
-    if op not in OPS:
-        raise ValueError('Unknown operator "{}"'.format(op))
-    return OPS.get(op)
-
-
 def _transform_conditions(klass, *conditions):
     # examples for conditions and transformed sql results:
     #   - simple AND within dict and OR between dicts
@@ -431,42 +1038,13 @@ def _transform_conditions(klass, *conditions):
     #           (("doc"->>attr1)::INT <= val1) OR
     #               (("doc"->>attr2)::INT != val2)
     #
-    #   - complex OR with AND
-    #       (((attr1, 'lte', val1), (attr1, 'ne', val1_2)),
-    #        ((attr2, 'ne', val2), (attr2, 'gt', val2_2))) becomes
-    #           (("doc"->>attr1)::INT <= val1
-    #               AND
-    #            ("doc"->>attr1)::INT != val1_2)
-    #           OR
-    #           (("doc"->>attr2)::INT != val2
-    #               AND
-    #            ("doc"->>attr2)::INT > val2_2)
-
-    if not conditions:
-        return '', []
-    placeholders, params = [], []
-    for cond in conditions:
-        # cond must be a dict for simple AND
-        #   or tuple of tuples with condition triplets, i.e.
-        #   (triplet1, triplet2...)
-        #   where triplet is a tuple in form (attr, op, value)
-
-        # TODO own exception
-        if isinstance(cond, dict):
-            placeholders.append('("doc" @> %s)')
-            params.append(cond)
-        elif isinstance(cond, (list, tuple)):
-            block = []
-            for attr, op, value in cond:
-                op = _transform_op(op)
-                cast = (getattr(klass, attr)).db_cast
-                block.append(
-                    '("doc"->>\'{attr}\')::{cast} {op} %s'.format(
-                        attr=attr, cast=cast, op=op))
-                params.append(value)
-            placeholders.append('(%s)' % ' AND '.join(block))
-    placeholders = ' WHERE %s' % ' OR '.join(placeholders)
-    return placeholders, params
+    #   - expressions (see jukoro.pg.expr)
+    #       (Key(attr1) <= val1) | ~Key(attr2).is_null() becomes
+    #           ((("doc"->>attr1)::INT <= val1) OR
+    #               (NOT ("doc"->>attr2)::TEXT IS NULL))
+    #
+    # sql is cached per conditions shape
+    return compile_where(klass, *conditions)
 
 
 def _transform_order_by(klass, fields):
@@ -497,3 +1075,123 @@ def _transform_order_by(klass, fields):
             cast = (getattr(klass, attr)).db_cast
         res.append(spec.format(attr=attr, cast=cast, direction=direction))
     return ' ORDER BY %s' % ', '.join(res) if res else ''
+
+
+def plan_rows(row):
+    """
+    Returns estimated number of rows from result of query created by
+    :meth:`QueryViewBuilder.estimate`
+
+    :param row:     result row
+    :rtype:         int
+
+    """
+    return int(row['QUERY PLAN'][0]['Plan']['Plan Rows'])
+
+
+def page_limit(limit):
+    """
+    Returns page size checked to be a positive integer (see
+    :meth:`QueryViewBuilder.page`)
+
+    :param limit:       page size
+    :rtype:             int
+    :raises ValueError: if ``limit`` is missed or is not a positive integer
+
+    """
+    if isinstance(limit, bool) or not isinstance(limit, (int, long)) \
+            or limit < 1:
+        raise ValueError(
+            'Page "limit" must be a positive integer, got {!r}'.format(limit))
+    return limit
+
+
+def _where_ids(cnt):
+    # condition to match cnt ids, several ids are passed as one array
+    # parameter to keep the same query text (and prepared statement)
+    if cnt == 1:
+        return 'WHERE "entity_id" = %s'
+    return 'WHERE "entity_id" = ANY(%s)'
+
+
+def _check_partial(entities):
+    if any(getattr(x, 'partial', False) for x in entities):
+        raise ValueError(
+            'Unable to update partial entities (full "doc" is required)')
+
+
+def _page_keys(klass, fields):
+    """
+    :param klass:   AbstractEntity-based class
+    :param fields:  attribute or a list of attributes to sort by (see
+                    :func:`_transform_order_by`)
+    :returns:       list of ``(name, sql expression, descending)`` triplets
+                    ending with ``entity_id``
+
+    """
+    if isinstance(fields, basestring):
+        fields = (fields, )
+    res = []
+    fields = (x.strip() for x in fields or () if x.strip())
+    for attr in fields:
+        desc = attr[0] == '-'
+        attr = attr.lstrip('-')
+        if attr == 'entity_id':
+            res.append((attr, '"entity_id"', desc))
+            break
+        descr = getattr(klass, attr, None)
+        if not isinstance(descr, AttrDescr) or not descr.db_not_null:
+            raise ValueError(
+                'Unable to paginate by "{}", only "entity_id" and NOT NULL '
+                'attributes are supported'.format(attr))
+        expr = '("doc"->>\'{attr}\')::{cast}'.format(attr=attr,
+                                                     cast=descr.db_cast)
+        res.append((attr, expr, desc))
+    else:
+        # entity_id as a tie-breaker keeping keys order unique
+        desc = bool(res) and all(x[2] for x in res)
+        res.append(('entity_id', '"entity_id"', desc))
+    return res
+
+
+def _transform_seek(keys, values):
+    """
+    :param keys:    keys from :func:`_page_keys`
+    :param values:  last seen values of keys
+    :returns:       sql predicate selecting rows following last seen one
+                    and its parameters
+
+    """
+    directions = set(desc for __, __, desc in keys)
+    if len(directions) == 1:
+        # row comparison can use (multicolumn) btree index
+        op = '<' if directions.pop() else '>'
+        placeholders = ', '.join(['%s'] * len(keys))
+        q = '({}) {} ({})'.format(', '.join(x[1] for x in keys),
+                                  op, placeholders)
+        return q, list(values)
+    # mixed directions, expand to
+    #   (k1 > v1) OR (k1 = v1 AND k2 < v2) OR ...
+    blocks, params = [], []
+    for idx, (__, expr, desc) in enumerate(keys):
+        block = ['{} = %s'.format(x[1]) for x in keys[:idx]]
+        block.append('{} {} %s'.format(expr, '<' if desc else '>'))
+        blocks.append('(%s)' % ' AND '.join(block))
+        params.extend(values[:idx + 1])
+    return '(%s)' % ' OR '.join(blocks), params
+
+
+def _encode_token(keys, values):
+    order = [('-' if desc else '') + name for name, __, desc in keys]
+    return base64.urlsafe_b64encode(json.dumps([order, values]))
+
+
+def _decode_token(keys, token):
+    try:
+        order, values = json.loads(base64.urlsafe_b64decode(str(token)))
+    except (TypeError, ValueError):
+        raise ValueError('Malformed continuation token')
+    expected = [('-' if desc else '') + name for name, __, desc in keys]
+    if order != expected or len(values) != len(keys):
+        raise ValueError('Continuation token does not match "order_by"')
+    return values
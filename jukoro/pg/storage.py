@@ -2,6 +2,7 @@
 
 from collections import OrderedDict
 
+from jukoro.pg.attrs import DbIndex
 from jukoro.pg.exceptions import AlreadyRegistered
 from jukoro.pg.introspect import inspect
 
@@ -51,6 +52,18 @@ class AbstractSql(object):
         """
         return self.query.format(**self.sql_vars())
 
+    def is_actual(self, state):
+        """
+        Checks if existing database structure matches sql query (is called
+        for structures present in database only)
+
+        :param state:   :class:`~jukoro.pg.introspect.State` instance
+        :returns:       ``True`` if structure has not to be recreated
+        :rtype:         bool
+
+        """
+        return True
+
     def sql_vars(self, **extras):
         """
         Returns dictionary suitable to act as kwargs to "render" sql query
@@ -60,8 +73,8 @@ class AbstractSql(object):
         """
         instance = self.instance
         kwargs = {}
-        for attr in ('db_table', 'db_view'):
-            if hasattr(instance, attr):
+        for attr in ('db_table', 'db_view', 'db_history'):
+            if getattr(instance, attr, None) is not None:
                 kwargs[attr] = (getattr(instance, attr)).name
         for k, v in extras.iteritems():
             kwargs[k] = v
@@ -70,6 +83,15 @@ class AbstractSql(object):
 
 SEQ = 'global_entity_id_seq'  # for internal reference only
 ET = 'entity'  # for internal reference only
+# "end of time" for live (not closed) entity versions
+LIVE_END = '2999-12-31 23:59:59.999+0'
+# predicate selecting live entity versions (the same text is used for
+# partial indices so planner is able to match them)
+LIVE = '"entity_end" = \'{}\'::timestamp with time zone'.format(LIVE_END)
+# partitioned tables keys
+PARTITION_KEYS = ('entity_start', 'entity_end')
+# number of upcoming monthly partitions to create in advance
+PARTITION_AHEAD = 3
 # base table name intentionally hardcoded
 INIT_SCHEMA = """
 CREATE SCHEMA {schema};
@@ -147,6 +169,80 @@ CREATE INDEX ju_idx__{db_table}__entity_id ON "{db_table}"
     USING btree("entity_id", "entity_start", "entity_end" DESC);
 """
 
+# partitioned tables can not inherit "entity" table so columns are repeated
+CREATE_TABLE_PARTITIONED = """
+-- {db_table} table partitioned by "{key}"
+CREATE TABLE IF NOT EXISTS "{db_table}" (
+    "id" serial,
+    "entity_id" bigint NOT NULL DEFAULT nextval('public.global_entity_id_seq'),
+    "entity_start" timestamp with time zone DEFAULT current_timestamp,
+    "entity_end" timestamp with time zone
+            DEFAULT '{live_end}'::timestamp with time zone,
+    "doc" jsonb NOT NULL,
+    PRIMARY KEY ("id", "{key}")
+) PARTITION BY RANGE ("{key}");
+{live}
+CREATE TABLE IF NOT EXISTS "{db_table}__p_default"
+    PARTITION OF "{db_table}" DEFAULT;
+
+CREATE INDEX ju_idx__{db_table}__doc ON "{db_table}"
+    USING GIN("doc" jsonb_path_ops);
+CREATE INDEX ju_idx__{db_table}__entity_id ON "{db_table}"
+    USING btree("entity_id", "entity_start", "entity_end" DESC);
+
+-- creates partitions for current and upcoming months
+-- (rows already stored in default partition within month range are moved
+-- to created partition)
+CREATE OR REPLACE FUNCTION ju_partition__{db_table}(ahead integer)
+RETURNS integer AS $$
+DECLARE
+    created integer := 0;
+    since timestamp with time zone;
+    till timestamp with time zone;
+    name text;
+    stray boolean;
+BEGIN
+    FOR idx IN 0..ahead LOOP
+        since := date_trunc('month', now()) + make_interval(months => idx);
+        till := since + interval '1 month';
+        name := '{db_table}__p_' || to_char(since, 'YYYYMM');
+        IF to_regclass(quote_ident(name)) IS NULL THEN
+            EXECUTE format(
+                'SELECT EXISTS (SELECT 1 FROM %I WHERE %I >= %L AND %I < %L)',
+                '{db_table}__p_default', '{key}', since, '{key}', till)
+                INTO stray;
+            IF stray THEN
+                EXECUTE format('ALTER TABLE %I DETACH PARTITION %I',
+                    '{db_table}', '{db_table}__p_default');
+            END IF;
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                name, '{db_table}', since, till);
+            IF stray THEN
+                EXECUTE format(
+                    'WITH moved AS (DELETE FROM %I '
+                    'WHERE %I >= %L AND %I < %L RETURNING *) '
+                    'INSERT INTO %I SELECT * FROM moved',
+                    '{db_table}__p_default', '{key}', since, '{key}', till,
+                    name);
+                EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I DEFAULT',
+                    '{db_table}', '{db_table}__p_default');
+            END IF;
+            created := created + 1;
+        END IF;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT ju_partition__{db_table}({ahead});
+"""
+# live versions partition for tables partitioned by "entity_end"
+CREATE_LIVE_PARTITION = """
+CREATE TABLE IF NOT EXISTS "{db_table}__p_live"
+    PARTITION OF "{db_table}" FOR VALUES FROM ('{live_end}') TO (MAXVALUE);
+"""
+
 
 class CreateTableSql(AbstractSql):
     """
@@ -155,7 +251,6 @@ class CreateTableSql(AbstractSql):
     :param instance:  instance of :class:`Table`
 
     """
-    query = CREATE_TABLE
 
     @property
     def name(self):
@@ -165,11 +260,67 @@ class CreateTableSql(AbstractSql):
         """
         return self.instance.db_table.name
 
+    @property
+    def query(self):
+        """
+        Returns sql template according to table layout
+
+        """
+        if self.instance.db_partition:
+            return CREATE_TABLE_PARTITIONED
+        return CREATE_TABLE
+
+    def sql_vars(self):
+        """
+        Returns dictionary suitable to act as kwargs to "render" sql query
+
+        """
+        key = self.instance.db_partition
+        if not key:
+            return super(CreateTableSql, self).sql_vars()
+        live = ''
+        if key == 'entity_end':
+            live = CREATE_LIVE_PARTITION.format(
+                db_table=self.instance.db_table.name, live_end=LIVE_END)
+        return super(CreateTableSql, self).sql_vars(
+            key=key, live=live, live_end=LIVE_END, ahead=PARTITION_AHEAD)
+
+
+CREATE_HISTORY = """
+-- {db_table} history table (closed versions)
+CREATE TABLE IF NOT EXISTS "{db_history}" (
+    "id" integer PRIMARY KEY
+) INHERITS ("entity");
+
+CREATE INDEX ju_idx__{db_history}__entity_id ON "{db_history}"
+    USING btree("entity_id", "entity_start", "entity_end" DESC);
+"""
+
+
+class CreateHistorySql(AbstractSql):
+    """
+    Abstraction for "create history table" sql query
+
+    :param instance:  instance of :class:`Table`
+
+    """
+    query = CREATE_HISTORY
+
+    @property
+    def name(self):
+        """
+        Returns history table name (needed to check if table exists in
+        database)
+
+        """
+        return self.instance.db_history.name
+
 
 CREATE_VIEW = """
 -- {db_table} master view
 CREATE OR REPLACE VIEW "{db_view}" AS SELECT * FROM "{db_table}"
-    WHERE "entity_start" <= now() AND "entity_end" > now();
+    WHERE "entity_start" <= now() AND {live};
+COMMENT ON VIEW "{db_view}" IS '{comment}';
 """
 
 
@@ -190,6 +341,26 @@ class CreateViewSql(AbstractSql):
         """
         return self.instance.db_view.name
 
+    def is_actual(self, state):
+        """
+        Checks if existing view selects live versions using :data:`LIVE`
+        predicate (predicate is kept as view comment)
+
+        :param state:   :class:`~jukoro.pg.introspect.State` instance
+        :returns:       ``True`` if view has not to be replaced
+        :rtype:         bool
+
+        """
+        return '{}={}'.format(self.name, LIVE) in state.view_comments
+
+    def sql_vars(self):
+        """
+        Returns dictionary suitable to act as kwargs to "render" sql query
+
+        """
+        return super(CreateViewSql, self).sql_vars(
+            live=LIVE, comment=LIVE.replace("'", "''"))
+
 
 class AbstractTrigger(AbstractSql):
     """
@@ -281,15 +452,53 @@ CREATE TRIGGER "{name}"
 
 """
 
+TRIGGER_UPDATE_HISTORY = """
+-- {db_view} trigger on update (closed version moves to history table)
+CREATE OR REPLACE FUNCTION {name}() RETURNS TRIGGER AS $$
+BEGIN
+    WITH closed AS (DELETE FROM "{db_table}" WHERE "id" = OLD.id RETURNING *)
+    INSERT INTO "{db_history}"
+            ("id", "entity_id", "entity_start", "entity_end", "doc")
+        SELECT "id", "entity_id", "entity_start", CURRENT_TIMESTAMP, "doc"
+            FROM closed;
+    INSERT INTO "{db_table}" ("entity_id", "doc")
+        VALUES (NEW.entity_id,
+                public.jsonb_merge_key_value_pairs(
+                    NEW.doc,
+                    '_updated',
+                    public.current_timestamp_to_iso8601()))
+        RETURNING * INTO NEW;
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER "{name}"
+    INSTEAD OF UPDATE
+    ON "{db_view}"
+    FOR EACH ROW
+    EXECUTE PROCEDURE {name}();
+
+"""
+
 
 class TriggerOnUpdateSql(AbstractTrigger):
     """
     Abstraction for "create trigger instead of update" sql query
 
     """
-    query = TRIGGER_UPDATE
     suffix = 'update'
 
+    @property
+    def query(self):
+        """
+        Returns sql template according to table layout
+
+        """
+        if self.instance.db_history is not None:
+            return TRIGGER_UPDATE_HISTORY
+        return TRIGGER_UPDATE
+
 
 TRIGGER_DELETE = """
 -- {db_view} trigger on delete
@@ -316,15 +525,51 @@ CREATE TRIGGER "{name}"
     EXECUTE PROCEDURE {name}();
 """
 
+TRIGGER_DELETE_HISTORY = """
+-- {db_view} trigger on delete (deleted version moves to history table)
+CREATE OR REPLACE FUNCTION {name}() RETURNS TRIGGER AS $$
+BEGIN
+    IF OLD.id IS NOT NULL THEN
+        WITH closed AS (
+            DELETE FROM "{db_table}" WHERE "id" = OLD.id RETURNING *)
+        INSERT INTO "{db_history}"
+                ("id", "entity_id", "entity_start", "entity_end", "doc")
+            SELECT "id", "entity_id", "entity_start", CURRENT_TIMESTAMP,
+                public.jsonb_merge_key_value_pairs(
+                    OLD.doc,
+                    '_deleted',
+                    public.current_timestamp_to_iso8601())
+                FROM closed;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER "{name}"
+    INSTEAD OF DELETE
+    ON "{db_view}"
+    FOR EACH ROW
+    EXECUTE PROCEDURE {name}();
+"""
+
 
 class TriggerOnDeleteSql(AbstractTrigger):
     """
     Abstraction for "create trigger instead of delete" sql query
 
     """
-    query = TRIGGER_DELETE
     suffix = 'delete'
 
+    @property
+    def query(self):
+        """
+        Returns sql template according to table layout
+
+        """
+        if self.instance.db_history is not None:
+            return TRIGGER_DELETE_HISTORY
+        return TRIGGER_DELETE
+
 
 class Schema(object):
     """
@@ -359,6 +604,8 @@ class Table(object):
     """
     #: Attribute to "render" sql to create database table
     sql_create_table = SqlDescr(CreateTableSql)
+    #: Attribute to "render" sql to create history table
+    sql_create_history = SqlDescr(CreateHistorySql)
     #: Attribute to "render" sql to create database *live* view
     sql_create_view = SqlDescr(CreateViewSql)
     #: Attribute to "render" sql to create view's trigger on insert
@@ -405,15 +652,40 @@ class Table(object):
         """
         return self._entity_class.db_view
 
+    @property
+    def db_history(self):
+        """
+        Returns history table name defined for
+        :class:`Entity <jukoro.pg.entity.AbstractEntity>` class (``None``
+        if entity keeps all versions in single table)
+
+        :rtype:     str
+
+        """
+        return self._entity_class.db_history
+
+    @property
+    def db_partition(self):
+        """
+        Returns column name table is partitioned by (``None`` if table is
+        not partitioned)
+
+        :rtype:     str
+
+        """
+        return self._entity_class.db_partition
+
     @property
     def tables(self):
         """
-        Iterates over abstraction to create table sql
+        Iterates over abstractions to create tables sql
 
         :yields:    own attribute (Python descriptor) to generate sql query
 
         """
         yield self.sql_create_table
+        if self.db_history is not None:
+            yield self.sql_create_history
 
     @property
     def views(self):
@@ -447,8 +719,8 @@ class Table(object):
 
         """
         for attr in self._entity_class.attrs:
-            if attr.db_index:
-                yield Index(self, attr)
+            for spec in attr.db_indices:
+                yield Index(self, attr, spec)
 
     @property
     def constraints(self):
@@ -478,6 +750,10 @@ INDEX = """
 CREATE INDEX {index_name} ON
     "{db_table}" USING btree({spec}, "entity_start", "entity_end" DESC);
 """
+INDEX_DECLARED = """
+CREATE {unique}INDEX {index_name} ON
+    "{db_table}" USING {method}({spec}){include}{where};
+"""
 
 
 class Index(object):
@@ -486,12 +762,18 @@ class Index(object):
 
     :param table:   instance of :class:`~jukoro.pg.storage.Table`
     :param attr:    instance of :class:`~jukoro.pg.attrs.AttrDescr`
+    :param spec:    instance of :class:`~jukoro.pg.attrs.DbIndex`
+                    (defaults to non-live btree index)
+
+    Index expressions are the same as ones used in queries
+    (see :mod:`jukoro.pg.expr`), so planner can use them
 
     """
 
-    def __init__(self, table, attr):
+    def __init__(self, table, attr, spec=None):
         self._table = table
         self._attr = attr
+        self._spec = spec or DbIndex(live=False)
 
     @property
     def db_table(self):
@@ -511,8 +793,12 @@ class Index(object):
         :rtype: str
 
         """
-        return 'ju_idx__{}__{}_entity_start_entity_end'.format(
-            self.db_table.name, self._attr.slug)
+        suffix = self._spec.suffix
+        if not suffix:
+            return 'ju_idx__{}__{}_entity_start_entity_end'.format(
+                self.db_table.name, self._attr.slug)
+        return 'ju_idx__{}__{}__{}'.format(
+            self.db_table.name, self._attr.slug, suffix)
 
     @property
     def spec(self):
@@ -523,6 +809,13 @@ class Index(object):
 
         """
         attr = self._attr
+        if self._spec.gin:
+            path = (attr.slug, ) + self._spec.path
+            if len(path) == 1:
+                spec = '("doc"->\'{}\')'.format(attr.slug)
+            else:
+                spec = '("doc"#>\'{{{}}}\')'.format(','.join(path))
+            return '({}) {}'.format(spec, self._spec.opclass)
         spec = '(("doc"->>\'{attr}\')::{cast})'
         return spec.format(attr=attr.slug, cast=attr.db_cast)
 
@@ -534,10 +827,18 @@ class Index(object):
         :rtype: dict
 
         """
+        spec = self._spec
+        include = ''
+        if spec.include:
+            include = ' INCLUDE ("{}")'.format('", "'.join(spec.include))
         return {
             'index_name': self.name,
             'spec': self.spec,
             'db_table': self.db_table.name,
+            'unique': 'UNIQUE ' if spec.unique else '',
+            'method': 'gin' if spec.gin else 'btree',
+            'include': include,
+            'where': ' WHERE {}'.format(LIVE) if spec.live else '',
         }
 
     @property
@@ -548,7 +849,9 @@ class Index(object):
         :rtype: str
 
         """
-        return INDEX.format(**self.sql_vars())
+        if not self._spec.suffix:
+            return INDEX.format(**self.sql_vars())
+        return INDEX_DECLARED.format(**self.sql_vars())
 
 
 CONSTRAINT_INT = """
@@ -674,6 +977,21 @@ class DBTableName(object):
     #     return ('id', 'entity_id', 'entity_start', 'entity_end', 'doc')
 
 
+class DBHistoryName(DBTableName):
+    """
+    Python descriptor to return database history table name (table to keep
+    closed versions of entities) defined for
+    :class:`Entity <jukoro.pg.entity.AbstractEntity>`
+
+    :param name:    database table name
+
+    """
+    suffix = '__history'
+
+    def __init__(self, name):
+        self._nm = '{}{}'.format(name, self.suffix)
+
+
 class DBViewName(DBTableName):
     """
     Python descriptor to return database view name (view built on top of
@@ -777,6 +1095,8 @@ def _to_create(table, state):
                 yield it.sql
             else:
                 current.pop(it.name)
+                if not it.is_actual(state):
+                    yield it.sql
 
 
 DROPS = {
@@ -840,6 +1160,11 @@ def _syncdb(uri):
     for table in tables():
         for sql in _to_create(table, state):
             yield sql
+        if table.db_partition:
+            # partitions are maintained by database function
+            prefix = '{}__p_'.format(table.db_table.name)
+            for name in [x for x in state.tables if x.startswith(prefix)]:
+                state.tables.pop(name)
 
     yield 'CUT'
 
@@ -867,3 +1192,58 @@ def syncdb(uri):
     create_sql = ''.join(create_sql)
     drop_sql = ''.join(drop_sql)
     return create_sql, drop_sql
+
+
+def create_partitions(cursor, *entity_classes, **kwargs):
+    """
+    Creates missing monthly partitions for current and upcoming months for
+    partitioned tables (expected to be called periodically, i.e. by cron)
+
+    :param cursor:          instance of
+                            :class:`PgTransaction <jukoro.pg.db.PgTransaction>`
+    :param entity_classes:  :class:`Entity <jukoro.pg.entity.AbstractEntity>`
+                            classes (optional), defaults to all registered
+    :param ahead:           number of upcoming months (optional), defaults
+                            to :data:`PARTITION_AHEAD`
+    :returns:               number of created partitions
+    :rtype:                 int
+
+    """
+    ahead = kwargs.pop('ahead', PARTITION_AHEAD)
+    if entity_classes:
+        items = (Table(x) for x in entity_classes)
+    else:
+        items = tables()
+    created = 0
+    for table in items:
+        if not table.db_partition:
+            continue
+        q = 'SELECT ju_partition__{}(%s) AS "created";'.format(
+            table.db_table.name)
+        created += cursor.execute(q, (ahead, )).scalar()
+    return created
+
+
+def detach_partition(cursor, entity_class, month):
+    """
+    Detaches monthly partition from partitioned table (partition becomes
+    a standalone table to archive or drop)
+
+    :param cursor:          instance of
+                            :class:`PgTransaction <jukoro.pg.db.PgTransaction>`
+    :param entity_class:    :class:`Entity <jukoro.pg.entity.AbstractEntity>`
+                            class
+    :param month:           ``datetime.date`` (or ``datetime.datetime``)
+                            within month to detach partition for
+    :returns:               detached partition (table) name
+    :rtype:                 str
+    :raises ValueError:     if entity table is not partitioned
+
+    """
+    tn = entity_class.db_table.name
+    if not entity_class.db_partition:
+        raise ValueError('Table "{}" is not partitioned'.format(tn))
+    name = '{}__p_{}'.format(tn, month.strftime('%Y%m'))
+    cursor.execute(
+        'ALTER TABLE "{}" DETACH PARTITION "{}";'.format(tn, name))
+    return name
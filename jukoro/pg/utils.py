@@ -3,14 +3,220 @@
 Module for :mod:`jukoro.pg` specific utilities
 
 """
+import Queue
+import sys
+import threading
 import urllib
 import urlparse
 
+from collections import OrderedDict
+
+from jukoro import json
 from jukoro.utils import os_user
 
 from jukoro.pg.exceptions import BadUri
 
 
+# libpq connection parameters which can be specified in uri query
+# (everything else in uri query is considered to be session parameter)
+CONN_PARAMS = frozenset([
+    'application_name', 'connect_timeout', 'client_encoding',
+    'fallback_application_name', 'keepalives', 'keepalives_idle',
+    'keepalives_interval', 'keepalives_count', 'sslmode', 'sslcert',
+    'sslkey', 'sslrootcert', 'sslcrl', 'requiressl', 'krbsrvname',
+    'target_session_attrs',
+])
+
+# session parameters set on connect (can be overriden in uri query)
+SESSION_PARAMS = (
+    ('timezone', 'UTC'),
+    ('default_transaction_isolation', 'read committed'),
+)
+
+
+class PgJsonEncoder(json.JSONEncoder):
+    """
+    PostgreSQL-focused json encoder
+
+    Custom object can be encoded using simple convention - object can have
+    ``db_val`` property or method to get it's json-compatible value
+
+    """
+    json_attr = 'db_val'
+
+
+class IterStream(object):
+    """
+    Read-only file-like object over iterable of strings (to feed
+    ``COPY ... FROM STDIN`` from generator without building whole data in
+    memory)
+
+    :param iterable:    iterable of strings (unicode strings are encoded
+                        to UTF-8)
+
+    """
+
+    __slots__ = ('_it', '_buf')
+
+    def __init__(self, iterable):
+        self._it = iter(iterable)
+        self._buf = ''
+
+    def _next(self):
+        chunk = next(self._it)
+        if isinstance(chunk, unicode):
+            chunk = chunk.encode('utf-8')
+        return chunk
+
+    def read(self, size=-1):
+        """
+        Reads up to ``size`` bytes (reads everything if ``size`` is
+        negative)
+
+        :param size:    number of bytes to read
+        :rtype:         str
+
+        """
+        parts, total = [self._buf], len(self._buf)
+        try:
+            while size < 0 or total < size:
+                chunk = self._next()
+                parts.append(chunk)
+                total += len(chunk)
+        except StopIteration:
+            pass
+        data = ''.join(parts)
+        if size < 0:
+            size = len(data)
+        self._buf = data[size:]
+        return data[:size]
+
+    def readline(self, size=-1):
+        """
+        Reads single line
+
+        :rtype:         str
+
+        """
+        data = self._buf
+        try:
+            while '\n' not in data:
+                data += self._next()
+        except StopIteration:
+            pass
+        pos = data.find('\n') + 1 or len(data)
+        if 0 <= size < pos:
+            pos = size
+        self._buf = data[pos:]
+        return data[:pos]
+
+
+class QueueStream(object):
+    """
+    Write-only file-like object passing written chunks to consumer running
+    in another thread (reverse of :class:`IterStream`, to turn
+    ``COPY ... TO STDOUT`` into generator without building whole data in
+    memory, see :func:`iter_stream`)
+
+    :param maxsize:     max number of chunks waiting for consumer
+
+    """
+
+    __slots__ = ('_queue', '_closed')
+
+    def __init__(self, maxsize=16):
+        self._queue = Queue.Queue(maxsize)
+        self._closed = False
+
+    def write(self, data):
+        """
+        Passes data to consumer (blocks while consumer is behind)
+
+        :param data:    string to write
+        :raises IOError: if stream is closed
+
+        """
+        if self._closed:
+            raise IOError('Stream is closed')
+        self._queue.put(data)
+
+    def get(self):
+        """
+        Returns next written chunk (blocks until available)
+
+        """
+        return self._queue.get()
+
+    def close(self):
+        """
+        Closes stream (discards chunks not consumed yet, consequent writes
+        raise ``IOError``)
+
+        """
+        self._closed = True
+        try:
+            while True:
+                self._queue.get_nowait()
+        except Queue.Empty:
+            pass
+
+    @property
+    def closed(self):
+        """
+        Returns ``True`` if stream is closed
+
+        """
+        return self._closed
+
+
+# marks end of data written to QueueStream
+_EOF = object()
+
+
+def iter_stream(fn, maxsize=16):
+    """
+    Calls ``fn(stream)`` in background thread yielding data written to
+    ``stream`` (instance of :class:`QueueStream`) as it comes
+
+    :param fn:          callable writing data to file-like object
+    :param maxsize:     max number of chunks waiting for consumer
+    :yields:            written chunks
+    :raises:            exception raised by ``fn``
+
+    Stopping iteration early closes stream so ``fn`` fails on next write
+
+    """
+    stream = QueueStream(maxsize)
+    error = []
+
+    def target():
+        try:
+            fn(stream)
+        except Exception:
+            error.append(sys.exc_info())
+        finally:
+            try:
+                stream.write(_EOF)
+            except IOError:
+                # consumer has gone
+                pass
+
+    worker = threading.Thread(target=target, name='iter-stream')
+    worker.daemon = True
+    worker.start()
+    try:
+        while True:
+            chunk = stream.get()
+            if chunk is _EOF:
+                break
+            yield chunk
+    finally:
+        stream.close()
+        worker.join()
+    if error:
+        raise error[0][0], error[0][1], error[0][2]
+
+
 def pg_uri_to_kwargs(uri):
     """
     Transforms connection string to dictionary consumable by
@@ -23,6 +229,7 @@ def pg_uri_to_kwargs(uri):
     - "port" - defaults to 5432
     - "dbname" - defaults to os username
     - "schema" - defaults to "public"
+    - "client_encoding" - defaults to "UTF8"
 
     :param uri:     connection string
     :returns:       dictionary with connection parameters
@@ -37,6 +244,14 @@ def pg_uri_to_kwargs(uri):
 
         'db_name.schema_name'
 
+    Session parameters (search path, time zone, transaction isolation
+    level and any parameter specified in uri query except for libpq
+    connection parameters like ``application_name``) are passed to
+    PostgreSQL using libpq ``options`` parameter, so connection is ready
+    to use right after it was established::
+
+        'postgresql://localhost/db_name.schema_name?statement_timeout=5000'
+
     Usage examples:
 
     .. code-block:: pycon
@@ -45,24 +260,31 @@ def pg_uri_to_kwargs(uri):
         >>> from pprint import pprint
 
         >>> pprint(pg_uri_to_kwargs('postgresql://localhost/jukoro_test.ju_20150403102042'))
-        {'dbname': 'jukoro_test',
+        {'client_encoding': 'UTF8',
+        'dbname': 'jukoro_test',
         'host': 'localhost',
+        'options': '-c search_path=ju_20150403102042 -c timezone=UTC -c default_transaction_isolation=read\\\\ committed',
         'password': None,
         'port': 5432,
         'schema': 'ju_20150403102042',
         'user': 'egorov'}
 
         >>> pprint(pg_uri_to_kwargs('postgresql://localhost/jukoro_test'))
-        {'dbname': 'jukoro_test',
+        {'client_encoding': 'UTF8',
+        'dbname': 'jukoro_test',
         'host': 'localhost',
+        'options': '-c search_path=public -c timezone=UTC -c default_transaction_isolation=read\\\\ committed',
         'password': None,
         'port': 5432,
         'schema': 'public',
         'user': 'egorov'}
 
-        >>> pprint(pg_uri_to_kwargs('postgresql://localhost:5555/jukoro_test'))
-        {'dbname': 'jukoro_test',
+        >>> pprint(pg_uri_to_kwargs('postgresql://localhost:5555/jukoro_test?application_name=app&work_mem=64MB'))
+        {'application_name': 'app',
+        'client_encoding': 'UTF8',
+        'dbname': 'jukoro_test',
         'host': 'localhost',
+        'options': '-c search_path=public -c timezone=UTC -c default_transaction_isolation=read\\\\ committed -c work_mem=64MB',
         'password': None,
         'port': 5555,
         'schema': 'public',
@@ -90,7 +312,20 @@ def pg_uri_to_kwargs(uri):
         ('path', 'dbname', lambda x: x and _dbname(x[1:]) or _user),
         ('path', 'schema', lambda x: x and _schema(x[1:]) or 'public'),
     )
-    return dict((k, cast(getattr(parsed, pk))) for (pk, k, cast) in mapped)
+    kwargs = dict((k, cast(getattr(parsed, pk))) for (pk, k, cast) in mapped)
+    kwargs['client_encoding'] = 'UTF8'
+
+    session = OrderedDict((('search_path', kwargs['schema']), ))
+    session.update(SESSION_PARAMS)
+    for k, v in urlparse.parse_qsl(parsed.query):
+        if k in CONN_PARAMS:
+            kwargs[k] = v
+        else:
+            session[k.lower()] = v
+    kwargs['options'] = ' '.join(
+        '-c {}={}'.format(k, _escape_option(v))
+        for (k, v) in session.iteritems())
+    return kwargs
 
 
 def _dbname(name):
@@ -99,3 +334,8 @@ def _dbname(name):
 
 def _schema(name):
     return name.partition('.')[-1]
+
+
+def _escape_option(value):
+    # libpq splits "options" by spaces unless escaped with backslash
+    return value.replace('\\', '\\\\').replace(' ', '\\ ')
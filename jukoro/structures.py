@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 
 import collections
+import itertools
 import logging
+import threading
 
 
 logger = logging.getLogger(__name__)
@@ -37,62 +39,186 @@ class DefaultObjectDict(collections.defaultdict):
 
 
 class LockRing(object):
+    """
+    Container of items to be locked while in use and unlocked after usage
 
-    __slots__ = ('_store', '_locks', '_ring')
+    Keeps unlocked items in queues so getting next unlocked item and
+    returning it back are constant time operations
 
-    def __init__(self):
+    ``next`` returns most recently unlocked item (LIFO) so surplus items
+    stay unused and can be removed with ``pop`` (item which was not in use
+    for a longest time)
+
+    Unlocked items can be partitioned using ``key`` callable so ``next``
+    prefers item from specified partition
+
+    Thread-safe
+
+    :param key:     callable (optional) to get partition key for item
+                    (called on item unlock)
+
+    """
+
+    __slots__ = ('_store', '_locks', '_free', '_key', '_seq', '_mutex')
+
+    def __init__(self, key=None):
         self._store = set()
         self._locks = set()
-        self._ring = None
+        self._free = {}  # partition key => deque of (seq, item)
+        self._key = key
+        self._seq = itertools.count()
+        self._mutex = threading.Lock()
+
+    def _release(self, item):
+        k = self._key(item) if self._key is not None else None
+        if k not in self._free:
+            self._free[k] = collections.deque()
+        self._free[k].append((next(self._seq), item))
+
+    def _newest(self):
+        # queue having most recently unlocked item at its tail
+        res = None
+        for q in self._free.itervalues():
+            if q and (res is None or q[-1][0] > res[-1][0]):
+                res = q
+        return res
+
+    def _oldest(self):
+        # queue having item not in use for a longest time at its head
+        res = None
+        for q in self._free.itervalues():
+            if q and (res is None or q[0][0] < res[0][0]):
+                res = q
+        return res
 
     def push(self, item):
-        self._store.add(item)
-        if item in self._locks:
-            if len(self._locks) == len(self._store):
-                self._ring = None
-            self.unlock(item)
-            return True
+        """
+        Adds new item to ring or unlocks item if it is locked
+
+        :param item:    item to add or unlock
+        :returns:       True if item was locked
+
+        """
+        with self._mutex:
+            if item in self._locks:
+                self._locks.remove(item)
+                self._release(item)
+                return True
+            if item not in self._store:
+                self._store.add(item)
+                self._release(item)
 
     def pop(self):
-        if not self:
-            raise IndexError('empty ring')
-        item = self._store.pop()
-        if item in self._locks:
-            self._locks.remove(item)
-        self._ring = None
-        return item
+        """
+        Removes item from ring
+        (unlocked item which was not in use for a longest time or
+        any locked item if there are no unlocked ones)
+
+        :returns:           removed item
+        :raises IndexError: if ring is empty
+
+        """
+        with self._mutex:
+            if not self._store:
+                raise IndexError('empty ring')
+            q = self._oldest()
+            if q:
+                item = q.popleft()[1]
+            else:
+                item = self._locks.pop()
+            self._store.remove(item)
+            return item
+
+    def peek(self):
+        """
+        Returns unlocked item which was not in use for a longest time
+        (the one to be removed by ``pop``) without removing it
+
+        :returns:   item or None if there are no unlocked items
+
+        """
+        with self._mutex:
+            q = self._oldest()
+            if q:
+                return q[0][1]
 
     def lock(self, item):
-        self._locks.add(item)
+        """
+        Locks item
+
+        :param item:    item from ring to lock
+
+        """
+        with self._mutex:
+            if item not in self._store or item in self._locks:
+                return
+            for q in self._free.itervalues():
+                for pair in q:
+                    if pair[1] is item:
+                        q.remove(pair)
+                        self._locks.add(item)
+                        return
 
     def unlock(self, item):
-        self._locks.remove(item)
+        """
+        Unlocks item
+
+        :param item:        locked item from ring to unlock
+        :raises KeyError:   if item is not locked
+
+        """
+        with self._mutex:
+            self._locks.remove(item)
+            self._release(item)
 
     def is_locked(self, item):
-        return item in self._locks
+        """
+        Tests if item is locked
+
+        """
+        with self._mutex:
+            return item in self._locks
 
     def reset(self):
-        self._store = set()
-        self._locks = set()
-        self._ring = None
-
-    def _iter(self):
-        while self._store:
-            for item in self._store:
-                if len(self._store) == len(self._locks):
-                    raise IndexError('all locked')
-                if item not in self._locks:
-                    # logger.info('yielding item %s', item)
-                    yield item
-
-    def next(self):
-        if not self:
-            raise IndexError('empty ring')
-        if not self._ring:
-            self._ring = self._iter()
-        item = next(self._ring)
-        self.lock(item)
-        return item
+        """
+        Removes all items from ring
+
+        """
+        with self._mutex:
+            self._store = set()
+            self._locks = set()
+            self._free = {}
+
+    def next(self, key=None):
+        """
+        Locks and returns most recently unlocked item
+
+        :param key:         partition key to prefer item from
+                            (falls back to any unlocked item)
+        :returns:           item
+        :raises IndexError: if ring is empty or all items are locked
+
+        """
+        with self._mutex:
+            if not self._store:
+                raise IndexError('empty ring')
+            q = self._free.get(key) or self._newest()
+            if not q:
+                raise IndexError('all locked')
+            item = q.pop()[1]
+            self._locks.add(item)
+            return item
+
+    @property
+    def available(self):
+        """
+        Returns number of unlocked items
+
+        :rtype: int
+
+        """
+        with self._mutex:
+            return sum(len(q) for q in self._free.itervalues())
 
     def __len__(self):
         return len(self._store)
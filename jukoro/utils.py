@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import itertools
 import os
 import multiprocessing
 import pwd
@@ -32,3 +33,22 @@ def os_user():
 
 def cpu_count():
     return multiprocessing.cpu_count() or 1
+
+
+def chunks(iterable, size):
+    """
+    Splits iterable to lists of ``size`` items (last one can be shorter)
+    consuming it lazily
+
+    :param iterable:    iterable to split
+    :param size:        size of chunk
+    :returns:           generator of lists
+
+    """
+    if size < 1:
+        raise ValueError('chunk size must be positive')
+    it = iter(iterable)
+    chunk = list(itertools.islice(it, size))
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(it, size))
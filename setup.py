@@ -11,7 +11,7 @@ requires = [
     # 'Cython>=0.21.0',
     'redis>=2.10.0',
     'hiredis>=0.1.0',
-    'psycopg2>=2.5.0',
+    'psycopg2>=2.7.0',
     # 'pytz>=2014.10',
     'base32-crockford>=0.2.0',
     'arrow>=0.5.4',
@@ -28,4 +28,7 @@ setup(
     #package_data={'jukoro': []},
     include_package_data=True,
     install_requires=requires,
+    extras_require={
+        'aio': ['tornado>=4.5'],
+    },
 )
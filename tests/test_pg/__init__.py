@@ -14,10 +14,14 @@ from jukoro import arrow
 from jukoro import pg
 from jukoro.pg import storage as pg_storage
 
+from .aio import *
 from .attrs import *
+from .codec import *
 from .db import *
 from .entity import *
+from .expr import *
 from .introspect import *
+from .loader import *
 from .query import *
 from .storage import *
 from .utils import *
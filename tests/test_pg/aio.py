@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+
+import functools
+import time
+import unittest
+
+try:
+    from tornado import gen
+    from tornado.ioloop import IOLoop
+except ImportError:
+    gen = IOLoop = None
+
+from jukoro import arrow
+from jukoro import pg
+
+if IOLoop is not None:
+    from jukoro.pg import aio
+
+from .base import Base
+
+
+__all__ = ['TestAsyncPgDbPool', 'TestAsyncPgTransaction']
+
+
+def _doc(attr1):
+    return {'attr1': attr1, 'attr2': 'mistery', 'attr3': 'async',
+            'attr4': 1, 'attr5': 1000, 'attr7': arrow.utcnow()}
+
+
+@unittest.skipIf(IOLoop is None, 'tornado is not installed')
+class BaseAsync(Base):
+
+    def setUp(self):
+        super(BaseAsync, self).setUp()
+        self.loop = IOLoop()
+        self.loop.make_current()
+
+    def tearDown(self):
+        self.loop.clear_current()
+        self.loop.close()
+        super(BaseAsync, self).tearDown()
+
+    def run_sync(self, fn, *args, **kwargs):
+        return self.loop.run_sync(functools.partial(fn, *args, **kwargs))
+
+
+class TestAsyncPgDbPool(BaseAsync):
+
+    def run_in_transaction(self, pool, query, params=None, **kwargs):
+        return pool.run_in_transaction(
+            lambda cursor: cursor.execute_and_get(query, params), **kwargs)
+
+    def test_session(self):
+        pool = aio.AsyncPgDbPool(self.uri(), pool_size=1)
+
+        row = self.run_sync(
+            self.run_in_transaction,
+            pool, 'SELECT current_setting(\'search_path\') AS "sp", '
+            'current_setting(\'TimeZone\') AS "tz";')
+        self.assertIsInstance(row, dict)
+        self.assertTrue(self.schema() in row['sp'])
+        self.assertEqual(row['tz'], 'UTC')
+
+        self.assertEqual(len(pool), 1)
+        self.assertEqual(pool.stats.busy, 0)
+        pool.close()
+
+        with self.assertRaises(pg.PoolClosed):
+            self.run_sync(pool.transaction)
+
+    def test_concurrency(self):
+        sz = 20
+        pool = aio.AsyncPgDbPool(self.uri(), pool_size=sz)
+        q = 'SELECT pg_sleep(0.2), pg_backend_pid() AS "pid";'
+
+        started = time.time()
+        rows = self.run_sync(lambda: gen.multi(
+            [self.run_in_transaction(pool, q) for __ in xrange(sz)]))
+
+        self.assertLess(time.time() - started, 0.2 * sz / 2)
+        self.assertEqual(len(set(x['pid'] for x in rows)), sz)
+        pool.close()
+
+    def test_wait(self):
+        pool = aio.AsyncPgDbPool(self.uri(), pool_size=1, max_overflow=0,
+                                 timeout=0.1)
+        q = 'SELECT pg_sleep(0.3);'
+
+        with self.assertRaises(pg.PoolExhausted):
+            self.run_sync(lambda: gen.multi([
+                self.run_in_transaction(pool, q),
+                self.run_in_transaction(pool, q)]))
+        self.assertEqual(pool.stats.timeouts, 1)
+        self.assertEqual(pool.stats.waiting, 0)
+        pool.close()
+
+        pool = aio.AsyncPgDbPool(self.uri(), pool_size=1, max_overflow=0)
+        q = 'SELECT pg_backend_pid() AS "pid";'
+        rows = self.run_sync(lambda: gen.multi(
+            [self.run_in_transaction(pool, q) for __ in xrange(3)]))
+        self.assertEqual(len(set(x['pid'] for x in rows)), 1)
+        self.assertEqual(pool.stats.waits, 2)
+        pool.close()
+
+    def test_wait_order(self):
+        pool = aio.AsyncPgDbPool(self.uri(), pool_size=1, max_overflow=0)
+        order = []
+
+        @gen.coroutine
+        def job(idx):
+            cursor = yield pool.transaction()
+            order.append(idx)
+            yield cursor.execute('SELECT pg_sleep(0.01);')
+            yield cursor.close()
+
+        self.run_sync(lambda: gen.multi([job(x) for x in xrange(5)]))
+        self.assertEqual(order, range(5))
+        self.assertEqual(pool.stats.waits, 4)
+        pool.close()
+
+    def test_overflow(self):
+        pool = aio.AsyncPgDbPool(self.uri(), pool_size=1, max_overflow=1)
+        q = 'SELECT pg_sleep(0.1), pg_backend_pid() AS "pid";'
+        rows = self.run_sync(lambda: gen.multi(
+            [self.run_in_transaction(pool, q) for __ in xrange(3)]))
+        self.assertEqual(len(set(x['pid'] for x in rows)), 2)
+        stats = pool.stats
+        self.assertEqual(
+            (stats.size, stats.overflow, stats.overflow_total, stats.waits),
+            (1, 0, 1, 1))
+        pool.close()
+
+
+class TestAsyncPgTransaction(BaseAsync):
+
+    def setUp(self):
+        super(TestAsyncPgTransaction, self).setUp()
+        self.pool = aio.AsyncPgDbPool(self.uri(), pool_size=2)
+
+    def tearDown(self):
+        self.pool.close()
+        super(TestAsyncPgTransaction, self).tearDown()
+
+    def test_named(self):
+        q = 'SELECT "entity_id", "doc" FROM "test_pg__live" ' \
+            'WHERE "entity_id" BETWEEN %s AND %s;'
+        first_id = self.first_id()
+
+        @gen.coroutine
+        def stream():
+            cursor = yield self.pool.transaction(
+                autocommit=False, named=True, block_size=100)
+            res = yield cursor.execute(q, (first_id, first_id + 249))
+            sizes = []
+            block = yield res.block()
+            while block:
+                sizes.append(len(block))
+                block = yield res.block()
+            queries = list(cursor.queries)
+            yield cursor.close()
+            raise gen.Return((sizes, queries, cursor.is_closed))
+
+        sizes, queries, closed = self.run_sync(stream)
+        self.assertEqual(sizes, [100, 100, 50])
+        self.assertTrue(queries[0].startswith('BEGIN'))
+        self.assertTrue('DECLARE' in queries[1])
+        self.assertEqual(len(queries), 6)
+        self.assertTrue(closed)
+
+    def test_history(self):
+        @gen.coroutine
+        def create_update():
+            cursor = yield self.pool.transaction(autocommit=False)
+            row = yield cursor.execute_and_get(
+                'INSERT INTO "test_pg__live" ("doc") VALUES (%s) '
+                'RETURNING "entity_id";', (_doc('async'), ))
+            entity_id = row['entity_id']
+            yield cursor.execute(
+                'UPDATE "test_pg__live" SET "doc" = %s '
+                'WHERE "entity_id" = %s;', (_doc('async2'), entity_id))
+            yield cursor.close()
+
+            cursor = yield self.pool.transaction()
+            row = yield cursor.execute_and_get(
+                'SELECT COUNT(*) AS "cnt" FROM "test_pg" '
+                'WHERE "entity_id" = %s;', (entity_id, ))
+            live = yield cursor.execute_and_get(
+                'SELECT "doc" FROM "test_pg__live" '
+                'WHERE "entity_id" = %s;', (entity_id, ))
+            yield cursor.close()
+            raise gen.Return((row['cnt'], live['doc']))
+
+        cnt, doc = self.run_sync(create_update)
+        self.assertEqual(cnt, 2)
+        self.assertEqual(doc['attr1'], 'async2')
+
+    def test_rollback(self):
+        @gen.coroutine
+        def failed():
+            cursor = yield self.pool.transaction(autocommit=False)
+            row = yield cursor.execute_and_get(
+                'INSERT INTO "test_pg__live" ("doc") VALUES (%s) '
+                'RETURNING "entity_id";', (_doc('async'), ))
+            try:
+                yield cursor.execute('SELECT 1/0;')
+            except pg.DataError:
+                pass
+            yield cursor.close()
+
+            cursor = yield self.pool.transaction()
+            with self.assertRaises(pg.DoesNotExist):
+                yield cursor.execute_and_get(
+                    'SELECT "entity_id" FROM "test_pg" '
+                    'WHERE "entity_id" = %s;', (row['entity_id'], ))
+            yield cursor.close()
+            raise gen.Return(cursor.is_closed)
+
+        self.assertTrue(self.run_sync(failed))
+        self.assertEqual(self.pool.stats.busy, 0)
+
+    def test_caller_failed(self):
+        q = 'SELECT COUNT(*) AS "cnt" FROM "test_pg" WHERE "doc" @> %s;'
+
+        @gen.coroutine
+        def insert(cursor, attr1, fail=False):
+            row = yield cursor.execute_and_get(
+                'INSERT INTO "test_pg__live" ("doc") VALUES (%s) '
+                'RETURNING "entity_id";', (_doc(attr1), ))
+            if fail:
+                raise RuntimeError('caller failed')
+            raise gen.Return(row['entity_id'])
+
+        @gen.coroutine
+        def explicit():
+            cursor = yield self.pool.transaction(autocommit=False)
+            yield insert(cursor, 'async-explicit')
+            yield cursor.close(failed=True)
+
+        @gen.coroutine
+        def count(attr1):
+            cursor = yield self.pool.transaction()
+            row = yield cursor.execute_and_get(q, ({'attr1': attr1}, ))
+            yield cursor.close()
+            raise gen.Return(row['cnt'])
+
+        run = self.run_sync
+        run(explicit)
+        self.assertEqual(run(count, 'async-explicit'), 0)
+
+        with self.assertRaises(RuntimeError):
+            run(self.pool.run_in_transaction,
+                insert, 'async-helper', True, autocommit=False)
+        self.assertEqual(run(count, 'async-helper'), 0)
+
+        entity_id = run(self.pool.run_in_transaction,
+                        insert, 'async-helper', autocommit=False)
+        self.assertIsInstance(entity_id, (int, long))
+        self.assertEqual(run(count, 'async-helper'), 1)
+        self.assertEqual(self.pool.stats.busy, 0)
+
+    def test_rollback_failed(self):
+
+        @gen.coroutine
+        def dropped(cursor):
+            row = yield cursor.execute_and_get('SELECT pg_backend_pid();')
+            other = yield self.pool.transaction()
+            yield other.execute('SELECT pg_terminate_backend(%s);',
+                                (row['pg_backend_pid'], ))
+            yield other.close()
+            raise RuntimeError('caller failed')
+
+        # caller's exception is kept when rollback fails
+        with self.assertRaises(RuntimeError):
+            self.run_sync(self.pool.run_in_transaction, dropped,
+                          autocommit=False)
+        self.assertEqual(self.pool.stats.busy, 0)
@@ -9,7 +9,7 @@ from jukoro import pg
 from jukoro.pg import storage
 
 
-__all__ = ['TestAttr', 'TestAttrs']
+__all__ = ['TestAttr', 'TestAttrs', 'TestDbIndex']
 
 logger = logging.getLogger(__name__)
 
@@ -115,3 +115,51 @@ class TestAttrs(Base):
             if prev is not None:
                 self.assertTrue(prev.idx < attr.idx)
             prev = attr
+
+
+class TestDbIndex(Base):
+    online_required = False
+
+    def test_indices(self):
+        self.assertEqual(pg.Attr(title='a').db_indices, [])
+        legacy, = pg.Attr(title='a', db_index=True).db_indices
+        self.assertFalse(legacy.live)
+        self.assertEqual(legacy.suffix, '')
+
+        idx = pg.DbIndex()
+        self.assertEqual(pg.Attr(title='a', db_index=idx).db_indices, [idx])
+        self.assertEqual(
+            pg.Attr(title='a', db_index=(idx, idx)).db_indices, [idx, idx])
+
+    def test_suffix(self):
+        cases = (
+            (pg.DbIndex(), 'live'),
+            (pg.DbIndex(unique=True), 'uniq_live'),
+            (pg.DbIndex(gin=True, path=['a', 'b']), 'a_b_gin_live'),
+            (pg.DbIndex(gin=True, live=False), 'gin'),
+            (pg.DbIndex(gin=True, opclass='jsonb_ops'), 'gin_ops_live'),
+            (pg.DbIndex(include=['entity_id']), 'live_incl_entity_id'),
+        )
+        for idx, suffix in cases:
+            self.assertEqual(idx.suffix, suffix)
+
+    def test_validation(self):
+        with self.assertRaises(ValueError):
+            pg.DbIndex(live=False, unique=True)
+        with self.assertRaises(ValueError):
+            pg.DbIndex(gin=True, unique=True)
+        with self.assertRaises(ValueError):
+            pg.DbIndex(gin=True, include=['entity_id'])
+        with self.assertRaises(ValueError):
+            pg.DbIndex(path=['a'])
+        with self.assertRaises(ValueError):
+            pg.DbIndex(include=['doc'])
+        for path in (['a\''], ['a,b'], ['a}'], ['a b'], [''], [1]):
+            with self.assertRaises(ValueError):
+                pg.DbIndex(gin=True, path=path)
+        with self.assertRaises(ValueError):
+            pg.DbIndex(opclass='jsonb_ops')
+        with self.assertRaises(ValueError):
+            pg.DbIndex(gin=True, opclass='gin_trgm_ops')
+        self.assertEqual(pg.DbIndex(gin=True).opclass, 'jsonb_path_ops')
+        self.assertIsNone(pg.DbIndex().opclass)
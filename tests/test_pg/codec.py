@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+import collections
+import datetime
+import decimal
+
+from jukoro import arrow
+from jukoro import pg
+from jukoro.pg import codec
+
+from .base import Base, BaseWithPool, TestEntity
+
+
+__all__ = ['TestCodec', 'TestPoolCodec']
+
+
+Point = collections.namedtuple('Point', 'x y')
+
+
+class DbValue(object):
+
+    @property
+    def db_val(self):
+        return 'db value'
+
+
+class CountingCodec(codec.JsonCodec):
+    __slots__ = ('calls', )
+
+    def __init__(self):
+        super(CountingCodec, self).__init__()
+        self.calls = collections.Counter()
+
+    def loads(self, s):
+        self.calls['loads'] += 1
+        return super(CountingCodec, self).loads(s)
+
+    def dumps(self, obj):
+        self.calls['dumps'] += 1
+        return super(CountingCodec, self).dumps(obj)
+
+
+class TestCodec(Base):
+    online_required = False
+
+    def codecs(self):
+        res = [codec.get_codec('json')]
+        if codec.simplejson is not None:
+            res.append(codec.get_codec('simplejson'))
+        return res
+
+    def test_get_codec(self):
+        default = codec.get_codec()
+        self.assertIs(codec.get_codec(), default)
+        self.assertIs(type(default), pg.JsonCodec)
+        self.assertIs(codec.get_codec('json'), default)
+        if codec.simplejson is None:
+            with self.assertRaises(ImportError):
+                pg.SimpleJsonCodec()
+        self.assertIs(codec.get_codec('json'), codec.get_codec('json'))
+        custom = CountingCodec()
+        self.assertIs(codec.get_codec(custom), custom)
+        with self.assertRaises(ValueError):
+            codec.get_codec('marshal')
+
+    def test_conventions(self):
+        dt = datetime.datetime(2016, 1, 2, 3, 4, 5)
+        value = {'a': 1, 'b': decimal.Decimal('1.5'), 'c': dt,
+                 'd': DbValue(), 'e': Point(1, 2), 'f': u'юникод',
+                 'g': [None, True]}
+        expected = {'a': 1, 'b': decimal.Decimal('1.5'),
+                    'c': dt.isoformat(), 'd': 'db value', 'e': [1, 2],
+                    'f': u'юникод', 'g': [None, True]}
+        for c in self.codecs():
+            res = c.loads(c.dumps(value))
+            self.assertEqual(res, expected)
+            self.assertIsInstance(res['b'], decimal.Decimal)
+            self.assertIsInstance(res['a'], (int, long))
+            self.assertIn(u'юникод', c.dumps(value))
+            with self.assertRaises(TypeError):
+                c.dumps({'a': object()})
+
+    def test_mixed_non_ascii(self):
+        value = {'a': u'юникод'.encode('utf-8'), 'b': u'юникод',
+                 u'ключ'.encode('utf-8'): [u'ключ', 'str']}
+        expected = {u'a': u'юникод', u'b': u'юникод',
+                    u'ключ': [u'ключ', u'str']}
+        for c in self.codecs():
+            res = c.dumps(value)
+            self.assertIsInstance(res, unicode)
+            self.assertIn(u'юникод', res)
+            self.assertEqual(c.loads(res), expected)
+
+
+class TestPoolCodec(BaseWithPool):
+
+    def test_pool_codec(self):
+        q = 'SELECT %s::jsonb AS "doc", %s::json AS "raw";'
+        custom = CountingCodec()
+        pool = pg.PgDbPool(self.uri(), pool_size=1, json_codec=custom)
+        try:
+            with pool.transaction() as cursor:
+                self.assertIs(cursor.json_codec, custom)
+                row = cursor.execute_and_get(
+                    q, ({'a': decimal.Decimal('0.1')}, {'b': 1}))
+        finally:
+            pool.close()
+        self.assertEqual(row['doc'], {'a': decimal.Decimal('0.1')})
+        self.assertEqual(row['raw'], {'b': 1})
+        self.assertEqual(custom.calls, {'loads': 2, 'dumps': 2})
+
+        with self.pool.transaction() as cursor:
+            self.assertIs(cursor.json_codec, codec.get_codec())
+
+        with self.assertRaises(ValueError):
+            pg.PgDbPool(self.uri(), json_codec='marshal')
+
+    def test_lazy_entities(self):
+        custom = CountingCodec()
+        pool = pg.PgDbPool(self.uri(), pool_size=1, json_codec=custom)
+        q = 'SELECT "entity_id", "doc" FROM "test_pg__live" ' \
+            'ORDER BY "entity_id" LIMIT 3;'
+        try:
+            with pool.transaction() as cursor:
+                entities = list(cursor.execute(q).entities(
+                    TestEntity, lazy=True))
+        finally:
+            pool.close()
+        self.assertTrue(entities)
+        self.assertEqual(custom.calls['loads'], 0)
+        for e in entities:
+            self.assertIs(e._doc.codec, custom)
+            self.assertIsInstance(e.doc, dict)
+        self.assertEqual(custom.calls['loads'], len(entities))
+
+    def test_bulk_load(self):
+        custom = CountingCodec()
+        pool = pg.PgDbPool(self.uri(), pool_size=1, json_codec=custom)
+        doc = {'attr1': 'codec', 'attr2': 'codec-test', 'attr3': 'a\\b',
+               'attr4': 1, 'attr5': 2, 'attr7': arrow.utcnow()}
+        try:
+            with pool.transaction() as cursor:
+                cnt = TestEntity.bulk_load(
+                    cursor, [TestEntity(doc=doc) for __ in range(3)])
+                q, params = TestEntity.qbuilder.select(
+                    {'attr2': 'codec-test'})
+                entities = list(cursor.execute(q, params).entities(
+                    TestEntity))
+        finally:
+            pool.close()
+        self.assertEqual(cnt, 3)
+        self.assertTrue(len(entities) >= 3)
+        self.assertEqual(entities[0].attr3, 'a\\b')
+        self.assertTrue(custom.calls['dumps'] >= 3)
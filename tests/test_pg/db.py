@@ -2,8 +2,10 @@
 
 from __future__ import division
 
+import decimal
 import logging
 import random
+import threading
 import time
 import unittest
 
@@ -12,12 +14,13 @@ import psycopg2.extensions
 from jukoro import arrow
 from jukoro import pg
 
-from .base import Base, BaseWithPool
+from .base import Base, BaseWithPool, TestEntity
 
 
-__all__ = ['TestPgPool', 'TestPgConnection', 'TestHistory', 'TestAutoCommit',
-           'TestManualCommit', 'TestRollback', 'TestNamedCursor', 'TestFetch',
-           'TestCallProc']
+__all__ = ['TestPgPool', 'TestPgPoolHealth', 'TestPgRoutingPool',
+           'TestPreparedStatements', 'TestPgConnection', 'TestHistory',
+           'TestAutoCommit', 'TestManualCommit', 'TestRollback',
+           'TestNamedCursor', 'TestFetch', 'TestRowFactory', 'TestCallProc']
 
 
 logger = logging.getLogger(__name__)
@@ -57,6 +60,467 @@ class TestPgPool(BaseWithPool):
         with self.assertRaises(pg.PoolClosed):
             pool.transaction()
 
+    def test_lazy_warm_up(self):
+        pool = pg.PgDbPool(self.uri(), pool_size=4, min_size=2)
+
+        with pool.transaction():
+            self.assertEqual(len(pool), 2)
+
+        with pool.transaction(), pool.transaction(), pool.transaction():
+            self.assertEqual(len(pool), 3)
+
+        self.assertEqual(pool.stats.overflow_total, 0)
+        pool.close()
+
+    def test_empty_warm_up(self):
+        pool = pg.PgDbPool(self.uri(), pool_size=2, min_size=0, warm_up=True)
+        self.assertEqual(len(pool), 0)
+
+        with pool.transaction():
+            self.assertEqual(len(pool), 1)
+
+        self.assertEqual(pool.stats.overflow_total, 0)
+        pool.close()
+
+        with self.assertRaises(ValueError):
+            pg.PgDbPool(self.uri(), min_size=-1)
+
+    def test_eager_warm_up(self):
+        pool = pg.PgDbPool(self.uri(), pool_size=4, min_size=3, warm_up=True)
+
+        self.assertEqual(len(pool), 3)
+        # FIXME do not test private members
+        conns = [pool._pool.next() for __ in xrange(3)]
+        for conn in conns:
+            self.assertGreater(conn.age, 0)
+            pool.unlock(conn)
+
+        # already warmed up
+        pool.warm_up()
+        self.assertEqual(len(pool), 3)
+        pool.close()
+
+    def test_pool_modes(self):
+        pool = pg.PgDbPool(self.uri(), pool_size=2)
+
+        with pool.transaction(autocommit=False) as cursor:
+            cursor.execute('SELECT 1;')
+            conn = cursor._pg_conn
+
+        self.assertFalse(conn.autocommit)
+        self.assertEqual(pool.stats.mode_switches, 1)
+
+        for __ in xrange(3):
+            with pool.transaction() as cursor:
+                self.assertIsNot(cursor._pg_conn, conn)
+            with pool.transaction(autocommit=False) as cursor:
+                self.assertIs(cursor._pg_conn, conn)
+
+        self.assertEqual(pool.stats.mode_switches, 1)
+        pool.close()
+
+    def test_pool_overflow(self):
+        pool = pg.PgDbPool(self.uri(), pool_size=1, max_overflow=1,
+                           timeout=0.1)
+
+        cur1 = pool.transaction()
+        cur2 = pool.transaction()
+
+        self.assertEqual(pool.stats.overflow, 1)
+        self.assertEqual(pool.stats.overflow_total, 1)
+
+        with self.assertRaises(pg.PoolExhausted):
+            pool.transaction()
+
+        stats = pool.stats
+        self.assertEqual(stats.waits, 1)
+        self.assertEqual(stats.timeouts, 1)
+        self.assertGreaterEqual(stats.wait_time, 0.1)
+
+        overflow_conn = cur2._pg_conn
+        cur2.close()
+        self.assertTrue(overflow_conn.is_closed)
+        self.assertEqual(pool.stats.overflow, 0)
+
+        cur1.close()
+        self.assertEqual(len(pool), 1)
+        pool.close()
+
+    def test_pool_wait(self):
+        pool = pg.PgDbPool(self.uri(), pool_size=1, max_overflow=0,
+                           timeout=5)
+        cur1 = pool.transaction()
+        conn = cur1._pg_conn
+
+        th = threading.Timer(0.2, cur1.close)
+        th.start()
+
+        with pool.transaction() as cur2:
+            self.assertIs(cur2._pg_conn, conn)
+        th.join()
+
+        stats = pool.stats
+        self.assertEqual(stats.waits, 1)
+        self.assertEqual(stats.timeouts, 0)
+        self.assertEqual(stats.overflow_total, 0)
+        self.assertGreater(stats.wait_max, 0.1)
+        pool.close()
+
+    def test_pool_fifo(self):
+        pool = pg.PgDbPool(self.uri(), pool_size=1, max_overflow=0,
+                           timeout=5)
+        cur = pool.transaction()
+        order = []
+
+        def work(idx):
+            with pool.transaction():
+                order.append(idx)
+
+        threads = []
+        for idx in xrange(3):
+            th = threading.Thread(target=work, args=(idx, ))
+            th.start()
+            threads.append(th)
+            while pool.stats.waiting <= idx:
+                time.sleep(0.01)
+        cur.close()
+        for th in threads:
+            th.join()
+
+        self.assertEqual(order, [0, 1, 2])
+        stats = pool.stats
+        self.assertEqual(stats.waits, 3)
+        self.assertEqual(stats.waiting, 0)
+        self.assertEqual(stats.busy, 0)
+        pool.close()
+
+    def test_pool_closed_while_waiting(self):
+        pool = pg.PgDbPool(self.uri(), pool_size=1, max_overflow=0)
+        pool.transaction()
+
+        th = threading.Timer(0.2, pool.close)
+        th.start()
+
+        with self.assertRaises(pg.PoolClosed):
+            pool.transaction()
+        th.join()
+
+
+class TestPgPoolHealth(Base):
+
+    def _pid(self, cursor):
+        return cursor.execute_and_get('SELECT pg_backend_pid() AS pid;')['pid']
+
+    def test_max_lifetime(self):
+        pool = pg.PgDbPool(self.uri(), pool_size=1, max_lifetime=0.1)
+
+        with pool.transaction() as cursor:
+            pid1 = self._pid(cursor)
+        with pool.transaction() as cursor:
+            self.assertEqual(self._pid(cursor), pid1)
+
+        time.sleep(0.2)
+
+        with pool.transaction() as cursor:
+            self.assertNotEqual(self._pid(cursor), pid1)
+
+        self.assertEqual(pool.stats.recycled, 1)
+        pool.close()
+
+    def test_check_idle(self):
+        pool = pg.PgDbPool(self.uri(), pool_size=1, check_idle=0)
+
+        with pool.transaction() as cursor:
+            pid1 = self._pid(cursor)
+
+        with pg.PgConnection(self.uri(), autoclose=True).transaction() as c:
+            c.execute('SELECT pg_terminate_backend(%s);', (pid1, ))
+
+        with pool.transaction() as cursor:
+            self.assertNotEqual(self._pid(cursor), pid1)
+
+        self.assertEqual(pool.stats.broken, 1)
+        pool.close()
+
+    def test_reaper(self):
+        pool = pg.PgDbPool(self.uri(), pool_size=3, min_size=1,
+                           idle_timeout=0.1, reap_interval=0.05)
+
+        with pool.transaction() as c1, pool.transaction() as c2, \
+                pool.transaction() as c3:
+            for c in (c1, c2, c3):
+                self._pid(c)
+
+        self.assertEqual(len(pool), 3)
+
+        time.sleep(0.5)
+
+        self.assertEqual(len(pool), 1)
+        self.assertEqual(pool.stats.reaped, 2)
+
+        # pool grows on demand
+        with pool.transaction() as c1, pool.transaction() as c2:
+            self._pid(c1)
+            self._pid(c2)
+
+        self.assertEqual(len(pool), 2)
+        self.assertEqual(pool.stats.overflow_total, 0)
+        pool.close()
+
+
+class TestPgRoutingPool(Base):
+
+    def _busy(self, pool):
+        stats = pool.stats
+        return [stats.primary.busy] + [x.busy for x in stats.replicas]
+
+    def test_routing(self):
+        uri = self.uri()
+        pool = pg.PgRoutingPool(uri, [uri, uri], pool_size=2)
+
+        with pool.transaction():
+            self.assertEqual(self._busy(pool), [1, 0, 0])
+        with pool.transaction(readonly=True):
+            self.assertEqual(self._busy(pool), [0, 1, 0])
+        with pool.transaction(readonly=True):
+            self.assertEqual(self._busy(pool), [0, 0, 1])
+        with pool.transaction(named=True, readonly=True) as cursor:
+            self.assertEqual(self._busy(pool), [0, 1, 0])
+            res = cursor.execute('SELECT 1 AS "a";')
+            self.assertEqual(res.get()['a'], 1)
+        # named transaction can write so it is routed to primary
+        with pool.transaction(named=True):
+            self.assertEqual(self._busy(pool), [1, 0, 0])
+
+        self.assertEqual(len(pool), 6)
+        pool.close()
+        self.assertTrue(pool.is_closed)
+        with self.assertRaises(pg.PoolClosed):
+            pool.transaction(readonly=True)
+
+    def test_least_busy(self):
+        uri = self.uri()
+        pool = pg.PgRoutingPool(uri, [uri, uri], strategy='least_busy',
+                                pool_size=2)
+
+        cur1 = pool.transaction(readonly=True)
+        self.assertEqual(self._busy(pool), [0, 1, 0])
+        with pool.transaction(readonly=True):
+            self.assertEqual(self._busy(pool), [0, 1, 1])
+        # round-robin would choose first replica
+        with pool.transaction(readonly=True):
+            self.assertEqual(self._busy(pool), [0, 1, 1])
+        cur1.close()
+        pool.close()
+
+        with self.assertRaises(ValueError):
+            pg.PgRoutingPool(uri, [uri], strategy='random')
+
+    def test_fallback(self):
+        uri = self.uri()
+        pool = pg.PgRoutingPool(uri, [self.tst_uri(), uri], pool_size=1,
+                                retry_interval=0.2)
+
+        for __ in xrange(3):
+            with pool.transaction(readonly=True) as cursor:
+                cursor.execute('SELECT 1;')
+                self.assertEqual(self._busy(pool), [0, 0, 1])
+
+        stats = pool.stats
+        self.assertEqual(stats.replica_failures, 1)
+        self.assertEqual(stats.fallbacks, 0)
+        self.assertEqual(stats.replicas[0].busy, 0)
+
+        pool.close()
+
+        # no replicas available
+        pool = pg.PgRoutingPool(uri, [self.tst_uri()], pool_size=1,
+                                retry_interval=0.2)
+        for __ in xrange(2):
+            with pool.transaction(readonly=True):
+                self.assertEqual(self._busy(pool), [1, 0])
+
+        time.sleep(0.3)
+
+        # failed replica is tried again after retry interval
+        with pool.transaction(readonly=True):
+            self.assertEqual(self._busy(pool), [1, 0])
+
+        stats = pool.stats
+        self.assertEqual(stats.replica_failures, 2)
+        self.assertEqual(stats.fallbacks, 3)
+        pool.close()
+
+    def test_exhausted_fallback(self):
+        uri = self.uri()
+        pool = pg.PgRoutingPool(uri, [uri, uri], pool_size=1,
+                                max_overflow=0, timeout=0.05)
+        with pool.transaction(readonly=True):
+            with pool.transaction(readonly=True):
+                self.assertEqual(self._busy(pool), [0, 1, 1])
+                with pool.transaction(readonly=True):
+                    self.assertEqual(self._busy(pool), [1, 1, 1])
+
+        stats = pool.stats
+        self.assertEqual(stats.replica_exhausted, 2)
+        self.assertEqual(stats.fallbacks, 1)
+        pool.close()
+
+    def test_broken_fallback(self):
+        uri = self.uri()
+        pool = pg.PgRoutingPool(uri, [uri], pool_size=1)
+        with pool.transaction(readonly=True) as cursor:
+            pid = cursor.execute_and_get(
+                'SELECT pg_backend_pid() AS "pid";')['pid']
+        # replica goes away while connection is kept in pool
+        with pool.transaction() as cursor:
+            cursor.execute('SELECT pg_terminate_backend(%s);', (pid, ))
+        time.sleep(0.1)
+
+        # connection is not validated on checkout, query fails and
+        # replica is excluded from routing
+        with self.assertRaises(psycopg2.OperationalError):
+            with pool.transaction(readonly=True) as cursor:
+                self.assertEqual(self._busy(pool), [0, 1])
+                cursor.execute('SELECT 1;')
+        self.assertEqual(self._busy(pool), [0, 0])
+        self.assertEqual(pool.stats.replica_failures, 1)
+
+        with pool.transaction(readonly=True) as cursor:
+            self.assertEqual(self._busy(pool), [1, 0])
+            cursor.execute('SELECT 1;')
+
+        stats = pool.stats
+        self.assertEqual(stats.replica_failures, 1)
+        self.assertEqual(stats.fallbacks, 1)
+        pool.close()
+
+    def test_check_idle(self):
+        uri = self.uri()
+        pool = pg.PgRoutingPool(uri, [uri], pool_size=1, check_idle=0)
+        with pool.transaction(readonly=True) as cursor:
+            pid = cursor.execute_and_get(
+                'SELECT pg_backend_pid() AS "pid";')['pid']
+        with pool.transaction() as cursor:
+            cursor.execute('SELECT pg_terminate_backend(%s);', (pid, ))
+        time.sleep(0.1)
+
+        # idle connection is validated by replica pool and reestablished
+        with pool.transaction(readonly=True) as cursor:
+            self.assertEqual(self._busy(pool), [0, 1])
+            cursor.execute('SELECT 1;')
+
+        stats = pool.stats
+        self.assertEqual(stats.replicas[0].broken, 1)
+        self.assertEqual(stats.replica_failures, 0)
+        self.assertEqual(stats.fallbacks, 0)
+        pool.close()
+
+
+class TestPreparedStatements(Base):
+
+    def _prepared(self, cursor):
+        return cursor.execute_and_get(
+            'SELECT COUNT(*) AS "cnt" FROM pg_prepared_statements;')['cnt']
+
+    def test_cache(self):
+        pool = pg.PgDbPool(self.uri(), pool_size=1, statement_cache_size=2)
+        q = 'SELECT %s::int + 1 AS "a", \'%%\' AS "b";'
+
+        with pool.transaction() as cursor:
+            for idx in xrange(3):
+                row = cursor.execute_and_get(q, (idx, ))
+                self.assertEqual(row, {'a': idx + 1, 'b': '%'})
+            queries = list(cursor.queries)
+            self.assertTrue(queries[0].startswith('EXECUTE ju_stmt_'))
+            self.assertEqual(len(cursor._pg_conn.statements), 1)
+
+        stats = pool.stats
+        self.assertEqual(stats.statement_misses, 1)
+        self.assertEqual(stats.statement_hits, 2)
+
+        with pool.transaction() as cursor:
+            cursor.execute('SELECT 2;')
+            cursor.execute('SELECT 3;')
+            # not preparable: tuple parameter, dict parameters, utility
+            cursor.execute('SELECT %s::int;', (2, ))
+            cursor.execute('SELECT 1 WHERE 1 IN %s;', ((1, 2), ))
+            cursor.execute('SELECT %(a)s::int;', {'a': 1})
+            cursor.execute('SHOW search_path;')
+            self.assertEqual(self._prepared(cursor), 2)
+            conn = cursor._pg_conn
+
+        # counting query is prepared too
+        self.assertEqual(pool.stats.statement_evictions, 3)
+
+        # cache is invalidated on reconnect
+        conn.recycle()
+        with pool.transaction() as cursor:
+            cursor.execute('SELECT 3;')
+            self.assertEqual(self._prepared(cursor), 2)
+
+        pool.close()
+
+    def test_named(self):
+        pool = pg.PgDbPool(self.uri(), pool_size=1, statement_cache_size=2)
+        with pool.transaction(autocommit=False, named=True) as cursor:
+            cursor.execute('SELECT %s::int AS "a";', (1, ))
+            self.assertTrue('DECLARE' in ''.join(cursor.queries))
+
+        # failed statement is not prepared again
+        with pool.transaction(autocommit=False) as cursor:
+            conn = cursor._pg_conn
+            with self.assertRaises(pg.ProgrammingError):
+                cursor.execute('SELECT "unknown" FROM "test_pg";')
+        self.assertEqual(conn.statements._store.values(),
+                         [pg.db.UNPREPARABLE])
+        pool.close()
+
+    def test_untyped(self):
+        for autocommit in (True, False):
+            pool = pg.PgDbPool(self.uri(), pool_size=1,
+                               statement_cache_size=8)
+            with pool.transaction(autocommit=autocommit) as cursor:
+                # parameters types can't be inferred
+                row = cursor.execute_and_get(
+                    'SELECT 1 AS "a" WHERE %s IS NULL;', (None, ))
+                self.assertEqual(row, {'a': 1})
+                row = cursor.execute_and_get(
+                    'SELECT pg_typeof(%s)::text AS "t";', (1, ))
+                self.assertEqual(row, {'t': 'integer'})
+                # parameter type is inferred as text
+                for idx in xrange(2):
+                    row = cursor.execute_and_get('SELECT %s AS "t";', (1, ))
+                    self.assertEqual(row, {'t': 1})
+                row = cursor.execute_and_get('SELECT %s AS "t";', ('a', ))
+                self.assertEqual(row, {'t': 'a'})
+                # typed parameter is prepared
+                row = cursor.execute_and_get(
+                    'SELECT %s::int + 1 AS "t";', (1, ))
+                self.assertEqual(row, {'t': 2})
+                self.assertTrue(
+                    list(cursor.queries)[-1].startswith('EXECUTE'))
+                # counting query is prepared too
+                self.assertEqual(self._prepared(cursor), 2)
+            pool.close()
+
+    def test_mismatched(self):
+        pool = pg.PgDbPool(self.uri(), pool_size=1, statement_cache_size=8)
+        q = 'SELECT COUNT(*) AS "cnt" FROM (VALUES (1), (2), (3)) ' \
+            'AS "t"("x") WHERE "x" < %s;'
+        with pool.transaction() as cursor:
+            for value, cnt, prepared in ((3, 2, True),
+                                         (2.4, 2, False),
+                                         (decimal.Decimal('2.4'), 2, False),
+                                         (2.0, 1, True)):
+                row = cursor.execute_and_get(q, (value, ))
+                # EXECUTE would round non-integral value for integer
+                # parameter
+                self.assertEqual(row['cnt'], cnt)
+                self.assertEqual(
+                    list(cursor.queries)[-1].startswith('EXECUTE'), prepared)
+        pool.close()
+
 
 class TestPgConnection(Base):
 
@@ -73,6 +537,42 @@ class TestPgConnection(Base):
             res = cursor.execute_and_get('SHOW TIME ZONE;')
             self.assertEqual(res['TimeZone'], 'UTC')
 
+    def test_connection_session_params(self):
+        uri = self.uri() + '?application_name=ju_test&statement_timeout=1234' \
+            '&work_mem=8MB'
+
+        with pg.PgConnection(uri, autoclose=True).transaction() as cursor:
+            res = cursor.execute_and_get('SHOW application_name;')
+            self.assertEqual(res['application_name'], 'ju_test')
+
+            res = cursor.execute_and_get('SHOW statement_timeout;')
+            self.assertEqual(res['statement_timeout'], '1234ms')
+
+            res = cursor.execute_and_get('SHOW work_mem;')
+            self.assertEqual(res['work_mem'], '8MB')
+
+            res = cursor.execute_and_get('SHOW transaction_isolation;')
+            self.assertEqual(res['transaction_isolation'], 'read committed')
+
+    def test_connection_autocommit(self):
+        conn = pg.PgConnection(self.uri())
+
+        self.assertTrue(conn.autocommit)
+        self.assertFalse(conn.in_transaction)
+
+        cursor = conn.transaction(autocommit=False)
+        cursor.execute('SELECT 1;')
+
+        self.assertFalse(conn.autocommit)
+        self.assertFalse(conn.conn.autocommit)
+        self.assertTrue(conn.in_transaction)
+
+        conn.commit()
+        self.assertFalse(conn.in_transaction)
+
+        cursor.close()
+        conn.close()
+
     def test_connection_close(self):
         uri = self.uri()
 
@@ -514,6 +1014,98 @@ class TestFetch(BaseWithPool):
             with self.assertRaises(pg.DoesNotExist):
                 res.scroll(cnt)
 
+    def test_entities(self):
+        q = 'SELECT "entity_id", "doc" from "test_pg__live" ' \
+            'ORDER BY "entity_id";'
+
+        with self.pool.transaction(block_size=75) as cursor:
+            rows = cursor.execute(q).all()
+            eager = list(cursor.execute(q).entities(TestEntity))
+            lazy = list(cursor.execute(q).entities(TestEntity, lazy=True))
+            row = cursor.execute(q).get()
+
+        self.assertEqual(len(eager), len(rows))
+        self.assertEqual(len(lazy), len(rows))
+        self.assertIsInstance(row['doc'], dict)
+        for r, e1, e2 in zip(rows, eager, lazy):
+            self.assertIsInstance(e1, TestEntity)
+            self.assertIsInstance(e2, TestEntity)
+            self.assertIsInstance(e1._doc, dict)
+            self.assertIsInstance(e2._doc, pg.codec.RawJson)
+            self.assertEqual(e2.entity_id, r['entity_id'])
+            self.assertIsInstance(e2._doc, pg.codec.RawJson)
+            self.assertEqual(e2.attr1, r['doc']['attr1'])
+            self.assertIsInstance(e2._doc, dict)
+            self.assertEqual(e1.doc, e2.doc)
+
+        with self.pool.transaction() as cursor:
+            res = cursor.execute(q)
+
+        with self.assertRaises(pg.CursorClosed):
+            res.entities(TestEntity)
+
+
+class TestRowFactory(BaseWithPool):
+
+    def test_rows(self):
+        q = 'SELECT "entity_id", "doc" from "test_pg__live" ' \
+            'ORDER BY "entity_id" LIMIT 10;'
+
+        with self.pool.transaction() as cursor:
+            expected = cursor.execute(q).all()
+
+        for row_factory in ('tuple', 'namedtuple'):
+            with self.pool.transaction(row_factory=row_factory) as cursor:
+                res = cursor.execute(q)
+                rows = res.all()
+                self.assertIsInstance(rows[0], tuple)
+                self.assertEqual(res.fields, ['entity_id', 'doc'])
+                self.assertEqual(map(res.as_dict, rows), expected)
+                self.assertEqual(
+                    cursor.execute(q).scalar(), expected[0]['entity_id'])
+            if row_factory == 'namedtuple':
+                self.assertEqual(rows[0].entity_id, expected[0]['entity_id'])
+
+            for named in (False, True):
+                with self.pool.transaction(row_factory=row_factory,
+                                           named=named) as cursor:
+                    entities = list(cursor.execute(q).entities(TestEntity))
+                self.assertEqual([x.entity_id for x in entities],
+                                 [x['entity_id'] for x in expected])
+                self.assertEqual([x.doc for x in entities],
+                                 [x['doc'] for x in expected])
+
+        with self.assertRaises(ValueError):
+            self.pool.transaction(row_factory='list')
+
+    def test_entities(self):
+        entity_id, cond = self.entity_id, {'attr2': 'mistery'}
+        with self.pool.transaction() as cursor:
+            expected = TestEntity.by_id(cursor, entity_id)
+            cnt = TestEntity.count(cursor, cond)
+            page, __ = TestEntity.page(cursor, cond, limit=5, only='attr3')
+
+        with self.pool.transaction(row_factory='tuple') as cursor:
+            entity = TestEntity.by_id(cursor, entity_id)
+            self.assertEqual(entity.doc, expected.doc)
+            self.assertEqual(TestEntity.count(cursor, cond), cnt)
+            self.assertTrue(TestEntity.exists(cursor, cond))
+            self.assertTrue(TestEntity.count(cursor, estimate=True) > 0)
+            entities, __ = TestEntity.page(cursor, cond, limit=5,
+                                           only='attr3')
+            self.assertEqual([(x.entity_id, x.doc) for x in entities],
+                             [(x.entity_id, x.doc) for x in page])
+            self.assertTrue(all(x.partial for x in entities))
+            res = TestEntity.aggregate(cursor, {'cnt': ('count', None)},
+                                       cond)
+            self.assertEqual(res, [{'cnt': cnt}])
+
+            entity.attr6 = 42
+            entity = entity.save(cursor)
+            self.assertEqual(entity.attr6, 42)
+            versions = TestEntity.history(cursor, entity_id)
+            self.assertEqual(versions[-1].entity.attr6, 42)
+
 
 @unittest.skip('TODO')
 class TestCallProc(Base):
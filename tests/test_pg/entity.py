@@ -1,14 +1,22 @@
 # -*- coding: utf-8 -*-
 
+import csv
+import gzip
+import StringIO
+
 from jukoro import arrow
+from jukoro import json
 
 from jukoro import pg
 from jukoro.pg import storage
+from jukoro.pg.expr import Key
 
 from .base import Base, BaseWithPool, TestEntity
 
 
-__all__ = ['TestAbstractEntity', 'TestEntityMeta']
+__all__ = ['TestAbstractEntity', 'TestEntityMeta', 'TestBulkCreate',
+           'TestBulkUpdate', 'TestBulkLoad', 'TestExport', 'TestPage',
+           'TestPartial', 'TestAggregate', 'TestHistory']
 
 
 class TestAbstractEntity(Base):
@@ -166,3 +174,428 @@ class TestEntityMeta(BaseWithPool):
 
             doc = res[0]['doc']
             self.assertTrue('_deleted' in doc)
+
+
+class TestBulkCreate(BaseWithPool):
+
+    def _entities(self, cnt):
+        for idx in xrange(cnt):
+            yield TestEntity(doc={'attr1': 'bulk-%s' % idx,
+                                  'attr2': 'musician',
+                                  'attr3': 'boundary',
+                                  'attr4': idx,
+                                  'attr5': idx * 10,
+                                  'attr7': arrow.utcnow()})
+
+    def test_bulk_create(self):
+        timings = []
+        with self.pool.transaction(autocommit=False) as cursor:
+            created = TestEntity.bulk_create(
+                cursor, self._entities(25), chunk_size=10, timings=timings)
+            self.assertEqual(timings, [])
+
+            created = list(created)
+            self.assertEqual(len(created), 25)
+            self.assertTrue(all(x.entity_id for x in created))
+            self.assertEqual(sorted(x.attr4 for x in created), range(25))
+            self.assertTrue(all(x.created for x in created))
+
+            self.assertEqual([x.rows for x in timings], [10, 10, 5])
+            self.assertTrue(all(x.elapsed > 0 for x in timings))
+            self.assertEqual(len(list(cursor.queries)), 3)
+
+        self.assertEqual(list(TestEntity.bulk_create(cursor, [])), [])
+
+
+class TestBulkUpdate(BaseWithPool):
+
+    def test_bulk_update(self):
+        q = 'SELECT "entity_id", "entity_start", "entity_end", "doc" ' \
+            'FROM "test_pg" WHERE "entity_id" = ANY(%s) ' \
+            'ORDER BY "entity_id", "entity_start";'
+        timings = []
+
+        with self.pool.transaction() as cursor:
+            entities = list(TestEntity.bulk_create(cursor, (
+                TestEntity(doc={'attr1': 'bulk-%s' % idx,
+                                'attr2': 'musician',
+                                'attr3': 'boundary',
+                                'attr4': idx,
+                                'attr5': idx * 10,
+                                'attr7': arrow.utcnow()})
+                for idx in xrange(5))))
+            ids = [x.entity_id for x in entities]
+
+        with self.pool.transaction(autocommit=False) as cursor:
+            for idx, entity in enumerate(entities):
+                entity.update(attr5=idx * 100)
+            updated = TestEntity.bulk_update(
+                cursor, iter(entities), chunk_size=3, timings=timings)
+            self.assertEqual(timings, [])
+            updated = list(updated)
+            self.assertEqual([x.rows for x in timings], [3, 2])
+            self.assertEqual(len(list(cursor.queries)), 2)
+
+        self.assertEqual(sorted(x.entity_id for x in updated), ids)
+        self.assertEqual(sorted(x.attr5 for x in updated),
+                         [0, 100, 200, 300, 400])
+        self.assertTrue(all(x.created == y.created
+                            for x, y in zip(entities, updated)))
+
+        with self.pool.transaction() as cursor:
+            rows = cursor.execute(q, (ids, )).all()
+            self.assertEqual(len(rows), 10)
+            for old, new in zip(rows[::2], rows[1::2]):
+                self.assertEqual(old['entity_id'], new['entity_id'])
+                self.assertEqual(old['entity_end'], new['entity_start'])
+                self.assertNotEqual(old['doc']['_updated'],
+                                    new['doc']['_updated'])
+            live = [TestEntity.by_id(cursor, x) for x in ids]
+        self.assertEqual([x.attr5 for x in live], [0, 100, 200, 300, 400])
+
+        with self.assertRaises(ValueError):
+            list(TestEntity.bulk_update(cursor, [TestEntity()]))
+
+
+class TestBulkLoad(BaseWithPool):
+
+    def _entities(self, cnt):
+        for idx in xrange(cnt):
+            yield TestEntity(doc={'attr1': u'lo\\ad\t\u00e9\n-%s' % idx,
+                                  'attr2': 'musician',
+                                  'attr3': 'boundary',
+                                  'attr4': idx,
+                                  'attr5': idx * 10,
+                                  'attr7': arrow.utcnow()})
+
+    def test_bulk_load(self):
+        q = 'SELECT "entity_id", "doc" FROM "test_pg__live" ' \
+            'WHERE "entity_id" > %s ORDER BY "entity_id";'
+
+        with self.pool.transaction() as cursor:
+            last_id = cursor.execute_and_get(
+                'SELECT MAX("entity_id") AS "id" FROM "test_pg";')['id']
+            cnt = TestEntity.bulk_load(cursor, self._entities(50))
+            self.assertEqual(cnt, 50)
+            self.assertTrue(any('COPY' in x for x in cursor.queries))
+
+            rows = cursor.execute(q, (last_id, )).all()
+            loaded = [TestEntity(**x) for x in rows]
+
+        expected = list(self._entities(50))
+        self.assertEqual(len(loaded), 50)
+        for a, b in zip(expected, loaded):
+            self.assertEqual(a.attr1, b.attr1)
+            self.assertEqual(a.attr4, b.attr4)
+            self.assertIsNotNone(b.created)
+            self.assertEqual(b.created, b.updated)
+
+        # staging table can be reused within the same transaction
+        with self.pool.transaction(autocommit=False) as cursor:
+            self.assertEqual(TestEntity.bulk_load(cursor, []), 0)
+            self.assertEqual(
+                TestEntity.bulk_load(cursor, self._entities(3)), 3)
+
+        # constraints are checked
+        with self.pool.transaction(autocommit=False) as cursor:
+            with self.assertRaises(pg.IntegrityError):
+                TestEntity.bulk_load(cursor, [TestEntity(doc={'attr1': 1})])
+
+
+class TestExport(BaseWithPool):
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestExport, cls).setUpClass()
+        cls.marker = 'exporter-%s' % arrow.utcnow().timestamp
+        if not cls.is_online():
+            return
+        with cls.pool.transaction() as cursor:
+            list(TestEntity.bulk_create(cursor, (
+                TestEntity(doc={'attr1': u'ex"po\\rt\n\u00e9,-%s' % idx,
+                                'attr2': cls.marker,
+                                'attr3': 'boundary',
+                                'attr4': idx,
+                                'attr5': idx * 10,
+                                'attr7': arrow.utcnow()})
+                for idx in xrange(10))))
+
+    def export(self, **kwargs):
+        stream = StringIO.StringIO()
+        with self.pool.transaction() as cursor:
+            cnt = TestEntity.export(cursor, stream, {'attr2': self.marker},
+                                    order_by='attr4', **kwargs)
+        return cnt, stream.getvalue()
+
+    def test_ndjson(self):
+        cnt, data = self.export()
+        self.assertEqual(cnt, 10)
+        lines = data.splitlines()
+        self.assertEqual(len(lines), 10)
+        rows = [json.loads(x) for x in lines]
+        self.assertEqual([x['doc']['attr4'] for x in rows], range(10))
+        self.assertEqual(rows[3]['doc']['attr1'], u'ex"po\\rt\n\u00e9,-3')
+        self.assertTrue(all(x['entity_id'] for x in rows))
+
+        cnt, data = self.export(limit=3, offset=2)
+        self.assertEqual(cnt, 3)
+        rows = [json.loads(x) for x in data.splitlines()]
+        self.assertEqual([x['doc']['attr4'] for x in rows], [2, 3, 4])
+
+    def test_csv(self):
+        cnt, data = self.export(fmt='csv')
+        self.assertEqual(cnt, 10)
+        rows = list(csv.DictReader(StringIO.StringIO(data)))
+        self.assertEqual(len(rows), 10)
+        doc = json.loads(rows[5]['doc'])
+        self.assertEqual(doc['attr1'], u'ex"po\\rt\n\u00e9,-5')
+        self.assertTrue(int(rows[5]['entity_id']))
+
+        with self.assertRaises(ValueError):
+            self.export(fmt='xml')
+
+    def test_compress(self):
+        cnt, data = self.export()
+        gz_cnt, gz_data = self.export(compress=True)
+        self.assertEqual(cnt, gz_cnt)
+        self.assertNotEqual(data, gz_data)
+        gz = gzip.GzipFile(fileobj=StringIO.StringIO(gz_data))
+        self.assertEqual(gz.read(), data)
+
+    def test_iter(self):
+        cnt, data = self.export()
+        with self.pool.transaction() as cursor:
+            chunks = list(TestEntity.export_iter(
+                cursor, {'attr2': self.marker}, order_by='attr4'))
+            self.assertEqual(''.join(chunks), data)
+
+            gz_data = ''.join(TestEntity.export_iter(
+                cursor, {'attr2': self.marker}, order_by='attr4',
+                compress=True))
+        gz = gzip.GzipFile(fileobj=StringIO.StringIO(gz_data))
+        self.assertEqual(gz.read(), data)
+
+        with self.pool.transaction() as cursor:
+            with self.assertRaises(ValueError):
+                list(TestEntity.export_iter(cursor, fmt='xml'))
+
+
+class TestPage(BaseWithPool):
+
+    def paginate(self, cursor, limit, **kwargs):
+        res, token, pages = [], None, 0
+        while True:
+            entities, token = TestEntity.page(
+                cursor, {'attr2': 'mistery'}, limit=limit, after=token,
+                **kwargs)
+            res.extend(x.entity_id for x in entities)
+            pages += 1
+            if token is None:
+                return res, pages
+
+    def test_page(self):
+        q = 'SELECT "entity_id" FROM "test_pg__live" ' \
+            'WHERE "doc" @> %s ORDER BY {};'
+        cases = (
+            (None, '"entity_id"'),
+            (['-attr4'], '("doc"->>\'attr4\')::BIGINT DESC, '
+                         '"entity_id" DESC'),
+            (['attr4', '-attr5'], '("doc"->>\'attr4\')::BIGINT, '
+                                  '("doc"->>\'attr5\')::BIGINT DESC, '
+                                  '"entity_id"'),
+        )
+        with self.pool.transaction() as cursor:
+            for order_by, sql_order_by in cases:
+                rows = cursor.execute(q.format(sql_order_by),
+                                      ({'attr2': 'mistery'}, )).all()
+                expected = [x['entity_id'] for x in rows]
+                self.assertTrue(len(expected) > 1000)
+
+                res, pages = self.paginate(cursor, 500, order_by=order_by)
+                self.assertEqual(res, expected)
+                self.assertEqual(pages, (len(expected) + 499) // 500)
+
+    def test_last_page(self):
+        with self.pool.transaction() as cursor:
+            entities, token = TestEntity.page(
+                cursor, {'attr2': 'no-such-value'}, limit=10)
+        self.assertEqual(entities, [])
+        self.assertIsNone(token)
+
+        with self.pool.transaction() as cursor:
+            with self.assertRaises(ValueError):
+                TestEntity.page(cursor, {'attr2': 'no-such-value'})
+
+
+class TestPartial(BaseWithPool):
+
+    def test_partial(self):
+        with self.pool.transaction() as cursor:
+            full = TestEntity.by_id(cursor, self.entity_id)
+            a = TestEntity.by_id(cursor, self.entity_id,
+                                 only=['attr1', 'attr6'])
+            self.assertTrue(a.partial)
+            self.assertFalse(full.partial)
+            self.assertEqual(a.entity_id, full.entity_id)
+            self.assertEqual(a.attr1, full.attr1)
+            self.assertIsNone(a.attr2)
+            self.assertIsNone(a.attr6)
+
+            b = TestEntity.deserialize(a.serialize())
+            self.assertTrue(b.partial)
+
+            with self.assertRaises(ValueError):
+                a.save(cursor)
+
+            entities, token = TestEntity.page(
+                cursor, {'attr2': 'mistery'}, order_by='-attr4', limit=3,
+                only='attr3')
+            self.assertEqual(len(entities), 3)
+            self.assertTrue(all(x.partial for x in entities))
+            self.assertEqual(set(entities[0].doc), {'attr3', 'attr4'})
+            entities, token = TestEntity.page(
+                cursor, {'attr2': 'mistery'}, order_by='-attr4', limit=3,
+                only='attr3', after=token)
+            self.assertEqual(len(entities), 3)
+
+
+class TestAggregate(BaseWithPool):
+
+    def test_count_exists(self):
+        cond = {'attr2': 'mistery'}
+        with self.pool.transaction() as cursor:
+            q, params = TestEntity.qbuilder.select(cond)
+            rows = cursor.execute(q, params).all()
+
+            self.assertEqual(TestEntity.count(cursor, cond), len(rows))
+            self.assertEqual(
+                TestEntity.count(cursor, cond, {'attr2': 'no-such-value'}),
+                len(rows))
+            self.assertTrue(TestEntity.exists(cursor, cond))
+            self.assertFalse(
+                TestEntity.exists(cursor, {'attr2': 'no-such-value'}))
+
+            cursor.execute('ANALYZE "test_pg";')
+            estimate = TestEntity.count(cursor, estimate=True)
+            self.assertIsInstance(estimate, int)
+            self.assertTrue(estimate > 0)
+
+    def test_aggregate(self):
+        cond = {'attr2': 'mistery'}
+        with self.pool.transaction() as cursor:
+            q, params = TestEntity.qbuilder.select(cond)
+            docs = [x['doc'] for x in cursor.execute(q, params).all()]
+
+            res = TestEntity.aggregate(
+                cursor, {'cnt': ('count', None), 'total': ('sum', 'attr5'),
+                         'low': ('min', 'attr5'), 'avg': ('avg', 'attr5')},
+                cond)
+            self.assertEqual(len(res), 1)
+            self.assertEqual(res[0]['cnt'], len(docs))
+            self.assertEqual(res[0]['total'], sum(x['attr5'] for x in docs))
+            self.assertEqual(res[0]['low'], min(x['attr5'] for x in docs))
+            self.assertTrue(res[0]['low'] <= res[0]['avg'])
+
+            res = TestEntity.aggregate(
+                cursor, {'cnt': ('count', None), 'high': ('max', 'attr5')},
+                cond, group_by=['attr4'])
+        expected = {}
+        for doc in docs:
+            cnt, high = expected.get(doc['attr4'], (0, 0))
+            expected[doc['attr4']] = (cnt + 1, max(high, doc['attr5']))
+        self.assertEqual([x['attr4'] for x in res], sorted(expected))
+        for row in res:
+            self.assertEqual((row['cnt'], row['high']),
+                             expected[row['attr4']])
+
+
+class TestHistory(BaseWithPool):
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestHistory, cls).setUpClass()
+
+        class HistoryEntity(pg.AbstractEntity):
+            db_table = 'test_pg_history'
+            db_history = True
+            skip_registry = True
+
+            title = pg.Attr(title='Title', db_index=pg.DbIndex(unique=True))
+            amount = pg.Attr(title='Amount', value_type=int)
+
+        cls.HistoryEntity = HistoryEntity
+        if not cls.is_online():
+            return
+        table = storage.Table(HistoryEntity)
+        sql = ''.join(x.sql for __, items in table.items for x in items)
+        with cls.pool.transaction() as cursor:
+            cursor.execute(sql)
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.is_online():
+            with cls.pool.transaction() as cursor:
+                cursor.execute(
+                    'DROP TABLE "test_pg_history", "test_pg_history__history" '
+                    'CASCADE;')
+        cls.HistoryEntity = None
+        super(TestHistory, cls).tearDownClass()
+
+    def _count(self, cursor, name, ids):
+        q = 'SELECT COUNT(*) AS "cnt" FROM "{}" ' \
+            'WHERE "entity_id" = ANY(%s);'.format(name)
+        return cursor.execute_and_get(q, (ids, ))['cnt']
+
+    def test_names(self):
+        klass = self.HistoryEntity
+        self.assertEqual(klass.db_history.name, 'test_pg_history__history')
+        self.assertIsNone(TestEntity.db_history)
+        self.assertEqual(
+            [x.name for x in storage.Table(klass).tables],
+            ['test_pg_history', 'test_pg_history__history'])
+        self.assertEqual(
+            [x.name for x in storage.Table(TestEntity).tables], ['test_pg'])
+
+    def test_history(self):
+        klass = self.HistoryEntity
+        with self.pool.transaction() as cursor:
+            entities = list(klass.bulk_create(cursor, (
+                klass(doc={'title': 'history-%s' % idx, 'amount': idx})
+                for idx in xrange(3))))
+            ids = [x.entity_id for x in entities]
+
+            entity = entities[0]
+            entity.update(amount=10)
+            entity = entity.save(cursor)
+            self.assertEqual(klass.by_id(cursor, entity.entity_id).amount, 10)
+            entities[1].delete(cursor)
+            self.assertEqual(self._count(cursor, 'test_pg_history', ids), 2)
+            self.assertEqual(
+                self._count(cursor, 'test_pg_history__history', ids), 2)
+
+            for x in entities:
+                x.update(amount=x.amount + 100)
+            updated = list(klass.bulk_update(cursor, entities))
+            self.assertEqual(sorted(x.amount for x in updated), [102, 110])
+            self.assertEqual(klass.count(cursor, Key('amount') > 99), 2)
+
+            self.assertEqual(self._count(cursor, 'test_pg_history', ids), 2)
+            self.assertEqual(
+                self._count(cursor, 'test_pg_history__history', ids), 4)
+            # all versions are available using base table
+            self.assertEqual(self._count(cursor, 'entity', ids), 6)
+
+            q = 'SELECT "entity_start", "entity_end", "doc" ' \
+                'FROM "test_pg_history__history" WHERE "entity_id" = %s ' \
+                'ORDER BY "entity_start";'
+            rows = cursor.execute(q, (ids[1], )).all()
+            self.assertEqual(len(rows), 1)
+            self.assertIn('_deleted', rows[0]['doc'])
+            self.assertLess(rows[0]['entity_end'].year, 2999)
+
+            versions = klass.history(cursor, ids[0])
+            self.assertEqual([x.entity.amount for x in versions],
+                             [0, 10, 110])
+            q, params = klass.qbuilder.as_of(versions[1].start).by_id(ids[0])
+            self.assertEqual(
+                cursor.execute_and_get(q, params)['doc']['amount'], 10)
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+from jukoro.pg import expr
+from jukoro.pg.expr import Key, And, Or, Not, Contains
+
+from .base import Base, BaseWithPool, TestEntity
+
+
+__all__ = ['TestExpr', 'TestExprQueries']
+
+
+class TestExpr(Base):
+    online_required = False
+
+    def compile(self, e):
+        return e.compile(TestEntity)
+
+    def test_conditions(self):
+        cases = (
+            (Key('attr4') == 5, '("doc"->>\'attr4\')::BIGINT = %s', [5]),
+            (Key('attr1') != 'a', '("doc"->>\'attr1\')::TEXT != %s', ['a']),
+            (Key('attr4') <= 5, '("doc"->>\'attr4\')::BIGINT <= %s', [5]),
+            (Key('attr4').in_(xrange(3)),
+             '("doc"->>\'attr4\')::BIGINT = ANY(%s)', [[0, 1, 2]]),
+            (Key('attr1').ilike('a%'),
+             '("doc"->>\'attr1\')::TEXT ILIKE %s', ['a%']),
+            (Key('attr5').between(1, 2),
+             '("doc"->>\'attr5\')::BIGINT BETWEEN %s AND %s', [1, 2]),
+            (Key('attr6').is_null(), '("doc"->>\'attr6\')::BIGINT IS NULL',
+             []),
+            (Key('a', 'b', cast='int').not_null(),
+             '("doc"#>>\'{a,b}\')::INT IS NOT NULL', []),
+            (Key('a', 'b', 'c').exists(), '("doc"#>\'{a,b}\') ? %s', ['c']),
+            (Key('attr6').exists(), '("doc") ? %s', ['attr6']),
+            (Key('a').contains([1]), '("doc"->\'a\') @> %s::jsonb',
+             ['[1]']),
+            (Key('entity_id') > 5, '"entity_id" > %s', [5]),
+            (Contains({'a': 1}), '("doc" @> %s)', [{'a': 1}]),
+        )
+        for e, sql, params in cases:
+            self.assertEqual(self.compile(e), (sql, params))
+
+        with self.assertRaises(ValueError):
+            Key('attr1').op('unknown', 1)
+        with self.assertRaises(ValueError):
+            Key()
+        for key in ('it\'s', 'a,b', '{a}', 'a"b', '100%', 'a b', 1):
+            with self.assertRaises(ValueError):
+                Key('attr1', key)
+        with self.assertRaises(ValueError):
+            Key('entity_id').exists()
+        with self.assertRaises(ValueError):
+            Key('entity_id').contains([1])
+        with self.assertRaises(ValueError):
+            Key('attr1', cast='text; DROP TABLE "test_pg"')
+        self.assertEqual(
+            self.compile(Key('a', cast='double  precision') > 1),
+            ('("doc"->>\'a\')::DOUBLE PRECISION > %s', [1]))
+
+    def test_composition(self):
+        e = (Key('attr4') > 1) & ~(Key('attr1') == 'a') | {'attr2': 'b'}
+        self.assertIsInstance(e, Or)
+        sql, params = self.compile(e)
+        self.assertEqual(
+            sql, '((("doc"->>\'attr4\')::BIGINT > %s AND '
+                 '(NOT ("doc"->>\'attr1\')::TEXT = %s)) OR ("doc" @> %s))')
+        self.assertEqual(params, [1, 'a', {'attr2': 'b'}])
+
+        e = And((('attr4', 'eq', 1), ('attr1', 'in', ('a', 'b'))),
+                Not({'attr2': 'b'}))
+        sql, params = self.compile(e)
+        self.assertEqual(
+            sql, '((("doc"->>\'attr4\')::BIGINT = %s AND '
+                 '("doc"->>\'attr1\')::TEXT IN %s) AND '
+                 '(NOT ("doc" @> %s)))')
+        self.assertEqual(params, [1, ('a', 'b'), {'attr2': 'b'}])
+
+        with self.assertRaises(ValueError):
+            And()
+        with self.assertRaises(ValueError):
+            expr.as_expr(1)
+        with self.assertRaises(AttributeError):
+            self.compile(expr.as_expr((('unknown', 'eq', 1), )))
+
+    def test_abstract(self):
+
+        class Incomplete(expr.Expr):
+            shape = ()
+
+            def sql(self, klass):
+                return 'TRUE'
+
+        with self.assertRaises(TypeError):
+            expr.Expr()
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+    def test_cache(self):
+        cache = expr.SqlCache(size=2)
+        self.assertEqual(cache.get('a', lambda: 'A'), 'A')
+        self.assertEqual(cache.get('a', lambda: 'B'), 'A')
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        cache.get('b', lambda: 'B')
+        cache.get('c', lambda: 'C')
+        self.assertEqual(len(cache), 1)
+        cache.clear()
+        self.assertEqual((len(cache), cache.hits, cache.misses), (0, 0, 0))
+
+    def test_select_cache(self):
+        qb = TestEntity.qbuilder
+        misses = expr.cache.misses
+
+        q1, params1 = qb.select(Key('attr4') == 1, {'attr1': 'a'},
+                                order_by='-attr4', limit=10)
+        self.assertEqual(
+            q1, 'SELECT "entity_id","doc" FROM "test_pg__live" '
+                'WHERE (("doc"->>\'attr4\')::BIGINT = %s) OR '
+                '("doc" @> %s) ORDER BY ("doc"->>\'attr4\')::BIGINT DESC '
+                'LIMIT %s;')
+        self.assertEqual(params1, [1, {'attr1': 'a'}, 10])
+        self.assertEqual(expr.cache.misses, misses + 2)
+
+        hits = expr.cache.hits
+        q2, params2 = qb.select(Key('attr4') == 2, {'attr1': 'b'},
+                                order_by='-attr4', limit=20)
+        self.assertIs(q1, q2)
+        self.assertEqual(params2, [2, {'attr1': 'b'}, 20])
+        self.assertEqual(expr.cache.misses, misses + 2)
+        self.assertEqual(expr.cache.hits, hits + 2)
+
+        q3, __ = qb.select(Key('attr4') == 2, {'attr1': 'b'}, limit=20)
+        self.assertNotEqual(q1, q3)
+
+
+class TestExprQueries(BaseWithPool):
+
+    def count(self, *conds):
+        # mock data only
+        conds = [(Key('attr2') == 'mistery') & x for x in conds] or \
+            [Key('attr2') == 'mistery']
+        q, params = TestEntity.qbuilder.select(*conds)
+        with self.pool.transaction() as cursor:
+            return len(cursor.execute(q, params).all())
+
+    def test_queries(self):
+        total = self.count()
+        self.assertTrue(total > 0)
+
+        low = self.count(Key('attr4') <= 50)
+        high = self.count(~(Key('attr4') <= 50))
+        self.assertEqual(low + high, total)
+        self.assertEqual(self.count(Key('attr4').between(1, 50)), low)
+        self.assertEqual(
+            self.count(Key('attr4').in_(xrange(1, 51))), low)
+        self.assertEqual(
+            self.count((Key('attr4') <= 50) | (Key('attr4') > 50)), total)
+        self.assertEqual(self.count(Key('attr4') <= 50,
+                                    Key('attr4') > 50), total)
+
+        self.assertEqual(self.count(Key('attr6').exists()) +
+                         self.count(Key('attr6').is_null()), total)
+        self.assertEqual(self.count(Key('attr2').like('mist%')), total)
+        self.assertEqual(self.count(Key('attr2').ilike('MIST%')), total)
+        self.assertEqual(self.count(Key('attr2').contains('mistery')),
+                         total)
+        self.assertEqual(self.count(Key('attr2', 'nested').not_null()), 0)
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+from jukoro import pg
+
+from .base import BaseWithPool, TestEntity
+
+
+__all__ = ['TestEntityLoader']
+
+
+class TestEntityLoader(BaseWithPool):
+
+    def _ids(self, cnt):
+        first_id = self.first_id()
+        return range(first_id, first_id + cnt)
+
+    def test_batch(self):
+        ids = self._ids(7)
+        with self.pool.transaction() as cursor:
+            loader = pg.EntityLoader(cursor, chunk_size=5)
+            loader.defer(TestEntity, *ids[:3])
+            loader.defer(TestEntity, ids[0], ids[3], None)
+            self.assertEqual(len(list(cursor.queries)), 0)
+
+            entity = loader.get(TestEntity, ids[1])
+            self.assertEqual(entity.entity_id, ids[1])
+            self.assertEqual(len(list(cursor.queries)), 1)
+            self.assertEqual(len(loader), 4)
+
+            # loaded entities are taken from identity map
+            self.assertIs(loader.get(TestEntity, ids[1]), entity)
+            entities = loader.get_many(TestEntity, ids)
+            self.assertEqual([x.entity_id for x in entities], ids)
+            self.assertIs(entities[1], entity)
+            self.assertEqual(len(list(cursor.queries)), 2)
+
+            self.assertEqual(loader.get_many(TestEntity, [-1, None]),
+                             [None, None])
+            with self.assertRaises(pg.DoesNotExist):
+                loader.get(TestEntity, -1)
+            self.assertEqual(len(list(cursor.queries)), 3)
+
+        stats = loader.stats
+        self.assertEqual(stats.queries, 3)
+        self.assertEqual(stats.loaded, 7)
+        self.assertEqual(stats.misses, 3)
+
+    def test_resolve(self):
+        ids = self._ids(3)
+        refs = [TestEntity(doc={'attr6': x}) for x in ids + [ids[0], None]]
+        with self.pool.transaction() as cursor:
+            loader = pg.EntityLoader(cursor)
+            resolved = loader.resolve(refs, 'attr6', TestEntity)
+            self.assertEqual(len(list(cursor.queries)), 1)
+        self.assertEqual([x.entity_id for x in resolved[:4]],
+                         ids + [ids[0]])
+        self.assertIs(resolved[0], resolved[3])
+        self.assertIsNone(resolved[4])
+
+    def test_prime_forget(self):
+        entity_id = self._ids(1)[0]
+        with self.pool.transaction() as cursor:
+            loader = pg.EntityLoader(cursor)
+            entity = loader.get(TestEntity, entity_id)
+
+            primed = TestEntity(entity_id, dict(entity.doc, attr5=1))
+            loader.prime(primed)
+            self.assertIs(loader.get(TestEntity, entity_id), primed)
+
+            loader.forget(TestEntity, entity_id)
+            self.assertEqual(loader.get(TestEntity, entity_id), entity)
+            self.assertEqual(len(list(cursor.queries)), 2)
+
+            loader.forget(TestEntity)
+            self.assertEqual(len(loader), 0)
+            loader.get(TestEntity, entity_id)
+            loader.clear()
+            self.assertEqual(len(loader), 0)
+            self.assertEqual(len(list(cursor.queries)), 3)
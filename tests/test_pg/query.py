@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-from collections import defaultdict
+from collections import defaultdict, namedtuple
 import logging
 import random
 
@@ -10,7 +10,8 @@ from jukoro import arrow
 from jukoro import pg
 
 
-__all__ = ['TestQueryBuilderDescr', 'TestQueryViewBuilder']
+__all__ = ['TestQueryBuilderDescr', 'TestQueryViewBuilder',
+           'TestQueryViewBuilderPrepared']
 
 
 logger = logging.getLogger(__name__)
@@ -29,6 +30,40 @@ class TestQueryBuilderDescr(Base):
         with self.assertRaises(AttributeError):
             a.qbuilder
 
+    def test_as_of(self):
+        descr = pg.QueryBuilderDescr(TestEntity.db_table.name,
+                                     pg.QueryAsOfBuilder)
+        qb = descr.__get__(None, TestEntity)
+        self.assertIsInstance(qb, pg.QueryAsOfBuilder)
+        self.assertEqual(
+            qb.by_id(5),
+            ('SELECT "entity_id","doc" FROM (SELECT * FROM "test_pg" '
+             'WHERE "entity_start" <= now() AND "entity_end" > now()) '
+             'AS "test_pg" WHERE "entity_id" = %s '
+             'ORDER BY "entity_id" ASC;', (5, )))
+
+        ts = arrow.utcnow()
+        q, params = qb.as_of(ts).by_id(5)
+        self.assertIn('"entity_start" <= %s', q)
+        self.assertEqual(params, (ts, ts, 5))
+        self.assertEqual(
+            pg.QueryAsOfBuilder.for_entity(TestEntity, ts).by_id(5),
+            (q, params))
+
+        # cached sql depends on point in time placeholder
+        cond = {'attr1': 'a'}
+        for builders in ((qb, qb.as_of(ts)), (qb.as_of(ts), qb)):
+            for b in builders:
+                for method in (b.select, b.export):
+                    q, params = method(cond, order_by='attr4', limit=5)
+                    self.assertEqual(q.count('%s'), len(params))
+                    if b is qb:
+                        self.assertIn('now()', q)
+                        self.assertEqual(params, [cond, 5])
+                    else:
+                        self.assertNotIn('now()', q)
+                        self.assertEqual(params, [ts, ts, cond, 5])
+
 
 class TestQueryViewBuilder(BaseWithPool):
 
@@ -46,8 +81,9 @@ class TestQueryViewBuilder(BaseWithPool):
         ids = tuple(range(5, 10))
         q, params = qb.by_id(*ids)
         self.assertTrue(len(params) == 1)
-        self.assertEqual(params, (ids, ))
-        self.assertTrue('WHERE "entity_id" IN %s' in q)
+        self.assertEqual(params, (list(ids), ))
+        self.assertTrue('WHERE "entity_id" = ANY(%s)' in q)
+        self.assertEqual(qb.by_id(*ids[:2])[0], q)
 
         with self.assertRaises(ValueError):
             TestEntity.qbuilder.by_id(None)
@@ -109,6 +145,264 @@ class TestQueryViewBuilder(BaseWithPool):
             self.assertEqual(c.attr5, cc.attr5)
             self.assertDocEqual(c.doc, cc.doc)
 
+    def test_create_chunks(self):
+        entities = (TestEntity(doc={'attr1': x}) for x in xrange(5))
+        queries = list(TestEntity.qbuilder.create_chunks(entities, 2))
+
+        self.assertEqual([len(params) for q, params in queries], [2, 2, 1])
+        q, params = queries[-1]
+        self.assertEqual(params, [{'attr1': 4}])
+        self.assertTrue(q.startswith(
+            'INSERT INTO "test_pg__live" ("doc") VALUES (%s) RETURNING'))
+
+    def test_update_chunks(self):
+        entities = (TestEntity(entity_id=x, doc={'attr1': x})
+                    for x in xrange(1, 6))
+        queries = list(TestEntity.qbuilder.update_chunks(entities, 2))
+
+        self.assertEqual([len(params) for q, params in queries], [4, 4, 2])
+        q, params = queries[-1]
+        self.assertEqual(params, [5, {'attr1': 5}])
+        self.assertTrue(q.startswith('UPDATE "test_pg__live" AS t'))
+
+    def test_bulk_update_chunks(self):
+        entities = [TestEntity(entity_id=x, doc={'attr1': x})
+                    for x in xrange(1, 6)]
+        entities.append(TestEntity(entity_id=1, doc={'attr1': 6}))
+        queries = list(
+            TestEntity.qbuilder.bulk_update_chunks(iter(entities), 3))
+
+        self.assertEqual([len(params) for q, params in queries], [6, 6])
+        q, params = queries[-1]
+        self.assertEqual(params, [4, {'attr1': 4}, 5, {'attr1': 5},
+                                  1, {'attr1': 6}])
+        self.assertTrue(q.startswith('WITH v ("entity_id", "doc")'))
+        self.assertTrue('UPDATE "test_pg" AS t' in q)
+        self.assertTrue('INSERT INTO "test_pg"' in q)
+
+        q, params = TestEntity.qbuilder.bulk_update(*entities[:1] * 2)
+        self.assertEqual(params, [1, {'attr1': 1}])
+
+        with self.assertRaises(ValueError):
+            TestEntity.qbuilder.bulk_update(TestEntity())
+
+    def test_projection(self):
+        qb = TestEntity.qbuilder
+        self.assertEqual(qb.projection(), qb.fields)
+        fields = '"entity_id",jsonb_build_object(\'attr1\', ' \
+            '"doc"->\'attr1\', \'attr4\', "doc"->\'attr4\') AS "doc",' \
+            'true AS "partial"'
+        self.assertEqual(qb.projection(['attr1', 'attr4']), fields)
+        for only in (['a%s'], ['it\'s'], 'a,b', [1]):
+            with self.assertRaises(ValueError):
+                qb.projection(only)
+        with self.assertRaises(ValueError):
+            qb.select(only=['a%s'])
+        with self.assertRaises(ValueError):
+            qb.page(limit=1, only=['a%s'])
+
+        q, params = qb.by_id(1, 2, only=['attr1', 'attr4'])
+        self.assertTrue(q.startswith('SELECT %s FROM' % fields))
+        q, params = qb.select({'attr1': 'a'}, only=['attr1', 'attr4'])
+        self.assertTrue(q.startswith('SELECT %s FROM' % fields))
+        q, params = qb.page(limit=1, order_by='attr4', only='attr1')
+        self.assertTrue(q.startswith('SELECT %s FROM' % fields))
+
+        with self.pool.transaction() as cursor:
+            rows = cursor.execute(q, params).all()
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(set(rows[0]['doc']), {'attr1', 'attr4'})
+        self.assertTrue(rows[0]['partial'])
+
+        partial = TestEntity(**rows[0])
+        with self.assertRaises(ValueError):
+            qb.update(partial)
+        with self.assertRaises(ValueError):
+            qb.bulk_update(partial)
+
+    def test_count_exists_estimate(self):
+        qb = TestEntity.qbuilder
+        self.assertEqual(
+            qb.count(), ('SELECT COUNT(*) AS "count" FROM "test_pg__live";',
+                         []))
+        self.assertEqual(
+            qb.exists({'attr1': 'a'}),
+            ('SELECT EXISTS (SELECT 1 FROM "test_pg__live" '
+             'WHERE ("doc" @> %s)) AS "exists";', [{'attr1': 'a'}]))
+        self.assertEqual(
+            qb.estimate(), ('EXPLAIN (FORMAT JSON) SELECT 1 '
+                            'FROM "test_pg__live";', []))
+
+    def test_aggregate(self):
+        qb = TestEntity.qbuilder
+        q, params = qb.aggregate(
+            {'total': ('sum', 'attr5'), 'cnt': ('count', None)},
+            {'attr2': 'mistery'}, group_by='attr4')
+        self.assertEqual(
+            q, 'SELECT ("doc"->>\'attr4\')::BIGINT AS "attr4", '
+               'COUNT(*) AS "cnt", SUM(("doc"->>\'attr5\')::BIGINT) AS '
+               '"total" FROM "test_pg__live" WHERE ("doc" @> %s) '
+               'GROUP BY 1 ORDER BY 1;')
+        self.assertEqual(params, [{'attr2': 'mistery'}])
+
+        q, params = qb.aggregate({'last': ('max', 'attr7')})
+        self.assertEqual(
+            q, 'SELECT MAX(("doc"->>\'attr7\')::BIGINT) AS "last" '
+               'FROM "test_pg__live";')
+
+        with self.assertRaises(ValueError):
+            qb.aggregate({})
+        with self.assertRaises(ValueError):
+            qb.aggregate({'x': ('median', 'attr4')})
+        with self.assertRaises(ValueError):
+            qb.aggregate({'x': ('sum', 'unknown')})
+        with self.assertRaises(ValueError):
+            qb.aggregate({'x': ('sum', 'qbuilder')})
+        with self.assertRaises(ValueError):
+            qb.aggregate({'x': ('count', None)}, group_by='unknown')
+        for name in ('x" FROM pg_user; --', '1x', ''):
+            with self.assertRaises(ValueError):
+                qb.aggregate({name: ('count', None)})
+
+    def test_page(self):
+        qb = TestEntity.qbuilder
+        q, params = qb.page(limit=10)
+        self.assertEqual(
+            q, 'SELECT "entity_id","doc" FROM "test_pg__live" '
+               'ORDER BY "entity_id" ASC LIMIT %s;')
+        self.assertEqual(params, [10])
+        for kwargs in ({}, {'limit': None}, {'limit': 0}, {'limit': '10'}):
+            with self.assertRaises(ValueError):
+                qb.page(**kwargs)
+
+        token = qb.page_token({'entity_id': 5, 'doc': {}})
+        q, params = qb.page({'attr1': 'a'}, limit=10, after=token)
+        self.assertEqual(
+            q, 'SELECT "entity_id","doc" FROM "test_pg__live" '
+               'WHERE (("doc" @> %s)) AND ("entity_id") > (%s) '
+               'ORDER BY "entity_id" ASC LIMIT %s;')
+        self.assertEqual(params, [{'attr1': 'a'}, 5, 10])
+
+        order_by = ['-attr4', '-attr1']
+        token = qb.page_token(
+            {'entity_id': 5, 'doc': {'attr4': 3, 'attr1': 'b'}}, order_by)
+        q, params = qb.page(limit=10, order_by=order_by, after=token)
+        self.assertTrue(
+            'WHERE (("doc"->>\'attr4\')::BIGINT, ("doc"->>\'attr1\')::TEXT, '
+            '"entity_id") < (%s, %s, %s) ORDER BY' in q)
+        self.assertTrue(q.endswith('"entity_id" DESC LIMIT %s;'))
+        self.assertEqual(params, [3, 'b', 5, 10])
+
+        order_by = ['attr4', '-entity_id']
+        token = qb.page_token(
+            {'entity_id': 5, 'doc': {'attr4': 3}}, order_by)
+        q, params = qb.page(limit=10, order_by=order_by, after=token)
+        self.assertTrue(
+            'WHERE ((("doc"->>\'attr4\')::BIGINT > %s) OR '
+            '(("doc"->>\'attr4\')::BIGINT = %s AND "entity_id" < %s)) '
+            'ORDER BY ("doc"->>\'attr4\')::BIGINT ASC, "entity_id" DESC '
+            'LIMIT %s;' in q)
+        self.assertEqual(params, [3, 3, 5, 10])
+
+        row = {'entity_id': 5, 'doc': {'attr4': 3}}
+        Row = namedtuple('Row', 'entity_id doc')
+        for r in (Row(**row), (5, {'attr4': 3}),
+                  (5, {'attr4': 3}, True), TestEntity(**row)):
+            self.assertEqual(qb.page_token(r, order_by), token)
+
+        with self.assertRaises(ValueError):
+            qb.page(limit=10, order_by='attr4', after=token)
+        with self.assertRaises(ValueError):
+            qb.page(limit=10, after='garbage')
+        with self.assertRaises(ValueError):
+            qb.page(limit=10, order_by='attr6')
+        with self.assertRaises(ValueError):
+            qb.page(limit=10, order_by='unknown')
+
+    def test_as_of(self):
+        def now():
+            with self.pool.transaction() as cursor:
+                return cursor.execute_and_get(
+                    'SELECT clock_timestamp() AS "ts";')['ts']
+
+        def by_id(ts, entity_id):
+            q, params = TestEntity.qbuilder.as_of(ts).by_id(entity_id)
+            with self.pool.transaction() as cursor:
+                return cursor.execute(q, params).all()
+
+        with self.pool.transaction() as cursor:
+            a = TestEntity(doc={'attr1': 'past-and-present',
+                                'attr2': 'musician', 'attr3': 'boundary',
+                                'attr4': 1, 'attr5': 1,
+                                'attr7': arrow.utcnow()}).save(cursor)
+        created = now()
+        with self.pool.transaction() as cursor:
+            a.update(attr5=2)
+            a = a.save(cursor)
+        updated = now()
+        with self.pool.transaction() as cursor:
+            a.delete(cursor)
+        deleted = now()
+
+        self.assertEqual(by_id(created, a.entity_id)[0]['doc']['attr5'], 1)
+        self.assertEqual(by_id(updated, a.entity_id)[0]['doc']['attr5'], 2)
+        self.assertEqual(by_id(deleted, a.entity_id), [])
+
+        qb = TestEntity.qbuilder.as_of(updated)
+        self.assertIsInstance(qb, pg.QueryAsOfBuilder)
+        cond = {'attr1': 'past-and-present'}
+        with self.pool.transaction() as cursor:
+            for q, params in (qb.count(cond),
+                              qb.as_of(created).count(cond)):
+                self.assertEqual(
+                    cursor.execute_and_get(q, params)['count'], 1)
+            q, params = qb.select(cond, order_by='attr4', limit=10)
+            self.assertEqual(len(cursor.execute(q, params).all()), 1)
+            q, params = qb.page(cond, limit=10)
+            self.assertEqual(len(cursor.execute(q, params).all()), 1)
+
+            versions = TestEntity.history(cursor, a.entity_id)
+        self.assertEqual([x.entity.attr5 for x in versions], [1, 2])
+        self.assertEqual(versions[0].end, versions[1].start)
+        self.assertIsNotNone(versions[-1].entity.deleted)
+        self.assertIsNone(versions[0].entity.deleted)
+
+        q, params = qb.count()
+        self.assertEqual(
+            q, 'SELECT COUNT(*) AS "count" FROM (SELECT * FROM "test_pg" '
+               'WHERE "entity_start" <= %s AND "entity_end" > %s) '
+               'AS "test_pg";')
+        self.assertEqual(params, [updated, updated])
+        self.assertEqual(
+            TestEntity.qbuilder.history(5),
+            ('SELECT "entity_id","doc","entity_start","entity_end" '
+             'FROM "test_pg" WHERE "entity_id" = %s '
+             'ORDER BY "entity_start" ASC;', (5, )))
+        for method in (qb.create, qb.update, qb.delete, qb.bulk_update):
+            with self.assertRaises(pg.ReadOnly):
+                method(a)
+
+    def test_export(self):
+        qb = TestEntity.qbuilder
+        q, params = qb.export({'attr1': 'a'}, order_by='-attr4', limit=5)
+        self.assertTrue(q.startswith(
+            'COPY (SELECT json_build_object(\'entity_id\', "entity_id", '
+            '\'doc\', "doc") FROM "test_pg__live" WHERE ("doc" @> %s) '
+            'ORDER BY'))
+        self.assertTrue(q.endswith(') TO STDOUT WITH (FORMAT csv, '
+                                   'QUOTE e\'\\x01\', '
+                                   'DELIMITER e\'\\x02\');'))
+        self.assertEqual(params, [{'attr1': 'a'}, 5])
+
+        q, params = qb.export(fmt='csv')
+        self.assertEqual(
+            q, 'COPY (SELECT "entity_id","doc" FROM "test_pg__live") '
+               'TO STDOUT WITH (FORMAT csv, HEADER true);')
+        self.assertEqual(params, [])
+
+        with self.assertRaises(ValueError):
+            qb.export(fmt='xml')
+
     def test_update(self):
         last_id = self.last_id()
 
@@ -176,8 +470,8 @@ class TestQueryViewBuilder(BaseWithPool):
         ids = (TestEntity(eid1), TestEntity(eid2))
         q, params = qb.delete(*ids)
         self.assertTrue(len(params) == 1)
-        self.assertEqual(params, ((eid1, eid2), ))
-        self.assertTrue('WHERE "entity_id" IN %s' in q)
+        self.assertEqual(params, ([eid1, eid2], ))
+        self.assertTrue('WHERE "entity_id" = ANY(%s)' in q)
 
         with self.pool.transaction() as cursor:
             cursor.execute(q, params)
@@ -398,3 +692,23 @@ class TestQueryViewBuilder(BaseWithPool):
             res = cursor.execute(q2, params2)
             res = res.all()
             self.assertEqual(len(res), limit)
+
+
+class TestQueryViewBuilderPrepared(TestQueryViewBuilder):
+    """ Same queries executed using prepared statements """
+
+    @classmethod
+    def setUpClass(cls):
+        uri = cls.uri()
+        cls.pool = pg.PgDbPool(uri, cls.pool_size, statement_cache_size=8)
+        cls.uri_kwargs = pg.pg_uri_to_kwargs(uri)
+
+    def test_statements(self):
+        q, params = TestEntity.qbuilder.by_id(self.entity_id)
+        with self.pool.transaction() as cursor:
+            for __ in xrange(2):
+                cursor.execute(q, params)
+            self.assertTrue(list(cursor.queries)[-1].startswith('EXECUTE'))
+        stats = self.pool.stats
+        self.assertTrue(stats.statement_hits > 0)
+        self.assertTrue(stats.statement_misses > 0)
@@ -2,14 +2,18 @@
 
 from __future__ import absolute_import
 
-from .base import TestEntity, Base
+import datetime
+
+from .base import TestEntity, Base, BaseWithPool
 
 from jukoro import pg
 from jukoro.pg import storage
+from jukoro.pg.expr import Key
 
 
 __all__ = ['TestDBTableName', 'TestDBViewName', 'TestSyncDBEmptySchema',
-           'TestSyncDB', 'TestSqlDescr', 'TestAbstractSql', 'TestRegistry']
+           'TestSyncDB', 'TestSqlDescr', 'TestAbstractSql', 'TestRegistry',
+           'TestIndex', 'TestIndexPlan', 'TestPartition']
 
 
 class TestDBTableName(Base):
@@ -86,6 +90,21 @@ class TestSyncDB(TestSyncDBEmptySchema):
         uri = self.uri
         conn = pg.PgConnection(uri)
 
+        with conn.transaction() as cursor:
+            cursor.execute(create_sql)
+
+        create_sql, drop_sql = self._syncdb_sql()
+        self.assertFalse(create_sql.strip())
+
+        # view created with outdated live predicate is replaced
+        with conn.transaction() as cursor:
+            cursor.execute('COMMENT ON VIEW "test_pg__live" IS NULL;')
+
+        create_sql, drop_sql = self._syncdb_sql()
+        self.assertEqual(create_sql.count('CREATE OR REPLACE VIEW'), 1)
+        self.assertEqual(create_sql.count('CREATE TABLE'), 0)
+        self.assertEqual(drop_sql.count('DROP VIEW'), 0)
+
         with conn.transaction() as cursor:
             cursor.execute(create_sql)
 
@@ -278,3 +297,306 @@ class TestRegistry(Base):
 
     def _entity_classes(self):
         return [x.eclass for x in storage.tables()]
+
+
+class IndexedEntity(pg.AbstractEntity):
+    db_table = 'test_pg_indexed'
+    skip_registry = True
+
+    attr1 = pg.Attr(title='Attr 1', db_index=True)
+    attr3 = pg.Attr(title='Attr 3', db_index=pg.DbIndex())
+    attr5 = pg.Attr(title='Attr 5',
+                    db_index=[pg.DbIndex(include=('entity_id', ))],
+                    value_type=int)
+
+
+class TestIndex(Base):
+    online_required = False
+
+    def index(self, attr, spec=None):
+        table = storage.Table(TestEntity)
+        return storage.Index(table, getattr(TestEntity, attr), spec)
+
+    def test_legacy(self):
+        idx = self.index('attr1')
+        self.assertEqual(idx.name,
+                         'ju_idx__test_pg__attr1_entity_start_entity_end')
+        self.assertEqual(
+            idx.sql.strip(),
+            'CREATE INDEX ju_idx__test_pg__attr1_entity_start_entity_end ON\n'
+            '    "test_pg" USING btree((("doc"->>\'attr1\')::TEXT), '
+            '"entity_start", "entity_end" DESC);')
+
+    def test_declared(self):
+        live = 'WHERE {};'.format(storage.LIVE)
+        cases = (
+            (pg.DbIndex(),
+             'CREATE INDEX ju_idx__test_pg__attr4__live ON\n'
+             '    "test_pg" USING btree((("doc"->>\'attr4\')::BIGINT)) ' +
+             live),
+            (pg.DbIndex(unique=True, include=['entity_id']),
+             'CREATE UNIQUE INDEX '
+             'ju_idx__test_pg__attr4__uniq_live_incl_entity_id ON\n'
+             '    "test_pg" USING btree((("doc"->>\'attr4\')::BIGINT)) '
+             'INCLUDE ("entity_id") ' + live),
+            (pg.DbIndex(gin=True),
+             'CREATE INDEX ju_idx__test_pg__attr4__gin_live ON\n'
+             '    "test_pg" USING gin((("doc"->\'attr4\')) '
+             'jsonb_path_ops) ' + live),
+            (pg.DbIndex(gin=True, opclass='jsonb_ops'),
+             'CREATE INDEX ju_idx__test_pg__attr4__gin_ops_live ON\n'
+             '    "test_pg" USING gin((("doc"->\'attr4\')) '
+             'jsonb_ops) ' + live),
+            (pg.DbIndex(gin=True, live=False, path=['a', 'b']),
+             'CREATE INDEX ju_idx__test_pg__attr4__a_b_gin ON\n'
+             '    "test_pg" USING gin((("doc"#>\'{attr4,a,b}\')) '
+             'jsonb_path_ops);'),
+        )
+        for spec, sql in cases:
+            self.assertEqual(self.index('attr4', spec).sql.strip(), sql)
+
+    def test_syncdb(self):
+        names = [x.name for x in storage.Table(IndexedEntity).indices]
+        self.assertIn(
+            'ju_idx__test_pg_indexed__attr1_entity_start_entity_end', names)
+        self.assertIn('ju_idx__test_pg_indexed__attr3__live', names)
+        self.assertIn('ju_idx__test_pg_indexed__attr5__live_incl_entity_id',
+                      names)
+
+
+class TestIndexPlan(BaseWithPool):
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestIndexPlan, cls).setUpClass()
+        if not cls.is_online():
+            return
+        # "include" requires PostgreSQL >= 11
+        with cls.pool.transaction() as cursor:
+            table = storage.Table(IndexedEntity)
+            cursor.execute(''.join(
+                x.sql for __, items in table.items for x in items))
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.is_online():
+            with cls.pool.transaction() as cursor:
+                cursor.execute('DROP TABLE "test_pg_indexed" CASCADE;')
+        super(TestIndexPlan, cls).tearDownClass()
+
+    def plan(self, q, params):
+        with self.pool.transaction() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off;')
+            rows = cursor.execute('EXPLAIN ' + q, params).all()
+        return '\n'.join(x['QUERY PLAN'] for x in rows)
+
+    def test_live_index(self):
+        q, params = IndexedEntity.qbuilder.select(Key('attr3') == 'mistery')
+        self.assertIn('ju_idx__test_pg_indexed__attr3__live',
+                      self.plan(q, params))
+
+        q, params = IndexedEntity.qbuilder.by_id(1, 2)
+        self.assertNotIn('ju_idx__test_pg_indexed__attr3__live',
+                         self.plan(q, params))
+
+
+class TestPartition(BaseWithPool):
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestPartition, cls).setUpClass()
+
+        class ByStart(pg.AbstractEntity):
+            db_table = 'test_pg_by_start'
+            db_partition = 'entity_start'
+            skip_registry = True
+
+            title = pg.Attr(title='Title', db_index=pg.DbIndex())
+
+        class ByEnd(ByStart):
+            db_table = 'test_pg_by_end'
+            db_partition = 'entity_end'
+            skip_registry = True
+
+        cls.klasses = (ByStart, ByEnd)
+        if not cls.is_online():
+            return
+        with cls.pool.transaction() as cursor:
+            for klass in cls.klasses:
+                table = storage.Table(klass)
+                cursor.execute(''.join(
+                    x.sql for __, items in table.items for x in items))
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.is_online():
+            with cls.pool.transaction() as cursor:
+                cursor.execute(
+                    'DROP TABLE "test_pg_by_start", "test_pg_by_end" '
+                    'CASCADE;')
+        cls.klasses = None
+        super(TestPartition, cls).tearDownClass()
+
+    def partitions(self, cursor, klass):
+        q = 'SELECT c.relname AS "name" FROM pg_inherits AS i ' \
+            'JOIN pg_class AS c ON c.oid = i.inhrelid ' \
+            'WHERE i.inhparent = %s::regclass ORDER BY 1;'
+        rows = cursor.execute(q, (klass.db_table.name, )).all()
+        return [x['name'] for x in rows]
+
+    def plan(self, cursor, q, params):
+        rows = cursor.execute('EXPLAIN ' + q, params).all()
+        return '\n'.join(x['QUERY PLAN'] for x in rows)
+
+    def test_meta(self):
+        with self.assertRaises(AttributeError):
+
+            class Unknown(pg.AbstractEntity):
+                db_table = 'test_pg_unknown'
+                db_partition = 'id'
+                skip_registry = True
+
+        with self.assertRaises(AttributeError):
+
+            class Both(pg.AbstractEntity):
+                db_table = 'test_pg_both'
+                db_partition = 'entity_end'
+                db_history = True
+                skip_registry = True
+
+        class Partitioned(pg.AbstractEntity):
+            db_partition = 'id'
+
+        with self.assertRaises(AttributeError):
+
+            class InheritedUnknown(Partitioned):
+                db_table = 'test_pg_inherited_unknown'
+                skip_registry = True
+
+        class WithHistory(pg.AbstractEntity):
+            db_history = True
+
+        with self.assertRaises(AttributeError):
+
+            class InheritedBoth(WithHistory):
+                db_table = 'test_pg_inherited_both'
+                db_partition = 'entity_start'
+                skip_registry = True
+
+        with self.assertRaises(AttributeError):
+
+            class Unique(pg.AbstractEntity):
+                db_table = 'test_pg_unique'
+                db_partition = 'entity_start'
+                skip_registry = True
+                attr1 = pg.Attr(db_index=pg.DbIndex(unique=True))
+
+        class UniqueBase(pg.AbstractEntity):
+            attr1 = pg.Attr(db_index=pg.DbIndex(unique=True))
+
+        with self.assertRaises(AttributeError):
+
+            class InheritedUnique(UniqueBase):
+                db_table = 'test_pg_inherited_unique'
+                db_partition = 'entity_start'
+                skip_registry = True
+
+        with self.assertRaises(ValueError):
+            storage.detach_partition(None, TestEntity, datetime.date.today())
+
+    def test_partitions(self):
+        by_start, by_end = self.klasses
+        month = datetime.date.today()
+        name = '__p_{}'.format(month.strftime('%Y%m'))
+        with self.pool.transaction() as cursor:
+            start = self.partitions(cursor, by_start)
+            end = self.partitions(cursor, by_end)
+            self.assertEqual(len(start), storage.PARTITION_AHEAD + 2)
+            self.assertEqual(len(end), storage.PARTITION_AHEAD + 3)
+            self.assertIn('test_pg_by_start' + name, start)
+            self.assertIn('test_pg_by_start__p_default', start)
+            self.assertIn('test_pg_by_end__p_live', end)
+
+            self.assertEqual(
+                storage.create_partitions(cursor, *self.klasses), 0)
+            self.assertEqual(
+                storage.create_partitions(cursor, by_end, ahead=4), 1)
+
+            idx = month.year * 12 + month.month - 1 + 4
+            last = datetime.date(idx // 12, idx % 12 + 1, 1)
+            name = storage.detach_partition(cursor, by_end, last)
+            self.assertEqual(name, 'test_pg_by_end__p_' +
+                             last.strftime('%Y%m'))
+            self.assertEqual(self.partitions(cursor, by_end), end)
+            cursor.execute('DROP TABLE "{}";'.format(name))
+
+    def test_partitions_default(self):
+        by_start = self.klasses[0]
+        month = datetime.date.today()
+        months = []
+        for ahead in (4, 5):
+            idx = month.year * 12 + month.month - 1 + ahead
+            months.append(datetime.date(idx // 12, idx % 12 + 1, 1))
+        with self.pool.transaction() as cursor:
+            # row without partition for its month lands in default partition
+            q = 'INSERT INTO "test_pg_by_start" ("entity_start", "doc") ' \
+                'VALUES (%s, %s) RETURNING "entity_id";'
+            entity_id = cursor.execute(
+                q, (months[1], '{"title": "stray"}')).scalar()
+
+            self.assertEqual(
+                storage.create_partitions(cursor, by_start, ahead=5), 2)
+            self.assertIn('test_pg_by_start__p_default',
+                          self.partitions(cursor, by_start))
+
+            q = 'SELECT tableoid::regclass::text AS "name" ' \
+                'FROM "test_pg_by_start" WHERE "entity_id" = %s;'
+            self.assertEqual(cursor.execute(q, (entity_id, )).scalar(),
+                             'test_pg_by_start__p_' +
+                             months[1].strftime('%Y%m'))
+            q = 'SELECT count(*) FROM "test_pg_by_start__p_default";'
+            self.assertEqual(cursor.execute(q).scalar(), 0)
+
+            for x in months:
+                name = storage.detach_partition(cursor, by_start, x)
+                cursor.execute('DROP TABLE "{}";'.format(name))
+
+    def test_crud(self):
+        by_start, by_end = self.klasses
+        with self.pool.transaction() as cursor:
+            for klass in self.klasses:
+                entity = klass(doc={'title': 'partition'}).save(cursor)
+                entity.update(title='partitioned')
+                entity = entity.save(cursor)
+                self.assertEqual(
+                    klass.by_id(cursor, entity.entity_id).title,
+                    'partitioned')
+                entity.delete(cursor)
+                self.assertFalse(
+                    klass.exists(cursor, Key('entity_id') == entity.entity_id))
+
+            q = 'SELECT tableoid::regclass::text AS "name" ' \
+                'FROM "test_pg_by_end" WHERE "entity_id" = %s ' \
+                'ORDER BY "entity_start";'
+            rows = cursor.execute(q, (entity.entity_id, )).all()
+            month = datetime.date.today().strftime('%Y%m')
+            self.assertEqual([x['name'] for x in rows],
+                             ['test_pg_by_end__p_' + month] * 2)
+
+            # live queries touch live partition only
+            q, params = by_end.qbuilder.select(Key('title') == 'partitioned')
+            plan = self.plan(cursor, q, params)
+            self.assertIn('test_pg_by_end__p_live', plan)
+            self.assertNotIn('test_pg_by_end__p_' + month, plan)
+            self.assertNotIn('test_pg_by_end__p_default', plan)
+
+    def test_syncdb(self):
+        try:
+            for klass in self.klasses:
+                storage.register(klass)
+            create_sql, drop_sql = storage.syncdb(self.uri())
+        finally:
+            for klass in self.klasses:
+                storage.unregister(klass)
+        self.assertNotIn('test_pg_by', create_sql)
+        self.assertNotIn('DROP TABLE', drop_sql)
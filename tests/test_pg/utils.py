@@ -3,9 +3,10 @@
 from .base import Base
 
 from jukoro import pg
+from jukoro.pg.utils import IterStream, iter_stream
 
 
-__all__ = ['TestPgUriToKwargs']
+__all__ = ['TestPgUriToKwargs', 'TestIterStream', 'TestIterQueueStream']
 
 
 class TestPgUriToKwargs(Base):
@@ -28,6 +29,80 @@ class TestPgUriToKwargs(Base):
         self.assertEqual(kwargs['dbname'], 'jukoro_test')
         self.assertNotEqual(kwargs['schema'], 'public')
 
+    def test_uri_to_kwargs_session(self):
+        kwargs = pg.pg_uri_to_kwargs(self.tst_uri())
+        self.assertEqual(kwargs['client_encoding'], 'UTF8')
+        self.assertEqual(
+            kwargs['options'],
+            '-c search_path=public -c timezone=UTC '
+            '-c default_transaction_isolation=read\\ committed')
+
+        uri = self.tst_uri() + '?application_name=ju&statement_timeout=500' \
+            '&TimeZone=Europe/Moscow&work_mem=64MB'
+        kwargs = pg.pg_uri_to_kwargs(uri)
+        self.assertEqual(kwargs['application_name'], 'ju')
+        self.assertEqual(kwargs['schema'], 'public')
+        self.assertEqual(kwargs['dbname'], 'jukoro_test')
+        self.assertEqual(
+            kwargs['options'],
+            '-c search_path=public -c timezone=Europe/Moscow '
+            '-c default_transaction_isolation=read\\ committed '
+            '-c statement_timeout=500 -c work_mem=64MB')
+
     def test_uri_to_kwargs_bad(self):
         with self.assertRaises(pg.BadUri):
             pg.pg_uri_to_kwargs(self.bad_uri())
+
+
+class TestIterStream(Base):
+    online_required = False
+
+    def test_read(self):
+        stream = IterStream(['abc\n', u'd\u00e9\n', '', 'fg'])
+        self.assertEqual(stream.read(2), 'ab')
+        self.assertEqual(stream.read(4), 'c\nd\xc3')
+        self.assertEqual(stream.read(), '\xa9\nfg')
+        self.assertEqual(stream.read(10), '')
+
+    def test_readline(self):
+        stream = IterStream(['ab', 'c\nd', 'e\n', 'f'])
+        self.assertEqual(stream.readline(), 'abc\n')
+        self.assertEqual(stream.readline(1), 'd')
+        self.assertEqual(stream.readline(), 'e\n')
+        self.assertEqual(stream.readline(), 'f')
+        self.assertEqual(stream.readline(), '')
+
+
+class TestIterQueueStream(Base):
+    online_required = False
+
+    def test_iter(self):
+        def fn(stream):
+            for x in xrange(100):
+                stream.write(str(x))
+
+        self.assertEqual(list(iter_stream(fn, maxsize=2)),
+                         [str(x) for x in xrange(100)])
+
+    def test_error(self):
+        def fn(stream):
+            stream.write('a')
+            raise ValueError('boom')
+
+        it = iter_stream(fn)
+        self.assertEqual(next(it), 'a')
+        with self.assertRaises(ValueError):
+            next(it)
+
+    def test_close(self):
+        written = []
+
+        def fn(stream):
+            for x in xrange(100):
+                stream.write(x)
+                written.append(x)
+
+        it = iter_stream(fn, maxsize=1)
+        self.assertEqual(next(it), 0)
+        it.close()
+        self.assertLess(len(written), 100)
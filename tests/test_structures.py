@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import threading
 from unittest import TestCase
 
 from jukoro.structures import ObjectDict, DefaultObjectDict, LockRing
@@ -67,3 +68,125 @@ class TestStructures(TestCase):
 
         self.assertRaises(IndexError, lambda: r.pop())
         self.assertRaises(IndexError, lambda: r.next())
+
+    def test_lock_ring_lock_unlock(self):
+        a, b, c = object(), object(), object()
+        r = LockRing()
+        for o in (a, b, c):
+            r.push(o)
+        self.assertEqual(r.available, 3)
+
+        r.lock(b)
+        self.assertTrue(r.is_locked(b))
+        self.assertEqual(r.available, 2)
+        self.assertIs(r.next(), c)
+        self.assertIs(r.next(), a)
+        self.assertRaises(IndexError, lambda: r.next())
+
+        r.unlock(a)
+        self.assertFalse(r.is_locked(a))
+        self.assertRaises(KeyError, lambda: r.unlock(a))
+        self.assertIsNone(r.push(a))
+        self.assertEqual(len(r), 3)
+
+        self.assertIs(r.pop(), a)
+        self.assertEqual(len(r), 2)
+        self.assertEqual(r.available, 0)
+
+        r.reset()
+        self.assertEqual(len(r), 0)
+        self.assertEqual(r.available, 0)
+
+    def test_lock_ring_threads(self):
+        objs = [object() for __ in xrange(5)]
+        r = LockRing()
+        for o in objs:
+            r.push(o)
+
+        in_use, errors = set(), []
+
+        def worker():
+            for __ in xrange(1000):
+                try:
+                    o = r.next()
+                except IndexError:
+                    continue
+                if o in in_use:
+                    errors.append(o)
+                in_use.add(o)
+                in_use.discard(o)
+                r.push(o)
+
+        threads = [threading.Thread(target=worker) for __ in xrange(8)]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(r), len(objs))
+        self.assertEqual(r.available, len(objs))
+
+    def test_lock_ring_partitions(self):
+        modes = {}
+        a, b, c, d = objs = [object() for __ in xrange(4)]
+        for o in objs:
+            modes[o] = True
+        r = LockRing(key=lambda x: modes[x])
+        for o in objs:
+            r.push(o)
+
+        self.assertIs(r.next(False), d)
+        modes[d] = False
+        r.push(d)
+
+        self.assertIs(r.next(False), d)
+        self.assertIs(r.next(True), c)
+        self.assertIs(r.next(False), b)
+        r.push(d)
+        self.assertIs(r.peek(), a)
+        self.assertEqual(r.available, 2)
+
+        self.assertIs(r.pop(), a)
+        self.assertIs(r.pop(), d)
+        self.assertEqual(r.available, 0)
+
+    def test_lock_ring_partitions_threads(self):
+        # new partitions are added while other threads count free items
+        objs = [(idx, object()) for idx in xrange(2000)]
+        r = LockRing(key=lambda x: x[0])
+        errors = []
+
+        def reader():
+            try:
+                while len(r) < len(objs):
+                    r.available
+                    r.is_locked(objs[0])
+            except RuntimeError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=reader) for __ in xrange(4)]
+        for th in threads:
+            th.start()
+        for o in objs:
+            r.push(o)
+        for th in threads:
+            th.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(r.available, len(objs))
+
+    def test_lock_ring_lifo(self):
+        a, b, c = objs = [object() for __ in xrange(3)]
+        r = LockRing()
+        for o in objs:
+            r.push(o)
+
+        # most recently unlocked item is reused, the rest stay idle
+        for __ in xrange(5):
+            o = r.next()
+            self.assertIs(o, c)
+            r.push(o)
+        self.assertIs(r.peek(), a)
+        self.assertIs(r.pop(), a)
+        self.assertIs(r.pop(), b)
@@ -3,7 +3,7 @@
 from unittest import TestCase
 
 from jukoro.structures import ObjectDict
-from jukoro.utils import mergedicts
+from jukoro.utils import chunks, mergedicts
 
 
 class TestMergeDicts(TestCase):
@@ -85,3 +85,15 @@ class TestMergeDicts(TestCase):
         self.assertEqual(c.b, {'c': 3, 'd': 4})
         self.assertIsNot(c.b, a['b'])
         self.assertIsNot(c.b, b['b'])
+
+
+class TestChunks(TestCase):
+
+    def test_chunks(self):
+        self.assertEqual(list(chunks(xrange(7), 3)),
+                         [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual(list(chunks([], 3)), [])
+        self.assertEqual(list(chunks(iter('ab'), 2)), [['a', 'b']])
+
+        with self.assertRaises(ValueError):
+            list(chunks([1], 0))